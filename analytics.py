@@ -0,0 +1,148 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Дневная норма отжиманий и пресса (та же, что добавляется к долгу каждое утро)
+DAILY_NORM = 80
+
+# Начало отсчета datetime64[D]
+EPOCH = date(1970, 1, 1)
+
+
+class UserSeries:
+    """Дневной ряд тренировок пользователя: сделано отжиманий и пресса по дням, от первого дня до сегодня"""
+
+    def __init__(self, start: date, pushups: np.ndarray, abs_done: np.ndarray):
+        self.start = start
+        self.pushups = pushups
+        self.abs = abs_done
+
+    def __len__(self):
+        return len(self.pushups)
+
+    def day(self, index: int) -> date:
+        return self.start + timedelta(days=int(index))
+
+
+def build_series(rows: List[Dict], today: Optional[date] = None) -> Dict[int, UserSeries]:
+    """Ряды по пользователям из Database.get_daily_balances.
+
+    В таблицах хранится остаток нормы за день (утром +80, выполненное - со знаком минус),
+    поэтому сделано за день = добавленная норма - остаток (не меньше нуля). День без утренней
+    нормы (например, только регистрация) не считается выполненным; дни без записей - нули.
+    """
+    today_index = ((today or date.today()) - EPOCH).days
+    by_user: Dict[int, List[Dict]] = {}
+    for row in rows:
+        by_user.setdefault(row['user_id'], []).append(row)
+
+    series = {}
+    for user_id, user_rows in by_user.items():
+        days = np.array([row['date'] for row in user_rows], dtype='datetime64[D]').astype(np.int64)
+        balance_pushups = np.fromiter((row['pushups'] for row in user_rows), dtype=np.int64, count=len(user_rows))
+        balance_abs = np.fromiter((row['abs'] for row in user_rows), dtype=np.int64, count=len(user_rows))
+        norm_pushups = np.fromiter((row['norm_pushups'] for row in user_rows), dtype=np.int64, count=len(user_rows))
+        norm_abs = np.fromiter((row['norm_abs'] for row in user_rows), dtype=np.int64, count=len(user_rows))
+
+        first = int(days.min())
+        length = max(today_index, int(days.max())) - first + 1
+        index = days - first
+
+        pushups = np.zeros(length, dtype=np.int64)
+        abs_done = np.zeros(length, dtype=np.int64)
+        pushups[index] = np.clip(norm_pushups - balance_pushups, 0, None)
+        abs_done[index] = np.clip(norm_abs - balance_abs, 0, None)
+        series[user_id] = UserSeries(EPOCH + timedelta(days=first), pushups, abs_done)
+    return series
+
+
+def _runs(mask: np.ndarray):
+    """Начала и концы (не включительно) подряд идущих True"""
+    padded = np.concatenate(([False], mask, [False])).astype(np.int8)
+    edges = np.flatnonzero(np.diff(padded))
+    return edges[0::2], edges[1::2]
+
+
+def rolling_mean(values: np.ndarray, window: int) -> np.ndarray:
+    """Скользящее среднее по окну window (первые window-1 дней - по неполному окну)"""
+    cumsum = np.cumsum(values, dtype=np.float64)
+    sums = cumsum.copy()
+    sums[window:] -= cumsum[:-window]
+    return sums / np.minimum(np.arange(1, len(values) + 1), window)
+
+
+def compute_metrics(series: UserSeries, norm: int = DAILY_NORM) -> Dict:
+    """Серии, скользящие средние, динамика за неделю, выполнение нормы и лучший день"""
+    total = series.pushups + series.abs
+    active = total > 0
+    completed = (series.pushups >= norm) & (series.abs >= norm)
+
+    starts, ends = _runs(active)
+    longest_streak = int((ends - starts).max()) if len(starts) else 0
+    # Текущая серия не прерывается, пока сегодняшняя тренировка еще впереди
+    current_streak = 0
+    if len(ends) and ends[-1] >= len(total) - 1:
+        current_streak = int(ends[-1] - starts[-1])
+
+    last_week = int(total[-7:].sum())
+    previous_week = int(total[-14:-7].sum())
+    week_change = (last_week - previous_week) / previous_week * 100 if previous_week else None
+
+    best_index = int(np.argmax(total))
+    return {
+        'days': len(total),
+        'active_days': int(active.sum()),
+        'total_pushups': int(series.pushups.sum()),
+        'total_abs': int(series.abs.sum()),
+        'current_streak': current_streak,
+        'longest_streak': longest_streak,
+        'avg_7': float(rolling_mean(total, 7)[-1]),
+        'avg_30': float(rolling_mean(total, 30)[-1]),
+        'last_week': last_week,
+        'previous_week': previous_week,
+        'week_change': week_change,
+        'completion_rate': float(completed.mean() * 100),
+        'best_day': series.day(best_index) if total[best_index] > 0 else None,
+        'best_day_total': int(total[best_index]),
+    }
+
+
+def get_user_metrics(db, user_id: int, chat_id: int) -> Optional[Dict]:
+    """Метрики одного пользователя в чате (None, если записей нет)"""
+    series = build_series(db.get_daily_balances(chat_id, user_id)).get(user_id)
+    return compute_metrics(series) if series is not None else None
+
+
+def get_chat_metrics(db, chat_id: int) -> Dict[int, Dict]:
+    """Метрики всех участников чата одним запросом (для утреннего отчета)"""
+    return {user_id: compute_metrics(series)
+            for user_id, series in build_series(db.get_daily_balances(chat_id)).items()}
+
+
+def format_streak(days: int) -> str:
+    """Склонение количества дней: 1 день, 3 дня, 5 дней"""
+    if days % 10 == 1 and days % 100 != 11:
+        word = "день"
+    elif 2 <= days % 10 <= 4 and not 12 <= days % 100 <= 14:
+        word = "дня"
+    else:
+        word = "дней"
+    return f"{days} {word}"
+
+
+def get_chat_summary(db, chat_id: int, today: Optional[date] = None, norm: int = DAILY_NORM) -> Dict:
+    """Коротко о группе для персональной мотивации: участники за неделю, выполнение нормы вчера, серии"""
+    series = build_series(db.get_daily_balances(chat_id), today=today)
+    active = [s for s in series.values() if (s.pushups[-7:] + s.abs[-7:]).sum() > 0]
+    yesterday_done = sum(1 for s in active if len(s) >= 2 and s.pushups[-2] >= norm and s.abs[-2] >= norm)
+    metrics = [compute_metrics(s, norm) for s in active]
+    last_week = sum(m['last_week'] for m in metrics)
+    previous_week = sum(m['previous_week'] for m in metrics)
+    return {
+        'participants': len(active),
+        'yesterday_done': yesterday_done,
+        'best_streak': max((m['current_streak'] for m in metrics), default=0),
+        'week_change': (last_week - previous_week) / previous_week * 100 if previous_week else None,
+        'days': max((len(s) for s in series.values()), default=0),
+    }
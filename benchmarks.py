@@ -0,0 +1,403 @@
+"""
+Замеры производительности отдельных частей бота.
+
+Запуск:
+    python benchmarks.py            # все замеры
+    python benchmarks.py analytics  # только аналитика тренировок
+    python benchmarks.py nutrition  # покрытие и скорость таблицы КБЖУ
+    python benchmarks.py fuzzy      # исправление опечаток в названиях
+    python benchmarks.py prompts    # размер промптов разбора по версиям
+    python benchmarks.py streaming  # время до первого продукта при потоковом разборе
+    python benchmarks.py classifier # проверка "это еда?" без LLM
+    python benchmarks.py batching   # пакетный разбор сообщений разных пользователей
+    python benchmarks.py repair     # восстановление продуктов из испорченных ответов LLM
+"""
+import re
+import sys
+import logging
+import json
+import time
+import asyncio
+import tempfile
+from datetime import date, timedelta
+
+import numpy as np
+
+
+from analytics import DAILY_NORM, build_series, compute_metrics
+from calorie_counter import CalorieCounter
+from food_text import parse_quantity, split_food_parts
+from food_classifier import FOOD_KEYWORDS, STOP_WORDS, UNITS, _classify, classify_food_text
+from food_schema import validate_food_response
+from food_stream import ItemStreamParser, json_payload, parse_food_response
+from fuzzy_index import FuzzyIndex
+from llm_client import LLMClient
+from llm_providers import STUB, stub_answer, stub_provider
+from nutrition_table import NutritionTable
+from prompts import PROMPTS
+
+
+def _timeit(func, repeat: int = 5) -> float:
+    """Лучшее время из repeat запусков, в секундах"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def _synthetic_balances(users: int, days: int, seed: int = 42):
+    """Строки как из Database.get_daily_balances: несколько лет истории с пропусками"""
+    rng = np.random.default_rng(seed)
+    today = date.today()
+    rows = []
+    for user_id in range(users):
+        done_pushups = rng.integers(0, 120, days)
+        done_abs = rng.integers(0, 120, days)
+        present = rng.random(days) < 0.8
+        for offset in np.flatnonzero(present):
+            rows.append({
+                'user_id': user_id,
+                'date': (today - timedelta(days=days - 1 - int(offset))).isoformat(),
+                'pushups': DAILY_NORM - int(done_pushups[offset]),
+                'abs': DAILY_NORM - int(done_abs[offset]),
+                'norm_pushups': DAILY_NORM,
+                'norm_abs': DAILY_NORM,
+            })
+    return rows
+
+
+def _naive_metrics(pushups, abs_done, norm: int = DAILY_NORM):
+    """Те же метрики обычными циклами Python (для сравнения)"""
+    total = [p + a for p, a in zip(pushups, abs_done)]
+    longest = run = 0
+    for value in total:
+        run = run + 1 if value > 0 else 0
+        longest = max(longest, run)
+    current = 0
+    end = len(total) - 1 if total[-1] > 0 else len(total) - 2
+    while end >= 0 and total[end] > 0:
+        current += 1
+        end -= 1
+    completed = sum(1 for p, a in zip(pushups, abs_done) if p >= norm and a >= norm)
+    return {
+        'current_streak': current,
+        'longest_streak': longest,
+        'avg_7': sum(total[-7:]) / min(7, len(total)),
+        'avg_30': sum(total[-30:]) / min(30, len(total)),
+        'completion_rate': completed / len(total) * 100,
+        'best_day_total': max(total),
+    }
+
+
+def bench_analytics(users: int = 200, years: int = 3):
+    days = years * 365
+    rows = _synthetic_balances(users, days)
+    print(f"Аналитика: {users} пользователей x {days} дней ({len(rows)} записей)")
+
+    series = build_series(rows)
+    build_time = _timeit(lambda: build_series(rows), repeat=3)
+    vector_time = _timeit(lambda: [compute_metrics(s) for s in series.values()])
+    lists = [(s.pushups.tolist(), s.abs.tolist()) for s in series.values()]
+    naive_time = _timeit(lambda: [_naive_metrics(p, a) for p, a in lists])
+
+    for s, (p, a) in zip(series.values(), lists):
+        vector, naive = compute_metrics(s), _naive_metrics(p, a)
+        for key, value in naive.items():
+            assert abs(vector[key] - value) < 1e-6, (key, vector[key], value)
+
+    print(f"  построение рядов:     {build_time * 1000:8.1f} мс")
+    print(f"  метрики (NumPy):      {vector_time * 1000:8.1f} мс ({vector_time / users * 1e6:.0f} мкс на пользователя)")
+    print(f"  метрики (циклы):      {naive_time * 1000:8.1f} мс ({naive_time / users * 1e6:.0f} мкс на пользователя)")
+    print(f"  ускорение:            {naive_time / vector_time:8.1f}x")
+
+
+# Типичные сообщения о еде из чатов
+FOOD_MESSAGES = [
+    "овсянка 60г, банан, 2 яйца",
+    "гречка 200г и куриная грудка 150г",
+    "Завтрак: творог 5% 200г, кофе с молоком",
+    "чизбургер из Rostics 1 порция",
+    "2 яйца и хлеб 50г",
+    "рис 150г, котлета 2шт, салат из огурцов 100г",
+    "яблоко",
+    "макароны 200г с сыром 30г",
+    "борщ 300г, хлеб 40г",
+    "кефир 250мл",
+    "суп с фрикадельками 300г",
+    "шаурма 1 шт",
+    "пельмени 250г со сметаной 30г",
+    "протеиновый батончик 1шт",
+    "омлет из 3 яиц",
+    "картофельное пюре 200г, рыба 150г",
+    "банан 1",
+    "сырники 3шт",
+    "чай с сахаром",
+    "бигмак",
+]
+
+
+def bench_nutrition(repeat: int = 200):
+    load_time = _timeit(NutritionTable, repeat=3)
+    table = NutritionTable()
+    print(f"Таблица КБЖУ: {table.products} продуктов, {len(table.index)} названий")
+
+    parts = [part for message in FOOD_MESSAGES for part in split_food_parts(message)]
+    resolved = [part for part in parts if table.lookup(*parse_quantity(part))]
+    full = [m for m in FOOD_MESSAGES
+            if all(table.lookup(*parse_quantity(part)) for part in split_food_parts(m))]
+
+    def run():
+        for _ in range(repeat):
+            for message in FOOD_MESSAGES:
+                for part in split_food_parts(message):
+                    table.lookup(*parse_quantity(part))
+
+    lookup_time = _timeit(run, repeat=3) / (repeat * len(FOOD_MESSAGES))
+
+    print(f"  загрузка таблицы:     {load_time * 1000:8.1f} мс")
+    print(f"  найдено частей:       {len(resolved)}/{len(parts)} ({len(resolved) / len(parts) * 100:.0f}%)")
+    print(f"  сообщений без Groq:   {len(full)}/{len(FOOD_MESSAGES)} ({len(full) / len(FOOD_MESSAGES) * 100:.0f}%)")
+    print(f"  разбор сообщения:     {lookup_time * 1e6:8.1f} мкс")
+
+
+# Названия с опечатками -> правильное написание
+TYPOS = {
+    "корнешон": "корнишон", "грутка": "грудка", "авсянка": "овсянка", "пельмеин": "пельмени",
+    "макороны": "макароны", "сырнеки": "сырники", "шавурма": "шаурма", "кефирр": "кефир",
+    "творок": "творог", "банна": "банан", "апельсин": "апельсин", "шоколат": "шоколад",
+}
+
+
+def bench_fuzzy(repeat: int = 200):
+    names = NutritionTable().names
+    build_time = _timeit(lambda: FuzzyIndex(names), repeat=3)
+    index = FuzzyIndex(names)
+    print(f"Индекс опечаток: {len(index.words)} слов из {len(names)} названий")
+
+    fixed = sum(index.correct_word(typo) == word for typo, word in TYPOS.items())
+    unknown_time = _timeit(lambda: [index.correct_word(typo) for _ in range(repeat) for typo in TYPOS],
+                           repeat=3) / (repeat * len(TYPOS))
+    known_time = _timeit(lambda: [index.correct_word(word) for _ in range(repeat) for word in TYPOS.values()],
+                         repeat=3) / (repeat * len(TYPOS))
+
+    print(f"  построение индекса:   {build_time * 1000:8.1f} мс")
+    print(f"  исправлено:           {fixed}/{len(TYPOS)}")
+    print(f"  слово с опечаткой:    {unknown_time * 1e6:8.1f} мкс")
+    print(f"  известное слово:      {known_time * 1e6:8.1f} мкс")
+
+
+def bench_prompts():
+    print(f"Промпты разбора еды на {len(FOOD_MESSAGES)} сообщениях")
+    for version, template in PROMPTS.items():
+        if template.name != 'parse':
+            continue
+        sizes = [sum(len(m['content']) for m in template.render(message)) for message in FOOD_MESSAGES]
+        limits = [template.max_tokens_for(message) for message in FOOD_MESSAGES]
+        render_time = _timeit(lambda: [template.render(message) for message in FOOD_MESSAGES])
+        print(f"  {version:16} {sum(sizes) / len(sizes):7.0f} символов, max_tokens {sum(limits) / len(limits):4.0f}, "
+              f"сборка {render_time / len(FOOD_MESSAGES) * 1e6:.0f} мкс")
+
+
+def _stream_client(answer: str, tokens_per_second: float = 300.0):
+    """Заглушка LLM: ответ приходит потоком с заданной скоростью генерации"""
+    return LLMClient(providers={STUB: stub_provider(lambda params: answer, tokens_per_second=tokens_per_second)},
+                     default_provider=STUB)
+
+
+def bench_streaming(items: int = 5):
+    answer = json.dumps({"is_food": True, "items": [
+        {"name": f"продукт {i}", "amount": 150, "unit": "г", "calories": 180, "proteins": 12,
+         "fats": 6, "carbs": 20, "source": "USDA"} for i in range(items)
+    ]}, ensure_ascii=False)
+    messages = [{"role": "user", "content": "test"}]
+
+    async def measure(stream: bool):
+        client = _stream_client(answer)
+        parser = ItemStreamParser()
+        started = time.perf_counter()
+        first = None
+
+        async def on_text(text):
+            nonlocal first
+            if parser.feed(text) and first is None:
+                first = time.perf_counter() - started
+
+        await client.complete(messages, on_text=on_text if stream else None)
+        total = time.perf_counter() - started
+        return first if stream else total, total
+
+    print(f"Потоковый разбор: {items} продуктов, {len(answer)} символов ответа (~300 токенов/с)")
+    for title, stream in (("целиком", False), ("потоком", True)):
+        first, total = asyncio.run(measure(stream))
+        print(f"  {title:8} первый продукт через {first * 1000:6.0f} мс, весь ответ {total * 1000:6.0f} мс")
+
+
+NOT_FOOD_MESSAGES = ["привет", "как дела?", "что делаешь вечером", "ну ты и дурак", "спасибо большое"]
+_UNIT_RE = re.compile(rf"\d+\s*({'|'.join(UNITS)})")
+
+
+def _naive_classify(text: str):
+    """Прежняя проверка: список в handle_text (дважды), затем отдельные списки в classify_locally"""
+    text_lower = text.lower()
+    has_food_keyword = any(keyword in text_lower for keyword in FOOD_KEYWORDS)
+    has_number_with_unit = bool(_UNIT_RE.search(text_lower))
+    found_keywords = [keyword for keyword in FOOD_KEYWORDS if keyword in text_lower]
+    if any(word in text_lower for word in STOP_WORDS):
+        return False, found_keywords
+    if any(keyword in text_lower for keyword in FOOD_KEYWORDS) or _UNIT_RE.search(text_lower):
+        return True, found_keywords
+    return (True if has_food_keyword or has_number_with_unit else None), found_keywords
+
+
+def bench_classifier(repeat: int = 200):
+    messages = [message.lower() for message in FOOD_MESSAGES + NOT_FOOD_MESSAGES]
+    mismatched = [message for message in messages
+                  if _naive_classify(message)[0] != classify_food_text(message).is_food]
+    naive_time = _timeit(lambda: [_naive_classify(m) for _ in range(repeat) for m in messages], repeat=3)
+    compiled_time = _timeit(lambda: [_classify.__wrapped__(m) for _ in range(repeat) for m in messages], repeat=3)
+    cached_time = _timeit(lambda: [classify_food_text(m) for _ in range(repeat) for m in messages], repeat=3)
+    per_message = repeat * len(messages)
+
+    print(f"Проверка \"это еда?\": {len(messages)} сообщений, {len(FOOD_KEYWORDS)} ключевых слов")
+    print(f"  списки подстрок:      {naive_time / per_message * 1e6:8.1f} мкс")
+    print(f"  одно выражение:       {compiled_time / per_message * 1e6:8.1f} мкс")
+    print(f"  повторно (кэш):       {cached_time / per_message * 1e6:8.1f} мкс")
+    print(f"  расхождений:          {len(mismatched)} {mismatched if mismatched else ''}")
+
+
+def _batch_client(latency: float = 0.3, tokens_per_second: float = 300.0, drop_every: int = 0):
+    """Заглушка LLM для разбора: отвечает и на одно сообщение, и на пакет "номер: сообщение".
+
+    Время ответа - latency плюс генерация ответа; drop_every > 0 - каждое такое сообщение пакета
+    остается без ответа (проверка повторов по одному). calls - параметры запросов.
+    """
+    def respond(params):
+        answer = stub_answer(params)
+        if drop_every and '"results"' in answer:
+            results = json.loads(answer)['results']
+            answer = json.dumps({"results": [result for result in results if result['id'] % drop_every]},
+                                ensure_ascii=False)
+        return answer
+
+    provider = stub_provider(respond, latency=latency, tokens_per_second=tokens_per_second)
+    return LLMClient(providers={STUB: provider}, default_provider=STUB), provider.client.calls
+
+
+def bench_batching(users: int = 24, spread: float = 1.0, window: float = 0.15):
+    async def measure(batch_window: float, drop_every: int = 0):
+        client, calls = _batch_client(drop_every=drop_every)
+        with tempfile.TemporaryDirectory() as tmp:
+            counter = CalorieCounter(db_path=f"{tmp}/bench.db", llm_client=client,
+                                     parse_batch_window=batch_window)
+
+            async def user(index):
+                await asyncio.sleep(spread * index / users)
+                started = time.perf_counter()
+                result = await counter.parse_with_groq(f"продукт{index} 100г")
+                return time.perf_counter() - started, result is not None and result.get('success')
+
+            started = time.perf_counter()
+            results = await asyncio.gather(*(user(index) for index in range(users)))
+            total = time.perf_counter() - started
+        latencies = sorted(latency for latency, _ in results)
+        return latencies, sum(ok for _, ok in results), len(calls), total
+
+    print(f"Пакетный разбор: {users} пользователей за {spread:.0f} с, заглушка LLM ~300 мс на ответ")
+    for title, batch_window, drop_every in (("по одному", 0, 0), (f"окно {window * 1000:.0f} мс", window, 0),
+                                            ("окно, потери", window, 3)):
+        latencies, ok, calls, total = asyncio.run(measure(batch_window, drop_every))
+        print(f"  {title:14} запросов к LLM {calls:3}, разобрано {ok}/{users}, "
+              f"задержка p50 {latencies[len(latencies) // 2] * 1000:4.0f} мс, макс {latencies[-1] * 1000:4.0f} мс, "
+              f"при лимите 30 запросов/мин - до {30 * users / calls:.0f} сообщений/мин")
+
+
+_OATS = '{"name": "овсянка", "amount": 60, "unit": "г", "calories": 233, "proteins": 8, "fats": 4, "carbs": 41, "source": "USDA"}'
+_BANANA = '{"name": "банан", "amount": 1, "unit": "шт", "calories": 105, "proteins": 1.3, "fats": 0.4, "carbs": 27, "source": "USDA"}'
+_EGGS = '{"name": "яйцо", "amount": 2, "unit": "шт", "calories": 155, "proteins": 13, "fats": 11, "carbs": 1.1, "source": "USDA"}'
+
+# Испорченные ответы модели на разбор еды (вид как в логах) и сколько целых продуктов в каждом
+BAD_RESPONSES = [
+    # обрезан по max_tokens на середине продукта
+    ('{"is_food": true, "items": [' + _OATS + ', ' + _BANANA + ', {"name": "яйцо", "amount": 2, "unit": "ш', 2),
+    ('{"is_food": true, "items": [' + _OATS + ', {"name": "банан", "amount"', 1),
+    ('{"is_food": true, "items": [' + _OATS + ', ' + _BANANA + ', ' + _EGGS, 3),
+    ('{"is_food": true, "items": [{"name": "овся', 0),
+    # текст вокруг JSON и markdown-блок
+    ('Вот результат:\n```json\n{"is_food": true, "items": [' + _OATS + ']}\n```\nНадеюсь, помог!', 1),
+    ('```json\n{"is_food": true, "items": [' + _OATS + ', ' + _BANANA + ']}\n```', 2),
+    ('Конечно! {"is_food": true, "items": [' + _BANANA + ']} Обратите внимание: значения примерные.', 1),
+    # мелкие синтаксические ошибки
+    ('{"is_food": true, "items": [' + _OATS + ', ' + _BANANA + ',],}', 2),
+    ('{"is_food": True, "items": [' + _EGGS + ']}', 1),
+    ('{\n  // продукты\n  "is_food": true,\n  "items": [' + _OATS + ']\n}', 1),
+    ('{“is_food”: true, “items”: [' + _BANANA + ']}', 1),
+    # один испорченный продукт среди целых
+    ('{"is_food": true, "items": [' + _OATS + ', {"name": "хлеб", "amount": 30, "unit": "г", "calories": около 80}, '
+     + _EGGS + ']}', 2),
+    ('{"is_food": true, "items": [' + _OATS + ' ' + _BANANA + ']}', 2),
+    # старый формат - массив продуктов, обрезан
+    ('[' + _OATS + ', ' + _EGGS + ', {"name"', 2),
+    # не еда, ответ обрезан после is_food
+    ('{"is_food": false, "items": [', 0),
+]
+
+
+def _strict_parse(text: str):
+    """Прежний разбор: JSON целиком или ничего"""
+    return validate_food_response(json.loads(json_payload(text)))[1]
+
+
+def bench_repair(repeat: int = 200):
+    expected = sum(items for _, items in BAD_RESPONSES)
+    results = {}
+    logging.disable(logging.WARNING)  # предупреждения о частичном разборе на каждый ответ
+    for title, parse in (("целиком", _strict_parse), ("с восстановлением", lambda text: parse_food_response(text)[1])):
+        recovered, salvaged = 0, 0
+        for text, items in BAD_RESPONSES:
+            try:
+                found = len(parse(text))
+            except ValueError:
+                found = -1
+            if found >= 0:
+                salvaged += 1
+            recovered += max(found, 0)
+        elapsed = _timeit(lambda: [_safe(parse, text) for _ in range(repeat) for text, _ in BAD_RESPONSES], repeat=3)
+        results[title] = (salvaged, recovered, elapsed / (repeat * len(BAD_RESPONSES)))
+    logging.disable(logging.NOTSET)
+
+    print(f"Испорченные ответы LLM: {len(BAD_RESPONSES)} ответов, целых продуктов в них: {expected}")
+    for title, (salvaged, recovered, per_response) in results.items():
+        print(f"  {title:18} ответов без повтора запроса {salvaged:2}/{len(BAD_RESPONSES)}, "
+              f"продуктов {recovered:2}/{expected}, {per_response * 1e6:6.1f} мкс на ответ")
+
+
+def _safe(parse, text):
+    try:
+        return parse(text)
+    except ValueError:
+        return None
+
+
+BENCHMARKS = {
+    'analytics': bench_analytics,
+    'nutrition': bench_nutrition,
+    'fuzzy': bench_fuzzy,
+    'prompts': bench_prompts,
+    'streaming': bench_streaming,
+    'classifier': bench_classifier,
+    'batching': bench_batching,
+    'repair': bench_repair,
+}
+
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main()
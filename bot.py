@@ -13,18 +13,28 @@ if script_dir not in sys.path:
 import asyncio
 import logging
 import re
+import time
+import tempfile
 from typing import Optional, Dict, List
 from aiohttp import web
 from aiohttp.web import Response
 
 from aiogram import Bot, Dispatcher, F
 from aiogram.filters import Command
-from aiogram.types import Message, WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, MenuButtonWebApp
+from aiogram.types import Message, WebAppInfo, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery, MenuButtonWebApp, BufferedInputFile, FSInputFile
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 
 from database import Database
-from motivator import Motivator
+from motivator import PERSONAL_TIMEOUT, Motivator, format_chat_summary
+from motivation_pool import POOL_SIZE
 from calorie_counter import CalorieCounter
+from food_classifier import classify_food_text
+from llm_client import LLMClient
+from llm_budget import LLMBudget
+from llm_usage import UsageLog
+from charts import ChartCache, build_day_labels, data_version, render_chart, render_nutrition_chart, render_workout_chart, shutdown_executor
+from exporter import EXPORT_FORMATS, export_user_data
+from analytics import format_streak, get_chat_metrics, get_chat_summary, get_user_metrics
 
 # Настройка логирования
 logging.basicConfig(
@@ -41,8 +51,27 @@ dp: Dispatcher = None
 db: Database = None
 motivator: Motivator = None
 calorie_counter: CalorieCounter = None
+llm_client: LLMClient = None
+chart_cache: ChartCache = None
 scheduler: AsyncIOScheduler = None
 
+# Администраторы бота (через запятую в ADMIN_IDS)
+ADMIN_IDS = {int(admin_id) for admin_id in os.getenv("ADMIN_IDS", "").replace(' ', '').split(',') if admin_id.isdigit()}
+
+
+def is_admin(user_id: int) -> bool:
+    """Проверка, что пользователь - администратор бота"""
+    return user_id in ADMIN_IDS
+
+
+# Подписи к файлам выгрузки /export
+EXPORT_CAPTIONS = {
+    'meals': '🍽 Приемы пищи',
+    'meal_items': '🥕 Продукты в приемах пищи',
+    'pushups': '💪 Отжимания',
+    'abs': '🔥 Пресс',
+}
+
 
 async def get_chat_members_dict(chat_id: int, user_ids: List[int]) -> Dict[int, str]:
     """Получение словаря участников группы: user_id -> имя"""
@@ -118,6 +147,7 @@ async def send_daily_summary(chat_id: int):
             if p['user_id'] not in members_dict:
                 members_dict[p['user_id']] = p['username']
         sorted_participants = sorted(all_participants, key=lambda x: members_dict.get(x['user_id'], x['username']))
+        metrics = get_chat_metrics(db, chat_id)
         # «Вы занимаетесь уже N дней»
         first_date = db.get_chat_first_activity_date(chat_id)
         if first_date:
@@ -152,7 +182,11 @@ async def send_daily_summary(chat_id: int):
             abs_line = f"Пресс: {abs_today} ({abs_debt} долг + 80)"
             if abs_today > 80:
                 abs_line += " ⚠️"
-            message_today += abs_line + "\n\n"
+            message_today += abs_line + "\n"
+            user_metrics = metrics.get(user_id)
+            if user_metrics and user_metrics['current_streak'] > 1:
+                message_today += f"🔥 Серия: {format_streak(user_metrics['current_streak'])}\n"
+            message_today += "\n"
         await bot.send_message(chat_id, message_today.strip(), parse_mode='HTML')
         logger.info(f"Отправлена ежедневная сводка в чат {chat_id} (план на сегодня)")
     except Exception as e:
@@ -166,8 +200,8 @@ async def add_daily_norm_to_all_chats():
         for chat_id in active_chats:
             participants = db.get_active_chat_participants(chat_id, days=7)
             for p in participants:
-                db.add_pushups(p['user_id'], p['username'] or '', 80, chat_id)
-                db.add_abs(p['user_id'], p['username'] or '', 80, chat_id)
+                db.add_pushups(p['user_id'], p['username'] or '', 80, chat_id, norm=80)
+                db.add_abs(p['user_id'], p['username'] or '', 80, chat_id, norm=80)
         if active_chats:
             logger.info(f"Добавлена дневная норма +80 в {len(active_chats)} чатах")
     except Exception as e:
@@ -185,16 +219,25 @@ async def send_daily_summary_to_all_chats():
         logger.error(f"Ошибка при отправке ежедневных сводок: {e}")
 
 
-async def send_motivational_message(chat_id: int):
-    """Отправка мотивирующего сообщения в группу"""
+async def build_personal_motivation(chat_ids: List[int]) -> Dict[int, tuple]:
+    """Персональные факт и совет по сводкам групп (несколько групп в одном запросе к LLM)"""
     try:
-        # Формируем контекст о программе тренировок группы
-        context = {
-            "program": "80 отжиманий и 80 упражнений на пресс ежедневно",
-            "frequency": "каждый день"
-        }
-        
-        fact, tip = await motivator.generate_motivational_content(context=context)
+        summaries = {chat_id: format_chat_summary(get_chat_summary(db, chat_id)) for chat_id in chat_ids}
+        return await motivator.generate_for_chats(summaries, timeout=PERSONAL_TIMEOUT)
+    except Exception as e:
+        logger.error(f"Ошибка при генерации персональной мотивации: {e}")
+        return {}
+
+
+async def send_motivational_message(chat_id: int, content: Optional[tuple] = None):
+    """Отправка мотивирующего сообщения в группу (content - персональные факт и совет)"""
+    try:
+        # Персональное сообщение, повторяющее недавнюю рассылку, не отправляем
+        if content and not motivator.pool.mark_sent(*content):
+            logger.info(f"Персональная мотивация для чата {chat_id} повторяет недавнюю, берем из пула")
+            content = None
+        # Без персонального сообщения берем пару из заранее сгенерированного пула - без ожидания LLM
+        fact, tip = content or motivator.get_motivational_content()
         
         message = f"💪 <b>Мотивация на сегодня!</b>\n\n"
         message += f"📊 <b>Факт:</b> {fact}\n\n"
@@ -210,12 +253,22 @@ async def send_motivational_to_all_chats():
     """Отправка мотивирующих сообщений во все активные группы"""
     try:
         active_chats = db.get_active_chats()
+        contents = await build_personal_motivation(active_chats)
         for chat_id in active_chats:
-            await send_motivational_message(chat_id)
+            await send_motivational_message(chat_id, contents.get(chat_id))
     except Exception as e:
         logger.error(f"Ошибка при отправке мотивирующих сообщений: {e}")
 
 
+async def refill_motivation_pool():
+    """Пополнение пула мотивации в фоне: запас на две рассылки во все активные группы"""
+    try:
+        target = max(POOL_SIZE, 2 * len(db.get_active_chats()))
+        await motivator.refill_pool(target)
+    except Exception as e:
+        logger.error(f"Ошибка при пополнении пула мотивации: {e}")
+
+
 async def setup_scheduler():
     """Настройка расписания для отправки ежедневной сводки и мотивации"""
     global scheduler
@@ -247,8 +300,16 @@ async def setup_scheduler():
         id='evening_motivation'
     )
     
+    # Пул мотивации пополняется заранее, между рассылками
+    scheduler.add_job(
+        refill_motivation_pool,
+        'interval',
+        minutes=30,
+        id='motivation_pool'
+    )
+    
     scheduler.start()
-    logger.info("Планировщик запущен (8:00 сводка, 9:00 и 20:00 мотивация)")
+    logger.info("Планировщик запущен (8:00 сводка, 9:00 и 20:00 мотивация, пул мотивации каждые 30 минут)")
 
 
 async def cmd_start(message: Message):
@@ -260,7 +321,10 @@ async def cmd_start(message: Message):
             "📝 <b>Доступные команды:</b>\n"
             "/add_meal - добавить прием пищи\n"
             "/today - статистика за сегодня\n"
-            "/week - статистика за неделю\n"
+            "/week - статистика за неделю (с графиком)\n"
+            "/month - статистика за месяц\n"
+            "/find - найти и повторить прошлый прием пищи\n"
+            "/recipe - мои рецепты (считаются без AI)\n"
             "/set_limit - установить дневную норму калорий\n"
             "/scanner - открыть сканер штрих-кодов 📷\n"
             "/help - помощь\n\n"
@@ -298,6 +362,7 @@ async def cmd_start(message: Message):
             "/stats - статистика за сегодня\n"
             "/leaderboard - таблица лидеров\n"
             "/my_stats - моя статистика\n"
+            "/week, /month - график тренировок группы\n"
             "/help - помощь"
         )
         await message.answer(text, parse_mode='HTML')
@@ -353,7 +418,10 @@ async def cmd_help(message: Message):
             "• Или просто напиши что съел: <code>Завтрак: яйца 2шт, хлеб 50г</code>\n"
             "• Можно писать свободно: <code>Съел борщ с хлебом</code>\n"
             "• /today - посмотреть калории за сегодня\n"
-            "• /week - статистика за неделю\n"
+            "• /week, /month - графики калорий и КБЖУ\n"
+            "• /find овсянка - найти в истории и добавить еще раз\n"
+            "• /recipe - сохранить свое блюдо и добавлять его без AI\n"
+            "• /export csv - выгрузить свои данные (csv, jsonl или parquet)\n"
             "• /set_limit 2000 - установить дневную норму\n\n"
             "Я автоматически распознаю продукты и их количество!"
         )
@@ -366,7 +434,8 @@ async def cmd_help(message: Message):
             "• /pushups, /abs — добавить к долгу (редко нужно)\n"
             "• /stats - статистика группы за сегодня\n"
             "• /my_stats - твоя личная статистика\n"
-            "• /leaderboard - кто больше всех отжался\n\n"
+            "• /leaderboard - кто больше всех отжался\n"
+            "• /week, /month - график отжиманий и пресса группы\n\n"
             "Я буду отправлять ежедневную сводку в 8:00 утра и мотивирующие сообщения в 9:00 и 20:00!"
         )
     await message.answer(text, parse_mode='HTML')
@@ -662,6 +731,17 @@ async def cmd_my_stats(message: Message):
         text += f"📅 Дней тренировок: {stats['days']}\n"
         text += f"📈 Среднее в день: {stats['avg_per_day']:.1f}"
         
+        metrics = get_user_metrics(db, user_id, message.chat.id)
+        if metrics:
+            text += "\n\n"
+            text += f"🔥 Серия: {format_streak(metrics['current_streak'])} (рекорд: {format_streak(metrics['longest_streak'])})\n"
+            text += f"📊 В среднем за 7 дней: {metrics['avg_7']:.0f}, за 30 дней: {metrics['avg_30']:.0f}\n"
+            if metrics['week_change'] is not None:
+                text += f"📆 Эта неделя к прошлой: {metrics['week_change']:+.0f}%\n"
+            text += f"✅ Норма выполнена в {metrics['completion_rate']:.0f}% дней\n"
+            if metrics['best_day']:
+                text += f"🏅 Лучший день: {metrics['best_day'].strftime('%d.%m.%Y')} ({metrics['best_day_total']})"
+        
         await message.answer(text, parse_mode='HTML')
     except Exception as e:
         logger.error(f"Ошибка при получении личной статистики: {e}")
@@ -732,7 +812,8 @@ async def cmd_test_motivation(message: Message):
         await message.answer("Команда для теста мотивации работает только в группе. Добавь бота в тестовую группу и напиши /test_motivation там.")
         return
     try:
-        await send_motivational_message(message.chat.id)
+        contents = await build_personal_motivation([message.chat.id])
+        await send_motivational_message(message.chat.id, contents.get(message.chat.id))
     except Exception as e:
         logger.error(f"Ошибка при тестовой мотивации: {e}")
         await message.answer(f"Ошибка: {e}")
@@ -816,6 +897,103 @@ def build_today_message(user_id: int):
     return text, reply_markup
 
 
+PROGRESS_EDIT_INTERVAL = 1.0  # Telegram ограничивает частоту правок сообщения
+
+
+class MealProgress:
+    """Сообщение "Считаю КБЖУ..." с продуктами, распознанными по мере ответа Groq.
+
+    Появляется, только если разбор идет через Groq; правится не чаще PROGRESS_EDIT_INTERVAL,
+    итоговый ответ заменяет его текст.
+    """
+
+    def __init__(self, message: Message):
+        self.message = message
+        self.status_msg = None
+        self.last_text = None
+        self.last_edit = 0.0
+
+    async def update(self, items: List[Dict]):
+        text = "⏳ Считаю КБЖУ..."
+        if items:
+            text += "\n" + "\n".join(
+                f"• {item['name']} {item['amount']}{item['unit']} — {int(item['calories'])} ккал" for item in items
+            )
+        try:
+            if self.status_msg is None:
+                self.status_msg = await self.message.answer(text)
+            elif text != self.last_text and time.monotonic() - self.last_edit >= PROGRESS_EDIT_INTERVAL:
+                await self.status_msg.edit_text(text)
+            else:
+                return
+            self.last_text = text
+            self.last_edit = time.monotonic()
+        except Exception as e:
+            logger.debug(f"Не удалось обновить сообщение о ходе разбора: {e}")
+
+    async def finish(self, text: str, **kwargs):
+        """Итоговый ответ: правкой сообщения о ходе разбора или новым сообщением"""
+        if self.status_msg is not None:
+            try:
+                await self.status_msg.edit_text(text, **kwargs)
+                return
+            except Exception as e:
+                logger.debug(f"Не удалось изменить сообщение о ходе разбора: {e}")
+        await self.message.answer(text, **kwargs)
+
+
+def build_meal_added_message(user_id: int, result: Dict, title: str = "✅ Добавлено"):
+    """Формирует текст и клавиатуру ответа о добавленном приеме пищи. Возвращает (text, reply_markup)."""
+    response = f"{title}: {result['calories']} ккал\n"
+    response += f"📦 {result.get('meal_name', 'Продукт')}\n"
+    
+    # Показываем КБЖУ если есть
+    if result.get('proteins') is not None or result.get('fats') is not None or result.get('carbs') is not None:
+        response += f"\n📊 <b>КБЖУ:</b>\n"
+        response += f"🔥 Калории: {result['calories']} ккал\n"
+        if result.get('proteins') is not None:
+            response += f"🥩 Белки: {result['proteins']} г\n"
+        if result.get('fats') is not None:
+            response += f"🧈 Жиры: {result['fats']} г\n"
+        if result.get('carbs') is not None:
+            response += f"🍞 Углеводы: {result['carbs']} г\n"
+    
+    # Показываем источник информации
+    source = result.get('source', 'Неизвестно')
+    if source:
+        response += f"\n📡 Источник: {source}\n"
+    
+    response += f"\n📊 Всего за сегодня: {result['total_today']} ккал"
+    
+    limit = calorie_counter.get_daily_limit(user_id)
+    if limit:
+        remaining = limit - result['total_today']
+        percentage = (result['total_today'] / limit) * 100
+        response += f"\n🎯 Осталось: {remaining} ккал ({100-percentage:.1f}%)"
+    
+    # Добавляем кнопку для удаления только если есть meal_id
+    reply_markup = None
+    meal_id = result.get('meal_id')
+    if meal_id:
+        buttons = [[InlineKeyboardButton(
+            text="🗑 Удалить этот продукт",
+            callback_data=f"delete_meal_{meal_id}"
+        )]]
+        # Если продуктов несколько - даем удалить каждый по отдельности
+        meal_items = calorie_counter.get_meal_items(user_id, meal_id)
+        if len(meal_items) > 1:
+            for item in meal_items:
+                name = item['name'] or '—'
+                short = (name[:20] + '…') if len(name) > 20 else name
+                buttons.append([InlineKeyboardButton(
+                    text=f"✖️ {short} ({int(item['calories'] or 0)} ккал)",
+                    callback_data=f"delete_item_{item['id']}"
+                )])
+        reply_markup = InlineKeyboardMarkup(inline_keyboard=buttons)
+    
+    return response, reply_markup
+
+
 async def cmd_today(message: Message):
     """Статистика калорий за сегодня + список продуктов с кнопками удаления"""
     if message.chat.type != "private":
@@ -830,30 +1008,230 @@ async def cmd_today(message: Message):
         await message.answer("Произошла ошибка. Попробуй еще раз.")
 
 
+async def send_chart(message: Message, scope: str, range_name: str, renderer, payload: Dict, caption: str) -> bool:
+    """Отправка графика: если данные не менялись, переотправляем по сохраненному file_id без перерисовки"""
+    version = data_version(payload)
+    file_id = chart_cache.get_file_id(scope, range_name, version)
+    if file_id:
+        try:
+            await message.answer_photo(file_id, caption=caption, parse_mode='HTML')
+            return True
+        except Exception as e:
+            logger.warning(f"Не удалось отправить график по file_id, перерисовываю: {e}")
+            chart_cache.invalidate(scope, range_name)
+    
+    try:
+        png = await render_chart(renderer, payload)
+    except Exception as e:
+        logger.error(f"Ошибка при отрисовке графика: {e}", exc_info=True)
+        return False
+    
+    sent = await message.answer_photo(
+        BufferedInputFile(png, filename=f"{range_name}.png"),
+        caption=caption,
+        parse_mode='HTML'
+    )
+    if sent.photo:
+        chart_cache.save_file_id(scope, range_name, version, sent.photo[-1].file_id)
+    return True
+
+
+async def send_period_stats(message: Message, days: int, range_name: str, title: str):
+    """Статистика за период с графиком: в личке - калории и КБЖУ, в группе - отжимания и пресс"""
+    if message.chat.type == "private":
+        user_id = message.from_user.id
+        series = calorie_counter.get_daily_series(user_id, days)
+        days_with_meals = [day for day in series if day['calories']]
+        
+        total_calories = sum(day['calories'] for day in series)
+        avg_calories = total_calories / len(days_with_meals) if days_with_meals else 0
+        
+        text = f"📊 <b>Статистика за {title}:</b>\n\n"
+        text += f"🔥 Всего за {title}: {total_calories} ккал\n"
+        text += f"📈 Среднее в день: {avg_calories:.0f} ккал\n"
+        if days <= 7:
+            text += "\n"
+            for day in reversed(days_with_meals):
+                text += f"📅 {day['date'].strftime('%d.%m')}: {day['calories']} ккал\n"
+        
+        payload = {
+            'title': f"Калории за {title}",
+            'limit': calorie_counter.get_daily_limit(user_id),
+            'days': build_day_labels(series)
+        }
+        scope = f"user:{user_id}"
+        renderer = render_nutrition_chart
+    else:
+        series = db.get_chat_daily_totals(message.chat.id, days)
+        text = f"📊 <b>Тренировки группы за {title}:</b>\n\n"
+        text += f"💪 Отжимания: {sum(day['pushups'] for day in series)}\n"
+        text += f"🏋️ Пресс: {sum(day['abs'] for day in series)}\n"
+        
+        payload = {
+            'title': f"Отжимания и пресс за {title}",
+            'days': build_day_labels(series)
+        }
+        scope = f"chat:{message.chat.id}"
+        renderer = render_workout_chart
+    
+    if not await send_chart(message, scope, range_name, renderer, payload, text):
+        # Если график не получился, отправляем хотя бы текст
+        await message.answer(text, parse_mode='HTML')
+
+
 async def cmd_week(message: Message):
-    """Статистика калорий за неделю"""
+    """Статистика за неделю (с графиком)"""
+    try:
+        await send_period_stats(message, 7, 'week', 'неделю')
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики за неделю: {e}")
+        await message.answer("Произошла ошибка. Попробуй еще раз.")
+
+
+async def cmd_month(message: Message):
+    """Статистика за месяц (с графиком)"""
+    try:
+        await send_period_stats(message, 30, 'month', 'месяц')
+    except Exception as e:
+        logger.error(f"Ошибка при получении статистики за месяц: {e}")
+        await message.answer("Произошла ошибка. Попробуй еще раз.")
+
+
+async def cmd_find(message: Message):
+    """Поиск по истории приемов пищи с быстрым повторным добавлением"""
+    if message.chat.type != "private":
+        return
+
+    try:
+        args = message.text.split(maxsplit=1)
+        if len(args) < 2 or not args[1].strip():
+            await message.answer(
+                "Использование: /find [что искать]\nПример: <code>/find овсянка</code>",
+                parse_mode='HTML'
+            )
+            return
+
+        user_id = message.from_user.id
+        query = args[1].strip()
+        meals = calorie_counter.search_meals(user_id, query)
+
+        if not meals:
+            await message.answer(f"🔍 В истории нет ничего похожего на «{query}».")
+            return
+
+        text = f"🔍 <b>Найдено в истории:</b>\n\n"
+        buttons = []
+        for i, meal in enumerate(meals, 1):
+            name = meal['meal_name'] or '—'
+            text += f"{i}. {name} — {meal['calories']} ккал (×{meal['times']})\n"
+            short = (name[:25] + '…') if len(name) > 25 else name
+            buttons.append([InlineKeyboardButton(
+                text=f"➕ {short} ({meal['calories']} ккал)",
+                callback_data=f"relog_meal_{meal['id']}"
+            )])
+        text += "\n👇 Нажми, чтобы добавить еще раз:"
+
+        await message.answer(text, parse_mode='HTML', reply_markup=InlineKeyboardMarkup(inline_keyboard=buttons))
+    except Exception as e:
+        logger.error(f"Ошибка при поиске по истории: {e}")
+        await message.answer("Произошла ошибка. Попробуй еще раз.")
+
+
+def format_recipe(recipe: Dict) -> str:
+    """Краткое описание рецепта для ответа пользователю"""
+    text = f"🍲 <b>{recipe['name']}</b>\n"
+    if recipe.get('calories_per_100g') is not None:
+        text += (f"На 100г: {recipe['calories_per_100g']:.0f} ккал, "
+                 f"Б {recipe['proteins_per_100g'] or 0} / Ж {recipe['fats_per_100g'] or 0} / У {recipe['carbs_per_100g'] or 0}\n")
+    portion = f" ({recipe['portion_weight']:.0f}г)" if recipe.get('portion_weight') else ""
+    text += (f"Порция{portion}: {recipe['calories_per_portion']:.0f} ккал, "
+             f"Б {recipe['proteins_per_portion'] or 0} / Ж {recipe['fats_per_portion'] or 0} / У {recipe['carbs_per_portion'] or 0}\n")
+    return text
+
+
+async def cmd_recipe(message: Message):
+    """Рецепты пользователя: создание, список, удаление"""
     if message.chat.type != "private":
         return
     
+    usage = (
+        "🍲 <b>Мои рецепты</b>\n\n"
+        "Опиши блюдо один раз — дальше я буду считать его сам, без AI:\n"
+        "• <code>/recipe борщ мамин 8 порций: свекла 300г, картофель 400г, говядина 500г, капуста 300г</code>\n"
+        "• Или КБЖУ на 100г вручную: <code>/recipe сырники = 220/15/10/20 порция 150г</code>\n"
+        "• Удалить: <code>/recipe удалить борщ мамин</code>\n\n"
+        "Потом просто пиши: <code>борщ мамин 350г</code> или <code>сырники 2 порции</code>"
+    )
+    
     try:
         user_id = message.from_user.id
-        stats = calorie_counter.get_week_stats(user_id)
+        args = message.text.split(maxsplit=1)
+        if len(args) < 2 or not args[1].strip():
+            recipes = calorie_counter.recipes.list_recipes(user_id)
+            text = usage
+            if recipes:
+                text += "\n\n<b>Сохраненные рецепты:</b>\n\n" + "\n".join(format_recipe(r) for r in recipes)
+            await message.answer(text, parse_mode='HTML')
+            return
         
-        text = "📊 <b>Статистика за неделю:</b>\n\n"
+        body = args[1].strip()
         
-        total_calories = sum(day['calories'] for day in stats['days'])
-        avg_calories = total_calories / len(stats['days']) if stats['days'] else 0
+        if body.lower().startswith('удалить '):
+            name = body[len('удалить '):].strip()
+            if calorie_counter.recipes.delete_recipe(user_id, name):
+                await message.answer(f"🗑 Рецепт «{name}» удален")
+            else:
+                await message.answer(f"Рецепт «{name}» не найден")
+            return
         
-        text += f"🔥 Всего за неделю: {total_calories} ккал\n"
-        text += f"📈 Среднее в день: {avg_calories:.0f} ккал\n\n"
+        if '=' in body:
+            # Ручной ввод: КБЖУ на 100г
+            name, values = body.split('=', 1)
+            portion_match = re.search(r'порци\w*\s*(\d+(?:[.,]\d+)?)', values, re.IGNORECASE)
+            if portion_match:
+                values = values[:portion_match.start()]
+            numbers = [float(n.replace(',', '.')) for n in re.findall(r'\d+(?:[.,]\d+)?', values)]
+            if not name.strip() or len(numbers) < 1:
+                await message.answer(usage, parse_mode='HTML')
+                return
+            numbers += [None] * (4 - len(numbers))
+            recipe = calorie_counter.recipes.save_manual_recipe(
+                user_id, name.strip(), numbers[0], numbers[1], numbers[2], numbers[3],
+                portion_weight=float(portion_match.group(1).replace(',', '.')) if portion_match else None
+            )
+            await message.answer("✅ Рецепт сохранен!\n\n" + format_recipe(recipe), parse_mode='HTML')
+            return
         
-        for day in stats['days']:
-            date_str = day['date'].strftime('%d.%m')
-            text += f"📅 {date_str}: {day['calories']} ккал\n"
+        if ':' not in body:
+            await message.answer(usage, parse_mode='HTML')
+            return
         
-        await message.answer(text, parse_mode='HTML')
+        name, ingredients_text = body.split(':', 1)
+        portions = 1
+        portions_match = re.search(r'(\d+(?:[.,]\d+)?)\s*порц\w*', name, re.IGNORECASE)
+        if portions_match:
+            portions = float(portions_match.group(1).replace(',', '.'))
+            name = name[:portions_match.start()] + name[portions_match.end():]
+        name = name.strip()
+        if not name or not ingredients_text.strip():
+            await message.answer(usage, parse_mode='HTML')
+            return
+        
+        status_msg = await message.answer("⏳ Считаю КБЖУ ингредиентов...")
+        result = await calorie_counter.create_recipe_from_text(user_id, name, ingredients_text.strip(), portions)
+        if result.get('success'):
+            recipe = result['recipe']
+            text = "✅ Рецепт сохранен!\n\n" + format_recipe(recipe)
+            text += "\n<b>Ингредиенты:</b>\n"
+            for item in result['items']:
+                text += f"• {item['name']} {item['amount']}{item['unit']} — {item['calories']} ккал\n"
+            if recipe.get('calories_per_100g') is None:
+                text += "\n⚠️ Не у всех ингредиентов указан вес, поэтому блюдо можно добавлять только порциями."
+            await status_msg.edit_text(text, parse_mode='HTML')
+        else:
+            await status_msg.edit_text(f"❌ {result.get('message', 'Не удалось сохранить рецепт.')}")
     except Exception as e:
-        logger.error(f"Ошибка при получении статистики за неделю: {e}")
+        logger.error(f"Ошибка при работе с рецептами: {e}", exc_info=True)
         await message.answer("Произошла ошибка. Попробуй еще раз.")
 
 
@@ -884,6 +1262,205 @@ async def cmd_set_limit(message: Message):
         await message.answer("Произошла ошибка. Попробуй еще раз.")
 
 
+async def cmd_export(message: Message):
+    """Выгрузка своих данных (приемы пищи и тренировки) файлами"""
+    if message.chat.type != "private":
+        await message.answer("Эта команда работает только в личных сообщениях!")
+        return
+
+    args = message.text.split()
+    fmt = args[1].lower() if len(args) > 1 else 'csv'
+    if fmt not in EXPORT_FORMATS:
+        await message.answer("Использование: /export [csv|jsonl|parquet]\nПример: /export csv")
+        return
+
+    status_msg = await message.answer("⏳ Готовлю выгрузку...")
+    try:
+        with tempfile.TemporaryDirectory() as out_dir:
+            # Запись файлов синхронная - выполняем в потоке, чтобы не блокировать бота
+            files = await asyncio.to_thread(
+                export_user_data, calorie_counter.db_path, message.from_user.id, fmt, out_dir
+            )
+            sent = 0
+            for table, paths in files.items():
+                for path in paths:
+                    await message.answer_document(FSInputFile(path), caption=EXPORT_CAPTIONS.get(table, table))
+                    sent += 1
+        await status_msg.edit_text(f"✅ Выгрузка готова ({fmt}, файлов: {sent})")
+    except RuntimeError as e:
+        # Например, для Parquet не установлен pyarrow
+        await status_msg.edit_text(f"❌ {e}")
+    except Exception as e:
+        logger.error(f"Ошибка при выгрузке данных: {e}", exc_info=True)
+        await status_msg.edit_text("Произошла ошибка при выгрузке. Попробуй еще раз.")
+
+
+async def cmd_parse_cache(message: Message):
+    """Статистика и очистка кэша разбора еды (только для администраторов)"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    try:
+        args = message.text.split()
+        cache = calorie_counter.parse_cache
+        if len(args) > 1 and args[1] == 'purge':
+            expired_only = not (len(args) > 2 and args[2] == 'all')
+            deleted = cache.purge(expired_only=expired_only)
+            what = "просроченных" if expired_only else "всех"
+            await message.answer(f"🧹 Кэш очищен: удалено {deleted} {what} записей")
+            return
+        
+        stats = cache.get_stats()
+        text = (
+            "🗄 <b>Кэш разбора еды</b>\n\n"
+            f"Записей: {stats['entries']} (просрочено: {stats['expired']}, в памяти: {stats['memory_entries']})\n"
+            f"Попаданий с запуска: {stats['memory_hits'] + stats['db_hits']} "
+            f"(память {stats['memory_hits']}, база {stats['db_hits']}), промахов: {stats['misses']}\n"
+            f"Hit rate: {stats['hit_rate']:.1f}%\n"
+            f"Попаданий за все время: {stats['total_hits']}\n\n"
+            "<code>/parse_cache purge</code> - удалить просроченные, <code>/parse_cache purge all</code> - все"
+        )
+        await message.answer(text, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Ошибка при работе с кэшем разбора: {e}")
+        await message.answer("Произошла ошибка. Попробуй еще раз.")
+
+
+async def cmd_llm_status(message: Message):
+    """Состояние моделей Groq и расход токенов по версиям промптов (только для администраторов)"""
+    if not is_admin(message.from_user.id):
+        return
+    
+    try:
+        if not llm_client or not llm_client.available:
+            await message.answer("🤖 LLM недоступен (нет GROQ_API_KEY и LLM_LOCAL_BASE_URL)")
+            return
+        
+        stats = llm_client.router.get_stats()
+        state_icons = {'closed': '🟢', 'half_open': '🟡', 'open': '🔴'}
+        lines = ["🤖 <b>Модели Groq</b>\n"]
+        for model in stats:
+            latency = f"{model['latency']:.2f} с" if model['latency'] is not None else "—"
+            lines.append(
+                f"{state_icons.get(model['state'], '')} <code>{model['model']}</code>\n"
+                f"   запросов: {model['requests']}, ошибок: {model['failures']} "
+                f"({model['error_rate']:.0f}% за последние), задержка: {latency}"
+            )
+        if not stats:
+            lines.append("Запросов к моделям с запуска еще не было")
+
+        routes = ", ".join(f"{request_class} → {provider}" for request_class, provider in llm_client.routes.items())
+        lines.append(
+            f"\n🔌 <b>Провайдеры</b>: {', '.join(llm_client.providers)} "
+            f"(по умолчанию {llm_client.default_provider})\n   {routes}"
+        )
+
+        limiter = llm_client.limiter.get_stats()
+        lines.append(
+            f"\n🚦 <b>Очередь</b>: занято {limiter['active']} из {limiter['max_concurrent']}"
+            f", ответов 429: {limiter['rate_limited']}"
+        )
+        if limiter['paused_for'] > 0:
+            lines.append(f"   пауза по лимиту Groq еще {limiter['paused_for']:.0f} с")
+        lane_titles = {'interactive': 'Пользователи', 'background': 'Рассылки'}
+        for name, lane in limiter['lanes'].items():
+            lines.append(
+                f"   {lane_titles.get(name, name)}: в очереди {lane['depth']} (макс. {lane['max_depth']}), "
+                f"ожидание {lane['avg_wait']:.2f} с в среднем, {lane['max_wait']:.1f} с макс."
+            )
+
+        flights = calorie_counter.single_flight.get_stats()
+        if flights['calls'] or flights['shared']:
+            lines.append(
+                f"\n🔗 Одинаковые запросы: выполнено {flights['calls']}, "
+                f"объединено {flights['shared']} (сэкономлено вызовов)"
+            )
+        if calorie_counter.parse_batcher:
+            batching = calorie_counter.parse_batcher.get_stats()
+            lines.append(
+                f"📦 Пакетный разбор: {batching['batched']} сообщений в {batching['batches']} запросах "
+                f"(в среднем {batching['avg_size']:.1f}), повторено по одному {batching['fallbacks']}"
+            )
+        lines.append(f"💬 Пул мотивации: {motivator.pool.size()} пар в запасе")
+
+        # Расход по версиям промптов - для сравнения версий (A/B)
+        usage = llm_client.usage.get_stats(days=7) if llm_client.usage else []
+        if usage:
+            lines.append("\n📝 <b>Промпты за 7 дней</b> (в среднем на запрос)")
+            for row in usage:
+                lines.append(
+                    f"<code>{row['prompt_version']}</code> · {row['model']}\n"
+                    f"   запросов: {row['requests']} (ошибок {row['failures']}), "
+                    f"токены: {row['avg_prompt_tokens']:.0f} + {row['avg_completion_tokens']:.0f}, "
+                    f"{row['avg_latency']:.2f} с"
+                )
+        await message.answer("\n".join(lines), parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Ошибка при получении статуса моделей: {e}")
+        await message.answer("Произошла ошибка. Попробуй еще раз.")
+
+
+def _limit(value: int) -> str:
+    return str(value) if value else "без лимита"
+
+
+async def cmd_llm_budget(message: Message):
+    """Расход дневного бюджета LLM по дням и пользователям (только для администраторов).
+
+    /llm_budget [дней] - по дням и пользователи с наибольшим расходом, /llm_budget user <id> [дней] - один пользователь
+    """
+    if not is_admin(message.from_user.id):
+        return
+    
+    try:
+        budget = llm_client.budget if llm_client else None
+        if not budget:
+            await message.answer("Бюджет LLM не настроен")
+            return
+        
+        args = message.text.split()[1:]
+        if len(args) >= 2 and args[0] == 'user' and args[1].isdigit():
+            user_id = int(args[1])
+            days = int(args[2]) if len(args) > 2 and args[2].isdigit() else 7
+            rows = budget.get_user_days(user_id, days=days)
+            lines = [f"💳 <b>Расход LLM пользователя</b> <code>{user_id}</code> за {days} дн."]
+            for row in rows:
+                lines.append(f"{row['day']}: запросов {row['requests']:.0f}, токенов {row['tokens']}")
+            if not rows:
+                lines.append("Запросов не было")
+            await message.answer("\n".join(lines), parse_mode='HTML')
+            return
+        
+        days = int(args[0]) if args and args[0].isdigit() else 7
+        stats = budget.get_stats(days=days)
+        lines = [
+            "💳 <b>Бюджет LLM на день</b>",
+            f"Пользователь: {_limit(budget.user_requests)} запросов, {_limit(budget.user_tokens)} токенов",
+            f"Всего: {_limit(budget.total_requests)} запросов, {_limit(budget.total_tokens)} токенов",
+            f"Отказов с запуска: {budget.rejected}",
+            f"\n📅 <b>По дням</b> (за {days} дн.)",
+        ]
+        for row in stats['days']:
+            lines.append(
+                f"{row['day']}: запросов {row['requests']:.0f}, токенов {row['tokens']}, пользователей {row['users']}"
+            )
+        if stats['users']:
+            lines.append("\n👤 <b>Больше всего токенов</b> (сегодня / за период)")
+            for row in stats['users']:
+                who = "рассылки и служебные" if row['user_id'] == 0 else f"<code>{row['user_id']}</code>"
+                lines.append(
+                    f"{who}: {row['today_requests']:.0f} / {row['requests']:.0f} запросов, "
+                    f"{row['today_tokens']} / {row['tokens']} токенов"
+                )
+        else:
+            lines.append("Запросов за период не было")
+        lines.append("\n<code>/llm_budget user ID</code> - расход пользователя по дням")
+        await message.answer("\n".join(lines), parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Ошибка при получении расхода бюджета LLM: {e}")
+        await message.answer("Произошла ошибка. Попробуй еще раз.")
+
+
 async def handle_photo(message: Message):
     """Обработка фото со штрих-кодом"""
     if message.chat.type != "private":
@@ -966,7 +1543,7 @@ async def handle_photo(message: Message):
                 logger.debug(f"Не удалось обновить статус: {e}")
         
         # Ищем продукт по штрих-коду (только информацию, без добавления)
-        product_info = await calorie_counter.get_product_info_by_barcode(barcode_data, status_callback=update_status)
+        product_info = await calorie_counter.get_product_info_by_barcode(barcode_data, status_callback=update_status, user_id=user_id)
         
         if product_info.get('success'):
             # Формируем ответ с КБЖУ
@@ -1026,7 +1603,7 @@ async def handle_photo(message: Message):
                     logger.debug(f"Не удалось обновить статус: {e}")
             
             # Пробуем еще раз через все источники
-            product_info = await calorie_counter.get_product_info_by_barcode(barcode_data, status_callback=update_status_retry)
+            product_info = await calorie_counter.get_product_info_by_barcode(barcode_data, status_callback=update_status_retry, user_id=user_id)
             
             if product_info.get('success'):
                 # Если нашли хотя бы название, показываем его
@@ -1147,6 +1724,52 @@ async def handle_web_app_callback(callback: CallbackQuery):
                     pass
             return
         
+        if callback.data.startswith('relog_meal_'):
+            # Повторное добавление прошлого приема пищи из /find
+            try:
+                meal_id = int(callback.data.replace('relog_meal_', ''))
+                user_id = callback.from_user.id
+                result = calorie_counter.relog_meal(user_id, meal_id)
+                if result.get('success'):
+                    await callback.answer("Добавлено")
+                    response, reply_markup = build_meal_added_message(user_id, result)
+                    await callback.message.answer(response, parse_mode='HTML', reply_markup=reply_markup)
+                else:
+                    await callback.answer(result.get('message', 'Не удалось добавить'))
+            except ValueError as e:
+                logger.error(f"Ошибка при парсинге meal_id: {e}, callback.data={callback.data}")
+                await callback.answer("Ошибка: неверный ID приема пищи")
+            except Exception as e:
+                logger.error(f"Ошибка при повторном добавлении приема пищи: {e}", exc_info=True)
+                await callback.answer("Произошла ошибка")
+            return
+        
+        if callback.data.startswith('delete_item_'):
+            # Удаление одного продукта из приема пищи
+            try:
+                item_id = int(callback.data.replace('delete_item_', ''))
+                user_id = callback.from_user.id
+                logger.info(f"Удаление продукта из приема пищи: user_id={user_id}, item_id={item_id}")
+                
+                deleted_item = calorie_counter.delete_meal_item(user_id, item_id)
+                if deleted_item:
+                    await callback.answer(f"Удалено: {deleted_item['name']}")
+                    text, reply_markup = build_today_message(user_id)
+                    try:
+                        await callback.message.edit_text(text, parse_mode='HTML', reply_markup=reply_markup)
+                    except Exception as edit_err:
+                        logger.warning(f"Не удалось отредактировать сообщение: {edit_err}")
+                        await callback.message.answer(text, parse_mode='HTML', reply_markup=reply_markup)
+                else:
+                    await callback.answer("Продукт уже удален")
+            except ValueError as e:
+                logger.error(f"Ошибка при парсинге item_id: {e}, callback.data={callback.data}")
+                await callback.answer("Ошибка: неверный ID продукта")
+            except Exception as e:
+                logger.error(f"Ошибка при удалении продукта из приема пищи: {e}", exc_info=True)
+                await callback.answer("Произошла ошибка при удалении")
+            return
+        
         # Данные от Web App приходят в callback_query.data
         data_str = callback.data
         if not data_str:
@@ -1176,7 +1799,7 @@ async def handle_web_app_callback(callback: CallbackQuery):
                     logger.debug(f"Не удалось обновить статус: {e}")
             
             # Сначала получаем информацию о продукте
-            product_info = await calorie_counter.get_product_info_by_barcode(barcode, status_callback=update_status)
+            product_info = await calorie_counter.get_product_info_by_barcode(barcode, status_callback=update_status, user_id=user_id)
             
             if product_info.get('success'):
                 # Добавляем продукт в дневник
@@ -1288,7 +1911,6 @@ async def handle_text(message: Message):
         # Обработка сообщений о еде в личке
         user_id = message.from_user.id
         text = message.text.strip()
-        text_lower = text.lower()
         
         logger.info(f"[handle_text] Обработка текстового сообщения от {user_id}: '{text}'")
         
@@ -1391,7 +2013,7 @@ async def handle_text(message: Message):
                         except Exception as e:
                             logger.debug(f"Не удалось обновить статус: {e}")
                     
-                    product_info = await calorie_counter.get_product_info_by_barcode(barcode, status_callback=update_status)
+                    product_info = await calorie_counter.get_product_info_by_barcode(barcode, status_callback=update_status, user_id=user_id)
                     
                     if product_info.get('success'):
                         # Проверяем, что название продукта валидное и не пустое
@@ -1466,7 +2088,7 @@ async def handle_text(message: Message):
                                 logger.debug(f"Не удалось обновить статус: {e}")
                         
                         # Пробуем еще раз через все источники
-                        product_info = await calorie_counter.get_product_info_by_barcode(barcode, status_callback=update_status_retry)
+                        product_info = await calorie_counter.get_product_info_by_barcode(barcode, status_callback=update_status_retry, user_id=user_id)
                         
                         if product_info and product_info.get('success'):
                             product_name = product_info.get('name', '').strip()
@@ -1525,90 +2147,30 @@ async def handle_text(message: Message):
             return
         
         
-        # Простая проверка - если сообщение содержит слова про еду или числа с единицами измерения
-        food_keywords = ['г', 'кг', 'мл', 'л', 'шт', 'штук', 'штуки', 'калори', 'ккал', 'еда', 'съел', 'съела', 
-                        'завтрак', 'обед', 'ужин', 'поел', 'поела', 'съела', 'съел', 'конфет', 'конфетка',
-                        'пельмен', 'вареник', 'блин', 'борщ', 'суп', 'салат', 'хлеб', 'мясо', 'рыба', 'куриц',
-                        'яйц', 'молок', 'творог', 'сыр', 'йогурт', 'кефир', 'овсянк', 'гречк', 'рис', 'макарон',
-                        'картошк', 'овощ', 'фрукт', 'яблок', 'банан', 'апельсин', 'мандарин', 'помидор', 'огурц',
-                        'морков', 'капуст', 'лук', 'чеснок', 'перец', 'петрушк', 'укроп', 'сметан', 'майонез',
-                        'масло', 'сахар', 'соль', 'перец', 'специ', 'соус', 'кетчуп', 'горчиц', 'хрен',
-                        'колбас', 'сосиск', 'ветчин', 'бекон', 'свинин', 'говядин', 'баран', 'индейк',
-                        'лосос', 'тунец', 'селедк', 'икр', 'креветк', 'кальмар', 'миди', 'краб',
-                        'творог', 'сметан', 'сливк', 'масло', 'маргарин', 'спред', 'сыр', 'брынз', 'фет',
-                        'йогурт', 'кефир', 'ряженк', 'простокваш', 'варенец', 'тан', 'айран',
-                        'хлеб', 'батон', 'булк', 'бутерброд', 'тост', 'сухар', 'гренк', 'круассан',
-                        'печень', 'торт', 'пирожн', 'конфет', 'шоколад', 'вафел', 'печень', 'кекс', 'маффин',
-                        'морожен', 'желе', 'пудинг', 'мусс', 'крем', 'безе', 'зефир', 'мармелад', 'халв',
-                        'орех', 'миндал', 'фундук', 'грецк', 'кешью', 'фисташк', 'арахис', 'семечк', 'кунжут',
-                        'изюм', 'кураг', 'чернослив', 'финик', 'инжир', 'клюкв', 'брусник', 'облепих',
-                        'чай', 'кофе', 'какао', 'сок', 'компот', 'морс', 'кисел', 'лимонад', 'газировк',
-                        'пиво', 'вино', 'водк', 'коньяк', 'виски', 'ром', 'джин', 'ликер', 'шампанск',
-                        'вод', 'минералк', 'газировк', 'энергетик', 'спортпит', 'протеин', 'гейнер', 'креатин', 
-                        'конфеты', 'батончик', 'печенье', 'йогурт', 'молоко', 'хлеб', 'сыр', 'мясо', 'рыба',
-                        'овощ', 'фрукт', 'яблоко', 'банан', 'овсянка', 'каша', 'суп', 'борщ', 'салат']
-        
-        # Проверяем наличие ключевых слов или паттернов с числами и единицами измерения
-        has_food_keyword = any(keyword in text_lower for keyword in food_keywords)
-        # Улучшенный паттерн для распознавания количества (поддерживает "250гр", "250 г", "250г" и т.д.)
-        has_number_with_unit = bool(re.search(r'\d+\s*(г|кг|мл|л|шт|штук|штуки|грамм|граммов|килограмм|килограммов|миллилитр|литр|штука)', text_lower))
-        
-        # Находим какие именно ключевые слова найдены
-        found_keywords = [kw for kw in food_keywords if kw in text_lower]
-        
-        logger.info(f"[handle_text] Проверка текста '{text}': has_food_keyword={has_food_keyword}, has_number_with_unit={has_number_with_unit}, found_keywords={found_keywords}")
-        
-        if has_food_keyword or has_number_with_unit:
+        # Ключевые слова еды и количество с единицами измерения ("250гр", "250 г") - за один проход
+        features = classify_food_text(text)
+        
+        logger.info(f"[handle_text] Проверка текста '{text}': has_food_keyword={bool(features.keywords)}, has_number_with_unit={features.has_quantity}, found_keywords={list(features.keywords)}")
+        
+        # Сохраненные рецепты пользователя распознаем даже без ключевых слов ("плов бабушкин")
+        has_recipe = not features.looks_like_food and calorie_counter.recipes.match(user_id, text) is not None
+        
+        if features.looks_like_food or has_recipe:
             logger.info(f"[handle_text] Текст распознан как сообщение о еде, начинаю парсинг")
             try:
                 logger.info(f"Обрабатываю сообщение о еде: {message.text}")
-                result = await calorie_counter.add_meal_from_text(user_id, message.text)
+                progress = MealProgress(message)
+                result = await calorie_counter.add_meal_from_text(user_id, message.text,
+                                                                  progress_callback=progress.update)
                 
                 if result['success']:
-                    response = f"✅ Добавлено: {result['calories']} ккал\n"
-                    response += f"📦 {result.get('meal_name', 'Продукт')}\n"
-                    
-                    # Показываем КБЖУ если есть
-                    if result.get('proteins') is not None or result.get('fats') is not None or result.get('carbs') is not None:
-                        response += f"\n📊 <b>КБЖУ:</b>\n"
-                        response += f"🔥 Калории: {result['calories']} ккал\n"
-                        if result.get('proteins') is not None:
-                            response += f"🥩 Белки: {result['proteins']} г\n"
-                        if result.get('fats') is not None:
-                            response += f"🧈 Жиры: {result['fats']} г\n"
-                        if result.get('carbs') is not None:
-                            response += f"🍞 Углеводы: {result['carbs']} г\n"
-                    
-                    # Показываем источник информации
-                    source = result.get('source', 'Неизвестно')
-                    if source:
-                        response += f"\n📡 Источник: {source}\n"
-                    
-                    response += f"\n📊 Всего за сегодня: {result['total_today']} ккал"
-                    
-                    limit = calorie_counter.get_daily_limit(user_id)
-                    if limit:
-                        remaining = limit - result['total_today']
-                        percentage = (result['total_today'] / limit) * 100
-                        response += f"\n🎯 Осталось: {remaining} ккал ({100-percentage:.1f}%)"
-                    
-                    # Добавляем кнопку для удаления только если есть meal_id
-                    meal_id = result.get('meal_id')
-                    if meal_id:
-                        from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
-                        keyboard = InlineKeyboardMarkup(inline_keyboard=[
-                            [InlineKeyboardButton(
-                                text="🗑 Удалить этот продукт",
-                                callback_data=f"delete_meal_{meal_id}"
-                            )]
-                        ])
-                        await message.answer(response, parse_mode='HTML', reply_markup=keyboard)
-                    else:
+                    response, reply_markup = build_meal_added_message(user_id, result)
+                    if not result.get('meal_id'):
                         logger.warning(f"meal_id отсутствует в результате: {result}")
-                        await message.answer(response, parse_mode='HTML')
+                    await progress.finish(response, parse_mode='HTML', reply_markup=reply_markup)
                 else:
                     error_message = result.get('message', 'Не удалось распознать продукты.')
-                    await message.answer(
+                    await progress.finish(
                         f"❌ {error_message}\n\n"
                         f"💡 Попробуй:\n"
                         f"• Указать количество явно: <code>овсянка 200г, банан 1шт</code>\n"
@@ -1619,12 +2181,12 @@ async def handle_text(message: Message):
                 logger.error(f"Ошибка при обработке сообщения о еде: {e}", exc_info=True)
                 await message.answer("Произошла ошибка. Попробуй еще раз.")
         else:
-            logger.info(f"[handle_text] Текст '{text}' не распознан как сообщение о еде (has_food_keyword={has_food_keyword}, has_number_with_unit={has_number_with_unit})")
+            logger.info(f"[handle_text] Текст '{text}' не распознан как сообщение о еде (has_food_keyword={bool(features.keywords)}, has_number_with_unit={features.has_quantity})")
 
 
 async def main():
     """Главная функция"""
-    global bot, dp, db, motivator, calorie_counter
+    global bot, dp, db, motivator, calorie_counter, chart_cache, llm_client
     
     # Загрузка токена из переменной окружения или файла
     import os
@@ -1662,42 +2224,19 @@ async def main():
     # Инициализируем Motivator с API ключом из переменных окружения
     groq_api_key = os.getenv("GROQ_API_KEY")
     
-    # Инициализируем Groq клиент для использования в Motivator и CalorieCounter
-    from groq import Groq
-    groq_client = None
-    
-    if groq_api_key:
-        try:
-            # Инициализируем Groq клиент (в версии 1.0.0 проблема с proxies решена)
-            groq_client = Groq(api_key=groq_api_key)
-            logger.info("✅ Groq клиент инициализирован")
-            
-            # Проверяем что клиент работает, делая тестовый запрос
-            try:
-                test_response = groq_client.chat.completions.create(
-                    model="llama-3.1-8b-instant",
-                    messages=[{"role": "user", "content": "test"}],
-                    max_tokens=5
-                )
-                logger.info("✅ Groq клиент работает для подсчета калорий")
-            except Exception as test_error:
-                logger.warning(f"Groq клиент создан, но тестовый запрос не прошел: {test_error}")
-                logger.warning("Клиент будет использоваться без тестового запроса")
-                # Не обнуляем groq_client, возможно тестовый запрос просто не нужен
-        except Exception as e:
-            logger.error(f"Ошибка при инициализации Groq клиента: {e}", exc_info=True)
-            groq_client = None
-    else:
-        logger.warning("GROQ_API_KEY не найден в переменных окружения. Подсчет калорий будет использовать базовый метод.")
+    # Один асинхронный клиент LLM (провайдеры и маршруты из .env) для Motivator и CalorieCounter
+    llm_client = LLMClient(api_key=groq_api_key, usage=UsageLog(), budget=LLMBudget())
     
-    # Логируем финальный статус Groq клиента
-    if groq_client:
-        logger.info("✅ Groq клиент готов к использованию")
+    if llm_client.available:
+        logger.info(f"✅ LLM клиент готов к использованию: {', '.join(llm_client.providers)}")
+        # Проверочный запрос в фоне, чтобы не задерживать запуск бота
+        llm_check_task = asyncio.create_task(llm_client.check())
     else:
-        logger.error("❌ Groq клиент недоступен! Текстовые сообщения о еде не будут обрабатываться.")
+        logger.error("❌ LLM клиент недоступен! Текстовые сообщения о еде не будут обрабатываться.")
     
-    motivator = Motivator(api_key=groq_api_key)
-    calorie_counter = CalorieCounter(groq_client=groq_client)
+    motivator = Motivator(llm_client=llm_client)
+    calorie_counter = CalorieCounter(llm_client=llm_client)
+    chart_cache = ChartCache()
     
     # Регистрация обработчиков
     # ВАЖНО: Порядок регистрации имеет значение!
@@ -1718,7 +2257,14 @@ async def main():
     dp.message.register(cmd_add_meal, Command("add_meal"))
     dp.message.register(cmd_today, Command("today"))
     dp.message.register(cmd_week, Command("week"))
+    dp.message.register(cmd_month, Command("month"))
+    dp.message.register(cmd_find, Command("find"))
+    dp.message.register(cmd_recipe, Command("recipe"))
     dp.message.register(cmd_set_limit, Command("set_limit"))
+    dp.message.register(cmd_export, Command("export"))
+    dp.message.register(cmd_parse_cache, Command("parse_cache"))
+    dp.message.register(cmd_llm_status, Command("llm_status"))
+    dp.message.register(cmd_llm_budget, Command("llm_budget"))
     
     # Затем регистрируем специфичные обработчики (фото)
     dp.message.register(handle_photo, F.photo)
@@ -1735,6 +2281,7 @@ async def main():
     
     # Настройка планировщика для мотивирующих сообщений
     await setup_scheduler()
+    motivation_pool_task = asyncio.create_task(refill_motivation_pool())
     
     # Запускаем HTTP сервер для webapp (статики)
     async def webapp_handler(request):
@@ -1776,6 +2323,8 @@ async def main():
     finally:
         await runner.cleanup()
         await bot.session.close()
+        await llm_client.close()
+        shutdown_executor()
 
 
 if __name__ == "__main__":
@@ -6,11 +6,43 @@ import aiohttp
 import json
 import asyncio
 from datetime import datetime, date, timedelta
-from typing import Dict, List, Optional
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from food_classifier import classify_food_text
+from food_text import normalize_food_text, normalize_product_name, parse_quantity, split_food_parts
+from recipes import RecipeBook
+from llm_client import LLMClient, DEFAULT_MODELS
+from parse_cache import ParseCache
+from product_kb import ProductKB
+from nutrition_table import get_nutrition_table
+from fuzzy_index import FuzzyIndex
+from food_schema import JSON_RESPONSE_FORMAT, validate_food_response
+from food_stream import ItemStreamParser, json_payload, loads_lenient, parse_food_response
+from parse_batcher import ParseBatcher, MAX_BATCH
+from prompts import PromptTemplate, get_prompt
+from single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
 
+def parse_cache_version(prompt: PromptTemplate) -> str:
+    """Версия для ключа кэша разбора: версия промпта и список моделей"""
+    return f"{prompt.version}:{','.join(DEFAULT_MODELS)}"
+
+
+# Версия кэша для промпта разбора по умолчанию
+PARSE_CACHE_VERSION = parse_cache_version(get_prompt('parse'))
+
+OVER_BUDGET_MESSAGE = (
+    'Дневной лимит запросов к AI исчерпан 😔\n\n'
+    'Продукты из базы (например "овсянка 200г") и твои рецепты по-прежнему считаются. '
+    'Лимит обновится завтра.'
+)
+
+# Продукты, распознанные к этому моменту (при потоковом разборе)
+ProgressCallback = Callable[[List[Dict]], Awaitable[None]]
+
+
 def is_valid_product_name(name: str) -> bool:
     """Проверка, является ли название продукта валидным"""
     if not name or len(name.strip()) < 3:
@@ -48,10 +80,26 @@ def is_valid_product_name(name: str) -> bool:
 
 
 class CalorieCounter:
-    def __init__(self, db_path: str = "fitness_bot.db", groq_client=None):
+    def __init__(self, db_path: str = "fitness_bot.db", llm_client: Optional[LLMClient] = None,
+                 parse_batch_window: Optional[float] = None):
         self.db_path = db_path
-        self.groq_client = groq_client
+        # Если LLM недоступен, работаем так же, как без клиента
+        self.llm_client = llm_client if llm_client is not None and llm_client.available else None
         self.init_database()
+        self.recipes = RecipeBook(db_path)
+        self.parse_cache = ParseCache(db_path)
+        self.product_kb = ProductKB(db_path)
+        self.nutrition_table = get_nutrition_table()
+        self.fuzzy_index = FuzzyIndex(self.nutrition_table.names + self.product_kb.names())
+        # Одинаковые одновременные запросы к Groq (разбор, проверка на еду, штрих-код) - один вызов
+        self.single_flight = SingleFlight()
+        # Разбор сообщений разных пользователей пакетами (включается LLM_PARSE_BATCH_MS в .env)
+        if parse_batch_window is None:
+            parse_batch_window = float(os.getenv("LLM_PARSE_BATCH_MS", 0)) / 1000
+        self.parse_batcher = ParseBatcher(
+            self._request_parse_batch, self._request_parse_single, window=parse_batch_window,
+            max_batch=int(os.getenv("LLM_PARSE_BATCH_SIZE", MAX_BATCH))
+        ) if parse_batch_window > 0 else None
     
     def get_connection(self):
         """Получение соединения с базой данных"""
@@ -96,366 +144,459 @@ class CalorieCounter:
             )
         """)
         
+        # Таблица для отдельных продуктов внутри приема пищи
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS meal_items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                meal_id INTEGER NOT NULL REFERENCES meals(id) ON DELETE CASCADE,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                amount REAL,
+                unit TEXT,
+                calories REAL NOT NULL,
+                proteins REAL,
+                fats REAL,
+                carbs REAL,
+                barcode TEXT,
+                date DATE NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
         # Индексы
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_meals_user_date ON meals(user_id, date)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_meal_items_meal ON meal_items(meal_id)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_meal_items_user_key ON meal_items(user_id, name_key)")
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_meal_items_barcode ON meal_items(barcode)")
+        
+        # Полнотекстовый индекс по истории приемов пищи (для /find)
+        self.fts_enabled = self._init_meals_fts(cursor)
         
         conn.commit()
         conn.close()
     
+    def _init_meals_fts(self, cursor) -> bool:
+        """Создание FTS5-индекса по названиям приемов пищи. Возвращает False, если FTS5 недоступен"""
+        try:
+            cursor.execute("""
+                CREATE VIRTUAL TABLE IF NOT EXISTS meals_fts USING fts5(
+                    meal_name,
+                    user_id UNINDEXED,
+                    tokenize = 'unicode61 remove_diacritics 2'
+                )
+            """)
+        except sqlite3.OperationalError as e:
+            logger.warning(f"FTS5 недоступен, поиск по истории будет работать через LIKE: {e}")
+            return False
+        
+        # Триггеры поддерживают индекс в актуальном состоянии
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS meals_fts_insert AFTER INSERT ON meals BEGIN
+                INSERT INTO meals_fts(rowid, meal_name, user_id) VALUES (new.id, new.meal_name, new.user_id);
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS meals_fts_delete AFTER DELETE ON meals BEGIN
+                DELETE FROM meals_fts WHERE rowid = old.id;
+            END
+        """)
+        cursor.execute("""
+            CREATE TRIGGER IF NOT EXISTS meals_fts_update AFTER UPDATE OF meal_name ON meals BEGIN
+                DELETE FROM meals_fts WHERE rowid = old.id;
+                INSERT INTO meals_fts(rowid, meal_name, user_id) VALUES (new.id, new.meal_name, new.user_id);
+            END
+        """)
+        
+        # Индексируем приемы пищи, добавленные до появления индекса
+        cursor.execute("""
+            INSERT INTO meals_fts(rowid, meal_name, user_id)
+            SELECT id, meal_name, user_id FROM meals
+            WHERE meal_name IS NOT NULL AND id NOT IN (SELECT rowid FROM meals_fts)
+        """)
+        return True
     
-    async def parse_with_groq(self, text: str) -> Optional[Dict]:
-        """Парсинг и подсчет калорий с помощью Groq"""
-        if not self.groq_client:
+    def save_meal(self, user_id: int, meal_name: str, calories: int, source: str,
+                  proteins: Optional[float], fats: Optional[float], carbs: Optional[float],
+                  items: List[Dict], barcode: Optional[str] = None) -> int:
+        """Сохранение приема пищи и всех его продуктов одной транзакцией. Возвращает id приема пищи"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        today = date.today()
+        try:
+            cursor.execute("""
+                INSERT INTO meals (user_id, meal_name, calories, date, source, proteins, fats, carbs)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, meal_name, calories, today, source, proteins, fats, carbs))
+            meal_id = cursor.lastrowid
+            
+            cursor.executemany("""
+                INSERT INTO meal_items (meal_id, user_id, name, name_key, amount, unit,
+                                        calories, proteins, fats, carbs, barcode, date)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (meal_id, user_id, item.get('name', ''), normalize_product_name(item.get('name', '')),
+                 item.get('amount'), item.get('unit'), item.get('calories') or 0,
+                 item.get('proteins'), item.get('fats'), item.get('carbs'),
+                 item.get('barcode') or barcode, today)
+                for item in items
+            ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        return meal_id
+    
+    
+    async def parse_with_groq(self, text: str, names_checked: bool = False,
+                              progress_callback: Optional[ProgressCallback] = None,
+                              user_id: Optional[int] = None) -> Optional[Dict]:
+        """Парсинг и подсчет калорий с помощью Groq.
+        
+        names_checked - названия уже сверены с индексом опечаток, инструкции по исправлению
+        ошибок в промпт не добавляются.
+        progress_callback - ответ запрашивается потоком, и callback получает список продуктов,
+        распознанных к этому моменту (сначала пустой - запрос отправлен).
+        При включенном пакетном разборе сообщение уходит в общий запрос с сообщениями других
+        пользователей, потоком ответ не запрашивается (callback получает только пустой список).
+        user_id - за кого запрос учитывается в дневном бюджете LLM; если бюджет исчерпан,
+        возвращается только результат из кэша, иначе {'success': False, 'over_budget': True}.
+        """
+        if not self.llm_client:
             logger.debug("Groq клиент не доступен, используем базовый парсинг")
             return None
         
-        try:
-            logger.info(f"Отправляю запрос в Groq для парсинга: {text}")
-            prompt = (
-                f"Пользователь написал описание еды: '{text}'\n\n"
-                "ТЫ ДОЛЖЕН ИСПОЛЬЗОВАТЬ ТОЛЬКО РЕАЛЬНЫЕ ДАННЫЕ ИЗ ИНТЕРНЕТА. НЕ ПРИДУМЫВАЙ ЗНАЧЕНИЯ!\n\n"
-                "КРИТИЧЕСКИ ВАЖНО:\n"
-                "1. ИСПРАВЛЕНИЕ ОРФОГРАФИЧЕСКИХ ОШИБОК:\n"
-                "   - Если в тексте есть орфографические ошибки (например 'корнешон' вместо 'корнишон', 'пельмен' вместо 'пельмени'), "
-                "   исправь их и ищи данные для ПРАВИЛЬНО НАПИСАННОГО продукта\n"
-                "   - Используй правильное название продукта в поле 'name'\n"
-                "   - Примеры исправлений: 'корнешон' → 'корнишон', 'пельмен' → 'пельмени', 'вареник' → 'вареники'\n\n"
-                "2. НЕ РАЗБИВАТЬ НА КОМПОНЕНТЫ И ПРАВИЛЬНОЕ КОЛИЧЕСТВО:\n"
-                "   - Если это ГОТОВОЕ БЛЮДО из ресторана/фастфуда (например 'чизбургер из KFC', 'чизбургер из Burger King', 'бургер из Макдональдс'), "
-                "   ищи КБЖУ для ГОТОВОГО БЛЮДА целиком, НЕ разбивай на компоненты!\n"
-                "   - Ищи данные на официальных сайтах ресторанов или в базах данных готовых блюд\n"
-                "   - КРИТИЧЕСКИ ВАЖНО: Если готовое блюдо указано как '1шт', '1 порция', '1 порц' (например 'чизбургер Burger King 1шт', 'ЧикенБургер 1 порция', 'чизбургер из Rostics 1 порция'), "
-                "   ищи КБЖУ для ОДНОЙ ПОРЦИИ готового блюда, НЕ используй данные на 100г!\n"
-                "   - Для готовых блюд из ресторанов '1шт', '1 порция', '1 порц' означают ОДНУ ПОРЦИЮ готового блюда, а не 100г!\n"
-                "   - Пример: чизбургер Burger King 1шт = ~312-330 ккал (одна порция), а НЕ 540 ккал (это было бы на 100г или двойной чизбургер)\n"
-                "   - Пример: ЧикенБургер McDonald's 1 порция = ~350 ккал (одна порция), а НЕ данные на 100г!\n"
-                "   - Пример: классический чизбургер Rostics/Ростик'с 1шт = ~240 ккал (одна порция 130-140г), а НЕ 400+ ккал!\n"
-                "   - Пример: ЧикенБургер Rostics/Ростик'с 1шт = ~375 ккал (одна порция 135-150г), а НЕ данные на 100г!\n"
-                "   - НЕ разбивай готовые блюда на компоненты (хлеб, сыр, мясо отдельно) - ищи данные для готового продукта!\n"
-                "   - НЕ разбивай сложные блюда на ингредиенты, если это готовое блюдо (пицца, роллы, сэндвичи, салаты из ресторанов)\n\n"
-                "3. ФИЛЬТРАЦИЯ СТРАННЫХ ПРОДУКТОВ:\n"
-                "   - НЕ добавляй продукты с нулевыми значениями КБЖУ (0 калорий, 0 белков, 0 жиров, 0 углеводов)\n"
-                "   - НЕ добавляй несуществующие или выдуманные продукты\n"
-                "   - Если не можешь найти реальные данные - верни пустой массив []\n\n"
-                "Распознай все продукты и их количество из этого текста. "
-                "Для каждого продукта найди ТОЧНЫЕ данные КБЖУ из проверенных источников (USDA FoodData Central, Open Food Facts, официальные сайты производителей/ресторанов, базы данных продуктов питания).\n\n"
-                "ВАЖНО: Если продукт указан без явного количества (например 'пельмени 250гр' или 'пельмени 250г'), "
-                "распознай количество из текста (250г) и найди КБЖУ для этого количества. "
-                "Если количество не указано, используй стандартную порцию (например, для пельменей - 100г или стандартная порция из базы данных).\n"
-                "Для готовых блюд из ресторанов (бургеры, пицца, роллы и т.д.):\n"
-                "- Если указано '1шт', '1 порция', '1 порц' - ищи КБЖУ для ОДНОЙ ПОРЦИИ готового блюда (НЕ на 100г!)\n"
-                "- '1 порция' = '1шт' = одна порция готового блюда, НЕ 100г!\n"
-                "- Если указано количество в граммах (например 'бургер 200г') - используй это количество\n"
-                "- НЕ используй данные на 100г для готовых блюд, если указано '1шт' или '1 порция'!\n"
-                "- Ищи данные для ГОТОВОГО БЛЮДА, не разбивай на компоненты!\n"
-                "- Для бургеров из McDonald's, Burger King, KFC, Rostics ищи данные для ОДНОЙ ПОРЦИИ на официальных сайтах!\n\n"
-                "Верни ответ ТОЛЬКО в формате JSON массива, где каждый элемент это объект с полями:\n"
-                "- name: название продукта (на русском, точное название бренда и продукта если указано)\n"
-                "- amount: количество (число, точное значение из текста или стандартная порция)\n"
-                "- unit: единица измерения ('г', 'мл', 'шт', 'кг', 'л')\n"
-                "- calories: калории для этого количества (число, ТОЧНОЕ значение из интернета)\n"
-                "- proteins: белки в граммах для этого количества (число, ОБЯЗАТЕЛЬНО, точное значение)\n"
-                "- fats: жиры в граммах для этого количества (число, ОБЯЗАТЕЛЬНО, точное значение)\n"
-                "- carbs: углеводы в граммах для этого количества (число, ОБЯЗАТЕЛЬНО, точное значение)\n"
-                "- source: источник информации (строка, например 'USDA FoodData Central', 'Open Food Facts', 'Официальный сайт производителя')\n\n"
-                "КРИТИЧЕСКИ ВАЖНО:\n"
-                "- НЕ ПРИДУМЫВАЙ данные! Используй ТОЛЬКО реальные значения из интернета\n"
-                "- Если не можешь найти точные данные для продукта, верни пустой массив []\n"
-                "- Для каждого продукта ОБЯЗАТЕЛЬНО указывай ВСЕ три значения: proteins, fats, carbs\n"
-                "- Если продукт указан без количества (например 'конфету Raffaelo'), найди стандартный вес одной штуки в интернете\n"
-                "- Указывай точный источник данных (не просто 'Интернет', а конкретный источник)\n"
-                "- Значения должны быть реалистичными (например, конфета не может иметь 500 ккал на 1шт)\n"
-                "- Для готовых блюд из ресторанов проверяй реалистичность:\n"
-                "  * Стандартный чизбургер Burger King ~312-330 ккал на 1шт (НЕ 540 ккал!)\n"
-                "  * Классический чизбургер Rostics/Ростик'с ~240 ккал на 1шт (НЕ 400+ ккал!)\n"
-                "  * ЧикенБургер Rostics/Ростик'с ~375 ккал на 1шт (НЕ 500+ ккал!)\n"
-                "  * ЧикенБургер McDonald's ~350 ккал на 1шт (НЕ 500+ ккал!)\n"
-                "- Если находишь данные, которые кажутся слишком большими для '1шт' или '1 порция' готового блюда, проверь - возможно это данные на 100г или двойная порция!\n"
-                "- КРИТИЧЕСКИ ВАЖНО: Когда ищешь данные для готового блюда с указанием '1шт' или '1 порция', НЕ используй данные на 100г!\n"
-                "- Ищи на официальных сайтах ресторанов данные для ОДНОЙ ПОРЦИИ готового блюда!\n"
-                "- Для Rostics/Ростик'с: классический чизбургер = ~240 ккал, ЧикенБургер = ~375 ккал!\n"
-                "- Примеры правильных значений для ОДНОЙ ПОРЦИИ:\n"
-                "  * ЧикенБургер McDonald's 1шт = ~350 ккал (НЕ 500+ ккал!)\n"
-                "  * Чизбургер Burger King 1шт = ~312 ккал (НЕ 500+ ккал!)\n"
-                "  * Чизбургер Rostics/Ростик'с 1шт = ~240 ккал (НЕ 400+ ккал! Это классический чизбургер)\n"
-                "  * ЧикенБургер Rostics/Ростик'с 1шт = ~375 ккал (НЕ 500+ ккал!)\n"
-                "  * Чизбургер Де Люкс Rostics = ~350+ ккал (это другой бургер, не классический!)\n\n"
-                "Примеры правильных ответов:\n"
-                'Для "овсянка 200г": [{"name": "овсянка", "amount": 200, "unit": "г", "calories": 778, "proteins": 26, "fats": 14, "carbs": 138, "source": "USDA FoodData Central"}]\n'
-                'Для "конфету Raffaelo": [{"name": "Raffaello", "amount": 1, "unit": "шт", "calories": 61, "proteins": 1.1, "fats": 4.5, "carbs": 4.8, "source": "Официальный сайт Ferrero"}]\n'
-                'Для "пельмени 250гр" или "пельмени 250г": [{"name": "пельмени", "amount": 250, "unit": "г", "calories": 625, "proteins": 25, "fats": 20, "carbs": 75, "source": "База данных продуктов питания / USDA FoodData Central"}]\n'
-                'Для "пельмени" (без количества): [{"name": "пельмени", "amount": 100, "unit": "г", "calories": 250, "proteins": 10, "fats": 8, "carbs": 30, "source": "База данных продуктов питания"}]\n'
-                'Для "корнишон 5шт" или "корнишон 5 шт": [{"name": "корнишон", "amount": 5, "unit": "шт", "calories": 5, "proteins": 0.3, "fats": 0.1, "carbs": 1, "source": "USDA FoodData Central"}]\n'
-                'Для "корнешон 5шт" (с ошибкой): [{"name": "корнишон", "amount": 5, "unit": "шт", "calories": 5, "proteins": 0.3, "fats": 0.1, "carbs": 1, "source": "USDA FoodData Central"}]\n'
-                '   (Обрати внимание: исправлена ошибка "корнешон" → "корнишон")\n'
-                'Для "чизбургер из KFC 1шт": [{"name": "чизбургер KFC", "amount": 1, "unit": "шт", "calories": 540, "proteins": 30, "fats": 30, "carbs": 40, "source": "Официальный сайт KFC"}]\n'
-                'Для "чизбургер Burger King 1шт": [{"name": "чизбургер Burger King", "amount": 1, "unit": "шт", "calories": 312, "proteins": 16, "fats": 12, "carbs": 27, "source": "Официальный сайт Burger King"}]\n'
-                'Для "ЧикенБургер 1 порция": [{"name": "ЧикенБургер McDonald\'s", "amount": 1, "unit": "шт", "calories": 350, "proteins": 25, "fats": 15, "carbs": 30, "source": "Официальный сайт McDonald\'s"}]\n'
-                'Для "чизбургер из Rostics 1 порция": [{"name": "чизбургер Rostics", "amount": 1, "unit": "шт", "calories": 240, "proteins": 12.5, "fats": 9, "carbs": 26, "source": "Официальный сайт Rostics"}]\n'
-                'Для "чизбургер из Ростик\'с 1 порция": [{"name": "чизбургер Ростик\'с", "amount": 1, "unit": "шт", "calories": 240, "proteins": 12.5, "fats": 9, "carbs": 26, "source": "Официальный сайт Ростик\'с"}]\n'
-                'Для "ЧикенБургер из Rostics 1 порция": [{"name": "ЧикенБургер Rostics", "amount": 1, "unit": "шт", "calories": 375, "proteins": 16.5, "fats": 14.5, "carbs": 39, "source": "Официальный сайт Rostics"}]\n'
-                'Для "ЧикенБургер из Ростик\'с 1 порция": [{"name": "ЧикенБургер Ростик\'с", "amount": 1, "unit": "шт", "calories": 375, "proteins": 16.5, "fats": 14.5, "carbs": 39, "source": "Официальный сайт Ростик\'с"}]\n'
-                '   (Обрати внимание: это данные для ОДНОЙ ПОРЦИИ готового блюда, НЕ на 100г! "1 порция" = "1шт" = одна порция!)\n'
-                'Для "чизбургер из Rostiks 1шт": [{"name": "чизбургер Rostiks", "amount": 1, "unit": "шт", "calories": 450, "proteins": 25, "fats": 22, "carbs": 38, "source": "База данных готовых блюд / Официальный сайт Rostiks"}]\n'
-                '   (Обрати внимание: НЕ разбивай на компоненты! Ищи данные для готового блюда целиком! Для "1шт" или "1 порция" - данные для ОДНОЙ ПОРЦИИ, а не на 100г!)\n\n'
-                "ВАЖНО:\n"
-                "- Исправляй орфографические ошибки в названиях продуктов\n"
-                "- Для готовых блюд из ресторанов НЕ разбивай на компоненты! Ищи данные для готового блюда целиком!\n"
-                "- НЕ добавляй продукты с нулевыми значениями КБЖУ\n\n"
-                "Если не можешь найти точные данные - верни пустой массив []. "
-                "Ответ должен быть ТОЛЬКО JSON массивом, без дополнительного текста."
+        prompt = get_prompt('parse', text)
+        cache_version = parse_cache_version(prompt)
+        cached = self.parse_cache.get(text, cache_version)
+        if not cached and self.parse_batcher:
+            # Разобранное в пакете лежит в кэше под версией пакетного промпта
+            cached = self.parse_cache.get(text, parse_cache_version(get_prompt('parse_batch')))
+        if cached:
+            logger.info(f"Результат разбора взят из кэша: {text}")
+            return cached
+        
+        if not self.llm_client.admits([user_id]):
+            logger.info(f"Дневной бюджет LLM исчерпан, без разбора через Groq: {text}")
+            return {'success': False, 'over_budget': True}
+        
+        if progress_callback:
+            await progress_callback([])
+        key = f"parse:{cache_version}:{names_checked}:{normalize_food_text(text)}"
+        # Объединенный запрос учитывается в бюджете за всех, кто его ждет (список пополняется до ответа)
+        users = self.single_flight.members(key)
+        if self.parse_batcher:
+            return await self.single_flight.do(
+                key, lambda: self.parse_batcher.submit((text, names_checked, users)), member=user_id
             )
+        # Продукты по мере ответа получают все, кто ждет этот разбор, а не только отправивший запрос
+        progress = self.single_flight.notifier(key) if progress_callback else None
+        return await self.single_flight.do(
+            key, lambda: self._request_parse(text, prompt, cache_version, names_checked, progress, users),
+            listener=progress_callback, member=user_id
+        )
+    
+    async def _request_parse_single(self, request: Tuple[str, bool, Sequence[Optional[int]]]) -> Optional[Dict]:
+        """Отдельный запрос разбора: сообщение пришло одно за окно или не разобрано в пакете"""
+        text, names_checked, users = request
+        prompt = get_prompt('parse', text)
+        return await self._request_parse(text, prompt, parse_cache_version(prompt), names_checked, users=users)
+    
+    async def _request_parse_batch(self, requests: List[Tuple[str, bool, Sequence[Optional[int]]]]) -> Dict[int, Dict]:
+        """Разбор нескольких сообщений одним запросом.
+        
+        Результаты по номеру сообщения в requests; сообщения без ответа, с ответом не по схеме
+        или без валидных продуктов в результат не попадают (ParseBatcher повторит их по одному).
+        """
+        texts = [text for text, _, _ in requests]
+        prompt = get_prompt('parse_batch')
+        cache_version = parse_cache_version(prompt)
+        numbered = '\n'.join(f"{number}: {' '.join(text.split())}" for number, text in enumerate(texts, 1))
+        logger.info(f"Отправляю пакетный запрос в Groq для парсинга ({prompt.version}): {len(texts)} сообщений")
+        response = await self.llm_client.complete_first(
+            prompt.render(numbered, names_checked=all(checked for _, checked, _ in requests), count=len(texts)),
+            request_class='parse',
+            temperature=0.1,
+            max_tokens=min(prompt.max_tokens, sum(prompt.max_tokens_for(text) for text in texts)),
+            prompt_version=prompt.version,
+            response_format=JSON_RESPONSE_FORMAT,
+            users=[user_id for _, _, users in requests for user_id in users]
+        )
+        data = loads_lenient(json_payload(response['text']))
+        entries = data.get('results') if isinstance(data, dict) else None
+        if not isinstance(entries, list):
+            raise ValueError(f"в пакетном ответе нет массива results: {response['text'][:200]}")
+        
+        results = {}
+        for entry in entries:
+            number = entry.get('id') if isinstance(entry, dict) else None
+            if isinstance(number, str) and number.strip().isdigit():
+                number = int(number)
+            if not isinstance(number, int) or isinstance(number, bool) or not 1 <= number <= len(texts):
+                logger.warning(f"Пакетный ответ: неизвестный номер сообщения {entry!r}"[:300])
+                continue
+            try:
+                is_food, items = validate_food_response(entry)
+            except ValueError as e:
+                logger.warning(f"Пакетный ответ для сообщения {number} не соответствует схеме: {e}")
+                continue
+            result = self._parse_result(texts[number - 1], cache_version, is_food, items)
+            if result is not None:
+                results[number - 1] = result
+        logger.info(f"Пакетный разбор: получено {len(results)} из {len(texts)}")
+        return results
+    
+    async def _request_parse(self, text: str, prompt: PromptTemplate, cache_version: str,
+                             names_checked: bool,
+                             progress_callback: Optional[ProgressCallback] = None,
+                             users: Sequence[Optional[int]] = ()) -> Optional[Dict]:
+        """Запрос разбора в Groq, проверка ответа и сохранение в кэш"""
+        params = {'response_format': JSON_RESPONSE_FORMAT}
+        if progress_callback:
+            # JSON-режим Groq не работает с потоковым ответом: JSON просит промпт, схему проверяем сами
+            parser = ItemStreamParser()
             
-            # Пробуем использовать более мощную модель, если доступна
-            # llama-3.3-70b-versatile - более точная модель (70B параметров)
-            # llama-3.1-70b-versatile - альтернатива
-            # llama-3.1-8b-instant - быстрая, но менее точная (fallback)
-            models_to_try = [
-                "llama-3.3-70b-versatile",  # Самая мощная бесплатная модель Groq
-                "llama-3.1-70b-versatile",  # Альтернатива
-                "llama-3.1-8b-instant"       # Fallback на быструю модель
-            ]
-            
-            response = None
-            last_error = None
-            
-            for model_name in models_to_try:
-                try:
-                    logger.info(f"Пробуем модель: {model_name}")
-                    response = self.groq_client.chat.completions.create(
-                        model=model_name,
-                        messages=[
-                            {"role": "system", "content": "Ты помощник для подсчета калорий. Ты используешь ТОЛЬКО реальные данные из интернета (USDA, Open Food Facts, официальные сайты). НЕ ПРИДУМЫВАЙ значения! Исправляй орфографические ошибки в названиях продуктов. Для готовых блюд из ресторанов НЕ разбивай на компоненты - ищи данные для готового блюда целиком. КРИТИЧЕСКИ ВАЖНО: Если готовое блюдо указано как '1шт', '1 порция' или '1 порц' - ищи КБЖУ для ОДНОЙ ПОРЦИИ готового блюда, НЕ используй данные на 100г! '1 порция' = '1шт' = одна порция готового блюда! НЕ добавляй продукты с нулевыми значениями КБЖУ. Проверяй реалистичность данных. Если не можешь найти точные данные - верни пустой массив []. Всегда отвечаешь только валидным JSON массивом без дополнительного текста."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.1,  # Снижаем температуру для более точных ответов
-                        max_tokens=800  # Увеличиваем для более детальных ответов
-                    )
-                    logger.info(f"Успешно использована модель: {model_name}")
-                    break  # Успешно получили ответ
-                except Exception as e:
-                    logger.warning(f"Модель {model_name} недоступна: {e}")
-                    last_error = e
-                    continue  # Пробуем следующую модель
-            
-            if not response:
-                raise Exception(f"Все модели недоступны. Последняя ошибка: {last_error}")
-            
-            logger.info(f"Получен ответ от Groq: {response.choices[0].message.content[:200]}")
+            async def on_text(partial: str):
+                if parser.feed(partial):
+                    await progress_callback(list(parser.items))
             
-            import json
-            result_text = response.choices[0].message.content.strip()
+            params = {'on_text': on_text}
+        try:
+            logger.info(f"Отправляю запрос в Groq для парсинга ({prompt.version}): {text}")
+            response = await self.llm_client.complete_first(
+                prompt.render(text, names_checked=names_checked),
+                request_class='parse',
+                temperature=0.1,  # Снижаем температуру для более точных ответов
+                max_tokens=prompt.max_tokens_for(text),
+                prompt_version=prompt.version,
+                users=users,
+                **params
+            )
             
-            # Убираем markdown код блоки если есть
-            if result_text.startswith('```'):
-                lines = result_text.split('\n')
-                result_text = '\n'.join(lines[1:-1]) if len(lines) > 2 else result_text
+            logger.info(f"Получен ответ от Groq: {response['text'][:200]}")
             
-            # Пытаемся извлечь JSON из ответа
+            # Схему проверяем сами (в потоковом ответе JSON берем из текста); из обрезанного или
+            # испорченного ответа берем все целые продукты, а не повторяем запрос
             try:
-                parsed = json.loads(result_text)
-                # Если это объект с массивом внутри
-                if isinstance(parsed, dict):
-                    # Ищем массив в значениях
-                    items = None
-                    for key, value in parsed.items():
-                        if isinstance(value, list):
-                            items = value
-                            break
-                    # Или может быть ключ "items" или "products"
-                    if not items:
-                        items = parsed.get('items') or parsed.get('products') or parsed.get('food')
-                    if not items:
-                        return None
-                elif isinstance(parsed, list):
-                    items = parsed
-                else:
-                    return None
-                
-                # Проверяем структуру
-                if not items or not isinstance(items, list) or len(items) == 0:
-                    logger.warning("Groq вернул пустой массив или невалидные данные")
-                    return None
-                
-                # Валидируем и обрабатываем элементы
-                valid_items = []
-                sources = []
-                for item in items:
-                    if isinstance(item, dict) and 'name' in item:
-                        product_name = item.get('name', '').lower()
-                        
-                        # Фильтруем явно не-еду
-                        invalid_words = ['какаш', 'письк', 'говн', 'дерьм', 'хуй', 'пизд', 'ебан', 'бляд']
-                        if any(word in product_name for word in invalid_words):
-                            logger.warning(f"Пропущен невалидный продукт: {item.get('name')}")
-                            continue
-                        
-                        # Проверяем что есть хотя бы калории
-                        calories = item.get('calories', 0)
-                        proteins = item.get('proteins', 0)
-                        fats = item.get('fats', 0)
-                        carbs = item.get('carbs', 0)
-                        
-                        # Если все значения нули - пропускаем (это не реальный продукт)
-                        if calories == 0 and proteins == 0 and fats == 0 and carbs == 0:
-                            logger.warning(f"Пропущен продукт с нулевыми значениями: {item.get('name')}")
-                            continue
-                        
-                        # Проверяем реалистичность данных
-                        # Если калории есть, но КБЖУ все нули - подозрительно
-                        if calories > 0 and proteins == 0 and fats == 0 and carbs == 0:
-                            logger.warning(f"Подозрительные данные от Groq для {item.get('name')}: калории есть, но КБЖУ все нули")
-                            # Пропускаем этот продукт или используем базовые значения
-                            continue
-                        
-                        # Проверяем что значения реалистичны
-                        if calories > 0:
-                            # Примерная проверка: калории должны быть примерно = белки*4 + жиры*9 + углеводы*4
-                            estimated_calories = proteins * 4 + fats * 9 + carbs * 4
-                            if abs(calories - estimated_calories) > calories * 0.3:  # Разница не более 30%
-                                logger.warning(f"Несоответствие калорий и КБЖУ для {item.get('name')}: калории={calories}, расчетные={estimated_calories}")
-                        
-                        valid_items.append({
-                            'name': item.get('name', ''),
-                            'amount': item.get('amount', 0),
-                            'unit': item.get('unit', 'г'),
-                            'calories': calories,
-                            'proteins': proteins,
-                            'fats': fats,
-                            'carbs': carbs,
-                            'source': item.get('source', 'Groq AI')
-                        })
-                        if item.get('source'):
-                            sources.append(item.get('source'))
-                
-                # Если после валидации не осталось валидных продуктов
-                if not valid_items:
-                    logger.warning("После валидации не осталось валидных продуктов от Groq")
-                    return None
-                
-                total_calories = sum(item.get('calories', 0) for item in valid_items)
-                total_proteins = sum(item.get('proteins', 0) for item in valid_items)
-                total_fats = sum(item.get('fats', 0) for item in valid_items)
-                total_carbs = sum(item.get('carbs', 0) for item in valid_items)
-                meal_name = ', '.join([f"{item['name']} {item['amount']}{item['unit']}" for item in valid_items])
-                
-                # Определяем источник (если все из одного источника, используем его, иначе "Groq AI")
-                unique_sources = list(set(sources))
-                if len(unique_sources) == 1:
-                    source = unique_sources[0]
-                elif len(unique_sources) > 1:
-                    source = f"Groq AI ({', '.join(unique_sources)})"
-                else:
-                    source = "Groq AI"
-                
-                return {
-                    'success': True,
-                    'items': valid_items,
-                    'calories': int(total_calories),
-                    'meal_name': meal_name,
-                    'proteins': round(total_proteins, 1) if total_proteins > 0 else None,
-                    'fats': round(total_fats, 1) if total_fats > 0 else None,
-                    'carbs': round(total_carbs, 1) if total_carbs > 0 else None,
-                    'source': source
-                }
-            except json.JSONDecodeError as e:
-                logger.error(f"Не удалось распарсить JSON от Groq: {result_text[:200]}... Ошибка: {e}")
-                logger.error(f"Полный ответ от Groq: {result_text}")
+                is_food, items, complete = parse_food_response(response['text'])
+            except ValueError as e:  # json.JSONDecodeError - тоже ValueError
+                logger.error(f"Ответ Groq не соответствует схеме: {e}. Ответ: {response['text'][:500]}")
                 return None
+            
+            return self._parse_result(text, cache_version, is_food, items, cache=complete)
                 
         except Exception as e:
             logger.error(f"Ошибка при использовании Groq для парсинга еды: {e}", exc_info=True)
             return None
     
-    async def is_food_related(self, text: str) -> bool:
-        """Проверка, относится ли текст к еде"""
-        text_lower = text.lower().strip()
+    def _parse_result(self, text: str, cache_version: str, is_food: bool, items: List[Dict],
+                      cache: bool = True) -> Optional[Dict]:
+        """Результат разбора по проверенному ответу модели; удачный разбор сохраняется в кэш.
         
-        # Список явно не-еды (бранные слова, оскорбления, нецензурные слова)
-        invalid_words = ['какаш', 'письк', 'говн', 'дерьм', 'хуй', 'пизд', 'ебан', 'бляд', 'сука', 
-                        'мудак', 'долбоеб', 'идиот', 'дурак', 'лох', 'лошар', 'кретин', 'дебил']
+        cache=False - ответ восстановлен частично: результат не кэшируется, чтобы следующий
+        такой же запрос получил полный ответ.
+        """
+        if not is_food:
+            logger.info(f"Groq: текст '{text}' не относится к еде")
+            return {'success': False, 'is_food': False}
         
-        # Проверяем на явно не-еду
-        if any(word in text_lower for word in invalid_words):
-            logger.info(f"Текст '{text}' содержит нецензурные/неподходящие слова")
-            return False
+        if not items:
+            logger.warning("Groq вернул пустой массив или невалидные данные")
+            return None
+        
+        # Валидируем и обрабатываем элементы
+        valid_items = []
+        sources = []
+        for item in items:
+            # Фильтруем явно не-еду
+            product_name = item['name'].lower()
+            invalid_words = ['какаш', 'письк', 'говн', 'дерьм', 'хуй', 'пизд', 'ебан', 'бляд']
+            if any(word in product_name for word in invalid_words):
+                logger.warning(f"Пропущен невалидный продукт: {item['name']}")
+                continue
+            
+            calories, proteins, fats, carbs = item['calories'], item['proteins'], item['fats'], item['carbs']
+            
+            # Если все значения нули - пропускаем (это не реальный продукт)
+            if calories == 0 and proteins == 0 and fats == 0 and carbs == 0:
+                logger.warning(f"Пропущен продукт с нулевыми значениями: {item['name']}")
+                continue
+            
+            # Если калории есть, но КБЖУ все нули - подозрительно
+            if calories > 0 and proteins == 0 and fats == 0 and carbs == 0:
+                logger.warning(f"Подозрительные данные от Groq для {item['name']}: калории есть, но КБЖУ все нули")
+                continue
+            
+            # Примерная проверка: калории должны быть примерно = белки*4 + жиры*9 + углеводы*4
+            estimated_calories = proteins * 4 + fats * 9 + carbs * 4
+            if abs(calories - estimated_calories) > calories * 0.3:  # Разница не более 30%
+                logger.warning(f"Несоответствие калорий и КБЖУ для {item['name']}: калории={calories}, расчетные={estimated_calories}")
+            
+            valid_items.append(item)
+            sources.append(item['source'])
+        
+        # Если после валидации не осталось валидных продуктов
+        if not valid_items:
+            logger.warning("После валидации не осталось валидных продуктов от Groq")
+            return None
+        
+        total_calories = sum(item['calories'] for item in valid_items)
+        total_proteins = sum(item['proteins'] for item in valid_items)
+        total_fats = sum(item['fats'] for item in valid_items)
+        total_carbs = sum(item['carbs'] for item in valid_items)
+        meal_name = ', '.join([f"{item['name']} {item['amount']}{item['unit']}" for item in valid_items])
+        
+        # Определяем источник (если все из одного источника, используем его, иначе "Groq AI")
+        unique_sources = list(set(sources))
+        if len(unique_sources) == 1:
+            source = unique_sources[0]
+        elif len(unique_sources) > 1:
+            source = f"Groq AI ({', '.join(unique_sources)})"
+        else:
+            source = "Groq AI"
+        
+        result = {
+            'success': True,
+            'is_food': True,
+            'items': valid_items,
+            'calories': int(total_calories),
+            'meal_name': meal_name,
+            'proteins': round(total_proteins, 1) if total_proteins > 0 else None,
+            'fats': round(total_fats, 1) if total_fats > 0 else None,
+            'carbs': round(total_carbs, 1) if total_carbs > 0 else None,
+            'source': source
+        }
+        if cache:
+            self.parse_cache.set(text, cache_version, result)
+        self.product_kb.learn_items(valid_items)
+        self.fuzzy_index.add_names(item['name'] for item in valid_items)
+        return result
+    
+    @staticmethod
+    def _summarize_items(items: List[Dict]) -> Dict:
+        """Результат в формате parse_with_groq по готовому списку продуктов"""
+        total_proteins = sum(item.get('proteins') or 0 for item in items)
+        total_fats = sum(item.get('fats') or 0 for item in items)
+        total_carbs = sum(item.get('carbs') or 0 for item in items)
+        sources = sorted({item.get('source') or 'Groq AI' for item in items})
+        return {
+            'success': True,
+            'items': items,
+            'calories': int(sum(item.get('calories') or 0 for item in items)),
+            'meal_name': ', '.join(f"{item['name']} {item['amount']}{item['unit']}" for item in items),
+            'proteins': round(total_proteins, 1) if total_proteins > 0 else None,
+            'fats': round(total_fats, 1) if total_fats > 0 else None,
+            'carbs': round(total_carbs, 1) if total_carbs > 0 else None,
+            'source': ' + '.join(sources)
+        }
+    
+    def parse_locally(self, text: str) -> tuple:
+        """Локальный разбор: встроенная таблица КБЖУ, затем база продуктов (с исправлением опечаток).
         
-        # Расширенный список ключевых слов для продуктов питания
-        food_keywords = [
-            'г', 'кг', 'мл', 'л', 'шт', 'штук', 'штуки', 'калори', 'ккал', 'еда', 'съел', 'съела',
-            'завтрак', 'обед', 'ужин', 'поел', 'поела', 'конфет', 'пельмен', 'вареник', 'блин',
-            'хлеб', 'мясо', 'рыба', 'овощ', 'фрукт', 'молоко', 'сыр', 'йогурт', 'кефир', 'творог',
-            'овсянк', 'гречк', 'рис', 'макарон', 'картошк', 'помидор', 'огурц', 'морков', 'капуст',
-            'яблок', 'банан', 'апельсин', 'мандарин', 'борщ', 'суп', 'салат', 'куриц', 'яйц',
-            'сметан', 'майонез', 'масло', 'сахар', 'соль', 'соус', 'кетчуп', 'горчиц',
-            'колбас', 'сосиск', 'ветчин', 'бекон', 'свинин', 'говядин', 'баран', 'индейк',
-            'лосос', 'тунец', 'селедк', 'икр', 'креветк', 'кальмар', 'миди', 'краб',
-            'сливк', 'маргарин', 'спред', 'брынз', 'фет', 'ряженк', 'простокваш', 'варенец',
-            'батон', 'булк', 'бутерброд', 'тост', 'сухар', 'гренк', 'круассан',
-            'печень', 'торт', 'пирожн', 'шоколад', 'вафел', 'кекс', 'маффин',
-            'морожен', 'желе', 'пудинг', 'мусс', 'крем', 'безе', 'зефир', 'мармелад', 'халв',
-            'орех', 'миндал', 'фундук', 'грецк', 'кешью', 'фисташк', 'арахис', 'семечк', 'кунжут',
-            'изюм', 'кураг', 'чернослив', 'финик', 'инжир', 'клюкв', 'брусник', 'облепих',
-            'чай', 'кофе', 'какао', 'сок', 'компот', 'морс', 'кисел', 'лимонад', 'газировк',
-            'пиво', 'вино', 'водк', 'коньяк', 'виски', 'ром', 'джин', 'ликер', 'шампанск',
-            'вод', 'минералк', 'энергетик', 'спортпит', 'протеин', 'гейнер', 'креатин',
-            'батончик', 'печенье', 'каша', 'ростагроэкспорт', 'ростик', 'макдональдс', 'burger king',
-            'kfc', 'чизбургер', 'бургер', 'чикенбургер', 'чикен бургер'
-        ]
-        
-        # Сначала проверяем явные признаки еды (более надежно)
-        has_food_keyword = any(keyword in text_lower for keyword in food_keywords)
-        has_number_with_unit = bool(re.search(r'\d+\s*(г|кг|мл|л|шт|штук|штуки|грамм|граммов|килограмм|килограммов|миллилитр|литр)', text_lower))
-        
-        # Если есть явные признаки еды - сразу возвращаем True
-        if has_food_keyword or has_number_with_unit:
+        Возвращает (известные продукты, неизвестные части сообщения); неизвестные части -
+        кортежи (часть, ключ названия, количество, единица).
+        """
+        known, unknown = [], []
+        for part in split_food_parts(text):
+            # Опечатки исправляем по известным названиям: "корнешон 5шт" -> "корнишон 5шт"
+            corrected = self.fuzzy_index.correct_text(part)
+            if corrected != part:
+                logger.info(f"Исправлено название: '{part}' -> '{corrected}'")
+                part = corrected
+            name_key, amount, unit = parse_quantity(part)
+            item = (self.nutrition_table.lookup(name_key, amount, unit)
+                    or self.product_kb.lookup(name_key, amount, unit))
+            if item:
+                known.append(item)
+            else:
+                unknown.append((part, name_key, amount, unit))
+        return known, unknown
+    
+    async def parse_food_text(self, text: str, progress_callback: Optional[ProgressCallback] = None,
+                              user_id: Optional[int] = None) -> Optional[Dict]:
+        """Разбор сообщения о еде: известные продукты считаются локально, Groq - только для остальных"""
+        known, unknown = self.parse_locally(text)
+        if known and not unknown:
+            logger.info(f"Все продукты найдены локально: {text}")
+            return self._summarize_items(known)
+        
+        if not self.llm_client:
+            return None
+        
+        # Отдельно в Groq отправляем только части с явным количеством ("овсянка 200г");
+        # иначе сообщение может не делиться на продукты ("борщ с хлебом"), и отправляем его целиком
+        if not known or any(amount is None for _, _, amount, _ in unknown):
+            text = self.fuzzy_index.correct_text(text)
+            return await self.parse_with_groq(text, names_checked=self.fuzzy_index.all_known(text),
+                                              progress_callback=progress_callback, user_id=user_id)
+        
+        unknown_text = ', '.join(part for part, _, _, _ in unknown)
+        logger.info(f"В базе продуктов найдено {len(known)}, в Groq отправляем: {unknown_text}")
+        
+        async def progress_with_known(items: List[Dict]):
+            await progress_callback(known + items)
+        
+        groq_result = await self.parse_with_groq(unknown_text,
+                                                 names_checked=self.fuzzy_index.all_known(unknown_text),
+                                                 progress_callback=progress_with_known if progress_callback else None,
+                                                 user_id=user_id)
+        if groq_result and groq_result.get('over_budget'):
+            return groq_result
+        if not groq_result or not groq_result.get('success'):
+            return None
+        
+        if len(unknown) == 1 and len(groq_result['items']) == 1:
+            # Запоминаем продукт и под названием из сообщения (Groq мог исправить опечатку)
+            self.product_kb.learn_item(groq_result['items'][0], name_key=unknown[0][1])
+        return self._summarize_items(known + groq_result['items'])
+    
+    def classify_locally(self, text: str) -> Optional[bool]:
+        """Проверка на еду без LLM: True/False, если ответ очевиден, иначе None"""
+        features = classify_food_text(text)
+        if features.stop_words:
+            logger.info(f"Текст '{text}' содержит нецензурные/неподходящие слова")
+        elif features.looks_like_food:
             logger.info(f"Текст '{text}' распознан как еда по ключевым словам/единицам измерения")
-            return True
+        return features.is_food
+    
+    async def is_food_related(self, text: str, user_id: Optional[int] = None) -> bool:
+        """Проверка, относится ли текст к еде (неочевидные случаи - через Groq, если позволяет бюджет)"""
+        is_food = self.classify_locally(text)
+        if is_food is not None:
+            return is_food
         
-        # Если Groq недоступен, используем простую проверку
-        if not self.groq_client:
-            return has_food_keyword or has_number_with_unit
+        # Если Groq недоступен или бюджет исчерпан, неочевидный текст едой не считаем
+        if not self.llm_client or not self.llm_client.admits([user_id]):
+            return False
         
+        key = f"classify:{normalize_food_text(text)}"
+        users = self.single_flight.members(key)
+        return await self.single_flight.do(key, lambda: self._request_classify(text, users), member=user_id)
+    
+    async def _request_classify(self, text: str, users: Sequence[Optional[int]] = ()) -> bool:
+        """Проверка на еду через Groq"""
         try:
             # Используем Groq для проверки неочевидных случаев
-            prompt = (
-                f"Пользователь написал: '{text}'\n\n"
-                "Определи, относится ли это сообщение к РЕАЛЬНОЙ еде/продуктам питания. "
-                "Ответь ТОЛЬКО 'yes' если это про РЕАЛЬНУЮ еду, или 'no' если это не про еду.\n\n"
-                "Примеры про еду: 'пельмени 250г', 'съел яблоко', 'овсянка 200г', 'конфету Raffaelo', 'корнишон 5шт', 'чизбургер 1шт', 'йогурт протеиновый 290г'\n"
-                "Примеры НЕ про еду: 'привет', 'как дела', 'что делаешь', 'погода хорошая', 'сегодня понедельник'\n\n"
-                "ВАЖНО: Если это явно нецензурное слово или шутка - отвечай 'no'.\n"
-                "Ответь только 'yes' или 'no', без дополнительного текста."
-            )
-            
-            # Пробуем использовать более мощную модель для проверки
-            models_to_try = [
-                "llama-3.3-70b-versatile",
-                "llama-3.1-70b-versatile",
-                "llama-3.1-8b-instant"
-            ]
-            
-            response = None
-            for model_name in models_to_try:
-                try:
-                    response = self.groq_client.chat.completions.create(
-                        model=model_name,
-                        messages=[
-                            {"role": "system", "content": "Ты помощник для определения, относится ли сообщение к еде. Отвечай только 'yes' или 'no'."},
-                            {"role": "user", "content": prompt}
-                        ],
-                        temperature=0.1,
-                        max_tokens=10
-                    )
-                    break
-                except Exception:
-                    continue
-            
-            if not response:
-                # Fallback на простую проверку
-                return has_food_keyword or has_number_with_unit
+            prompt = get_prompt('classify')
+            try:
+                response = await self.llm_client.complete_first(
+                    prompt.render(text),
+                    request_class='classify',
+                    temperature=0.1,
+                    max_tokens=prompt.max_tokens,
+                    timeout=10,
+                    prompt_version=prompt.version,
+                    users=users
+                )
+            except Exception:
+                # Модели недоступны - неочевидный текст едой не считаем
+                return False
             
-            result = response.choices[0].message.content.strip().lower()
+            result = response['text'].lower()
             is_food = result.startswith('yes') or result == 'да' or 'да' in result
             
             logger.info(f"Проверка на еду для '{text}': {result} -> {is_food}")
@@ -463,24 +604,74 @@ class CalorieCounter:
             
         except Exception as e:
             logger.error(f"Ошибка при проверке на еду: {e}")
-            # В случае ошибки используем простую проверку
-            return has_food_keyword or has_number_with_unit
+            return False
     
-    async def add_meal_from_text(self, user_id: int, text: str) -> Dict:
-        """Добавление приема пищи из текста (только через Groq)"""
-        # Сначала проверяем, относится ли текст к еде
-        is_food = await self.is_food_related(text)
-        if not is_food:
-            logger.info(f"Текст '{text}' не распознан как описание еды")
+    async def create_recipe_from_text(self, user_id: int, name: str, ingredients_text: str,
+                                      portions: float = 1) -> Dict:
+        """Создание рецепта: ингредиенты один раз разбираются через Groq, дальше блюдо считается локально"""
+        if not self.llm_client:
             return {
                 'success': False,
-                'calories': 0,
-                'total_today': 0,
-                'message': 'Это не похоже на описание еды 😊\n\nНапиши что-то вроде: "пельмени 250г" или "съел яблоко"'
+                'message': 'Groq AI недоступен. Введи КБЖУ на 100г вручную: /recipe название = ккал/б/ж/у'
             }
         
+        groq_result = await self.parse_with_groq(ingredients_text, user_id=user_id)
+        if groq_result and groq_result.get('over_budget'):
+            return {'success': False, 'message': OVER_BUDGET_MESSAGE}
+        if not groq_result or not groq_result.get('success'):
+            return {
+                'success': False,
+                'message': 'Не удалось распознать ингредиенты. Укажи количество каждого, например: "свекла 300г, картофель 400г".'
+            }
+        
+        recipe = self.recipes.save_recipe(user_id, name, groq_result['items'], portions=portions)
+        return {'success': True, 'recipe': recipe, 'items': groq_result['items']}
+    
+    def _add_meal_from_recipe(self, user_id: int, item: Dict) -> Dict:
+        """Добавление приема пищи по сохраненному рецепту (без обращения к AI)"""
+        meal_name = f"{item['name']} {item['amount']}{item['unit']}"
+        meal_id = self.save_meal(user_id, meal_name, int(item['calories']), item['source'],
+                                 item['proteins'], item['fats'], item['carbs'], [item])
+        total_today = self.get_today_stats(user_id)['calories']
+        
+        return {
+            'success': True,
+            'calories': int(item['calories']),
+            'total_today': total_today,
+            'items': [item],
+            'meal_name': meal_name,
+            'source': item['source'],
+            'meal_id': meal_id,
+            'proteins': item['proteins'],
+            'fats': item['fats'],
+            'carbs': item['carbs']
+        }
+    
+    async def add_meal_from_text(self, user_id: int, text: str,
+                                 progress_callback: Optional[ProgressCallback] = None) -> Dict:
+        """Добавление приема пищи из текста (рецепты пользователя, иначе через Groq).
+        
+        progress_callback получает продукты по мере ответа Groq (см. parse_with_groq);
+        прием пищи сохраняется, только когда ответ получен целиком.
+        """
+        # Сначала ищем среди рецептов пользователя - это не требует обращения к сети
+        recipe_item = self.recipes.match(user_id, text)
+        if recipe_item:
+            logger.info(f"Текст '{text}' распознан как рецепт пользователя: {recipe_item['name']}")
+            return self._add_meal_from_recipe(user_id, recipe_item)
+        
+        # Если все продукты есть в таблице КБЖУ или базе продуктов, считаем локально без обращения к Groq
+        known, unknown = self.parse_locally(text)
+        if known and not unknown:
+            return self._save_parsed_meal(user_id, self._summarize_items(known))
+        
+        # Очевидные случаи определяем локально; неочевидные Groq проверит в том же запросе, что и разбор
+        is_food = True if known else self.classify_locally(text)
+        if is_food is False or (is_food is None and not self.llm_client):
+            return self._not_food_response(text)
+        
         # Используем только Groq для парсинга
-        if not self.groq_client:
+        if not self.llm_client:
             logger.warning("Groq клиент недоступен, невозможно распарсить текст")
             return {
                 'success': False, 
@@ -490,7 +681,13 @@ class CalorieCounter:
             }
         
         logger.info(f"Парсинг текста через Groq: {text}")
-        groq_result = await self.parse_with_groq(text)
+        groq_result = await self.parse_food_text(text, progress_callback=progress_callback, user_id=user_id)
+        
+        if groq_result and groq_result.get('is_food') is False:
+            return self._not_food_response(text)
+        
+        if groq_result and groq_result.get('over_budget'):
+            return {'success': False, 'calories': 0, 'total_today': 0, 'message': OVER_BUDGET_MESSAGE}
         
         if not groq_result or not groq_result.get('success'):
             logger.warning(f"Groq не смог распарсить текст: {text}")
@@ -503,6 +700,20 @@ class CalorieCounter:
         
         # Используем результат от Groq
         logger.info(f"Groq успешно распарсил: {groq_result}")
+        return self._save_parsed_meal(user_id, groq_result)
+    
+    @staticmethod
+    def _not_food_response(text: str) -> Dict:
+        logger.info(f"Текст '{text}' не распознан как описание еды")
+        return {
+            'success': False,
+            'calories': 0,
+            'total_today': 0,
+            'message': 'Это не похоже на описание еды 😊\n\nНапиши что-то вроде: "пельмени 250г" или "съел яблоко"'
+        }
+    
+    def _save_parsed_meal(self, user_id: int, groq_result: Dict) -> Dict:
+        """Сохранение разобранного приема пищи и ответ для бота"""
         calories = groq_result['calories']
         meal_name = groq_result['meal_name']
         items = groq_result['items']
@@ -513,19 +724,9 @@ class CalorieCounter:
         fats = groq_result.get('fats')
         carbs = groq_result.get('carbs')
         
-        # Сохраняем в базу данных
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        today = date.today()
-        cursor.execute("""
-            INSERT INTO meals (user_id, meal_name, calories, date, source, proteins, fats, carbs)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, meal_name, calories, today, source, proteins, fats, carbs))
-        
-        meal_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Сохраняем в базу данных (прием пищи + отдельные продукты)
+        meal_id = self.save_meal(user_id, meal_name, calories, source, proteins, fats, carbs,
+                                 items if isinstance(items, list) else [])
         
         # Получаем общее количество калорий за сегодня
         total_today = self.get_today_stats(user_id)['calories']
@@ -587,7 +788,8 @@ class CalorieCounter:
             conn.close()
             return False
         
-        # Удаляем прием пищи
+        # Удаляем прием пищи вместе с его продуктами
+        cursor.execute("DELETE FROM meal_items WHERE meal_id = ?", (meal_id,))
         cursor.execute("""
             DELETE FROM meals
             WHERE id = ? AND user_id = ?
@@ -597,6 +799,221 @@ class CalorieCounter:
         conn.close()
         return True
     
+    def get_meal_items(self, user_id: int, meal_id: int) -> List[Dict]:
+        """Список продуктов внутри приема пищи"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, name, amount, unit, calories, proteins, fats, carbs, barcode
+            FROM meal_items
+            WHERE meal_id = ? AND user_id = ?
+            ORDER BY id ASC
+        """, (meal_id, user_id))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    
+    def delete_meal_item(self, user_id: int, item_id: int) -> Optional[Dict]:
+        """Удаление одного продукта из приема пищи с пересчетом итогов.
+        
+        Если в приеме пищи не осталось продуктов, удаляется и сам прием пищи.
+        Возвращает информацию об удаленном продукте или None.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("""
+            SELECT id, meal_id, name, amount, unit, calories FROM meal_items
+            WHERE id = ? AND user_id = ?
+        """, (item_id, user_id))
+        item = cursor.fetchone()
+        if not item:
+            conn.close()
+            return None
+        
+        meal_id = item['meal_id']
+        try:
+            cursor.execute("DELETE FROM meal_items WHERE id = ?", (item_id,))
+            cursor.execute("""
+                SELECT COUNT(*) as item_count,
+                       SUM(calories) as calories,
+                       SUM(proteins) as proteins,
+                       SUM(fats) as fats,
+                       SUM(carbs) as carbs
+                FROM meal_items
+                WHERE meal_id = ?
+            """, (meal_id,))
+            totals = cursor.fetchone()
+            
+            if totals['item_count'] == 0:
+                cursor.execute("DELETE FROM meals WHERE id = ? AND user_id = ?", (meal_id, user_id))
+            else:
+                cursor.execute("""
+                    SELECT name, amount, unit FROM meal_items
+                    WHERE meal_id = ?
+                    ORDER BY id ASC
+                """, (meal_id,))
+                # Количество может быть не указано (NULL) - тогда только название
+                meal_name = ', '.join(
+                    f"{row['name']} {row['amount']}{row['unit'] or ''}" if row['amount'] is not None else row['name']
+                    for row in cursor.fetchall()
+                )
+                cursor.execute("""
+                    UPDATE meals SET meal_name = ?, calories = ?, proteins = ?, fats = ?, carbs = ?
+                    WHERE id = ? AND user_id = ?
+                """, (meal_name, int(totals['calories'] or 0),
+                      round(totals['proteins'], 1) if totals['proteins'] is not None else None,
+                      round(totals['fats'], 1) if totals['fats'] is not None else None,
+                      round(totals['carbs'], 1) if totals['carbs'] is not None else None,
+                      meal_id, user_id))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        
+        return {
+            'id': item['id'],
+            'meal_id': meal_id,
+            'name': item['name'],
+            'amount': item['amount'],
+            'unit': item['unit'],
+            'calories': item['calories'],
+            'meal_deleted': totals['item_count'] == 0
+        }
+    
+    def search_meals(self, user_id: int, query: str, limit: int = 5) -> List[Dict]:
+        """Поиск по истории приемов пищи пользователя (одинаковые приемы пищи схлопываются)"""
+        tokens = normalize_product_name(query).split()
+        if not tokens:
+            return []
+        
+        conn = self.get_connection()
+        # lower() в SQLite меняет регистр только у латиницы: "Гречка" и "гречка" сравниваем по ключу из Python
+        conn.create_function('name_key', 1, normalize_product_name, deterministic=True)
+        cursor = conn.cursor()
+        
+        if self.fts_enabled:
+            # Префиксный поиск по каждому слову: "овсян" найдет "овсянка 200г"
+            fts_query = ' '.join(f'"{token}"*' for token in tokens)
+            cursor.execute("""
+                SELECT MAX(m.id) as id, m.meal_name, COUNT(*) as times, MAX(m.date) as last_date
+                FROM meals_fts
+                JOIN meals m ON m.id = meals_fts.rowid
+                WHERE meals_fts MATCH ? AND meals_fts.user_id = ?
+                GROUP BY name_key(m.meal_name)
+                ORDER BY times DESC, id DESC
+                LIMIT ?
+            """, (fts_query, user_id, limit))
+        else:
+            where = ' AND '.join('name_key(m.meal_name) LIKE ?' for _ in tokens)
+            cursor.execute(f"""
+                SELECT MAX(m.id) as id, m.meal_name, COUNT(*) as times, MAX(m.date) as last_date
+                FROM meals m
+                WHERE m.user_id = ? AND {where}
+                GROUP BY name_key(m.meal_name)
+                ORDER BY times DESC, id DESC
+                LIMIT ?
+            """, (user_id, *[f'%{token}%' for token in tokens], limit))
+        
+        found = cursor.fetchall()
+        if not found:
+            conn.close()
+            return []
+        
+        # Калории и КБЖУ берем из последнего такого приема пищи
+        meal_ids = [row['id'] for row in found]
+        placeholders = ','.join('?' for _ in meal_ids)
+        cursor.execute(f"""
+            SELECT id, calories, proteins, fats, carbs, source FROM meals
+            WHERE id IN ({placeholders})
+        """, meal_ids)
+        details = {row['id']: row for row in cursor.fetchall()}
+        conn.close()
+        
+        results = []
+        for row in found:
+            meal = details.get(row['id'])
+            if not meal:
+                continue
+            results.append({
+                'id': row['id'],
+                'meal_name': row['meal_name'],
+                'times': row['times'],
+                'last_date': row['last_date'],
+                'calories': meal['calories'],
+                'proteins': meal['proteins'],
+                'fats': meal['fats'],
+                'carbs': meal['carbs'],
+                'source': meal['source']
+            })
+        return results
+    
+    def relog_meal(self, user_id: int, meal_id: int) -> Dict:
+        """Повторное добавление прошлого приема пищи с сохраненными КБЖУ (без обращения к AI)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT id, meal_name, calories, proteins, fats, carbs, source FROM meals
+            WHERE id = ? AND user_id = ?
+        """, (meal_id, user_id))
+        meal = cursor.fetchone()
+        conn.close()
+        
+        if not meal:
+            return {
+                'success': False,
+                'message': 'Прием пищи не найден в истории.'
+            }
+        
+        items = self.get_meal_items(user_id, meal_id)
+        if not items:
+            # Приемы пищи, сохраненные до появления meal_items
+            items = [{
+                'name': meal['meal_name'],
+                'amount': None,
+                'unit': None,
+                'calories': meal['calories'],
+                'proteins': meal['proteins'],
+                'fats': meal['fats'],
+                'carbs': meal['carbs']
+            }]
+        
+        new_meal_id = self.save_meal(user_id, meal['meal_name'], meal['calories'], meal['source'],
+                                     meal['proteins'], meal['fats'], meal['carbs'], items)
+        total_today = self.get_today_stats(user_id)['calories']
+        
+        return {
+            'success': True,
+            'calories': meal['calories'],
+            'total_today': total_today,
+            'items': items,
+            'meal_name': meal['meal_name'],
+            'source': meal['source'],
+            'meal_id': new_meal_id,
+            'proteins': meal['proteins'],
+            'fats': meal['fats'],
+            'carbs': meal['carbs']
+        }
+    
+    def get_top_products(self, user_id: int, limit: int = 10) -> List[Dict]:
+        """Самые частые продукты пользователя (по нормализованному названию)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT name_key, MAX(name) as name, COUNT(*) as times,
+                   SUM(calories) as total_calories, MAX(date) as last_date
+            FROM meal_items
+            WHERE user_id = ?
+            GROUP BY name_key
+            ORDER BY times DESC, last_date DESC
+            LIMIT ?
+        """, (user_id, limit))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+    
     def delete_last_meal(self, user_id: int) -> Optional[Dict]:
         """Удаление последнего добавленного приема пищи"""
         conn = self.get_connection()
@@ -616,6 +1033,7 @@ class CalorieCounter:
         if meal:
             meal_id = meal['id']
             # Удаляем
+            cursor.execute("DELETE FROM meal_items WHERE meal_id = ?", (meal_id,))
             cursor.execute("""
                 DELETE FROM meals
                 WHERE id = ? AND user_id = ?
@@ -746,6 +1164,35 @@ class CalorieCounter:
         
         return {'days': days}
     
+    def get_daily_series(self, user_id: int, days: int = 7) -> List[Dict]:
+        """Калории и КБЖУ по дням за последние days дней (дни без записей - нули), от старых к новым"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        
+        since = date.today() - timedelta(days=days - 1)
+        cursor.execute("""
+            SELECT date, SUM(calories) as calories, SUM(proteins) as proteins,
+                   SUM(fats) as fats, SUM(carbs) as carbs
+            FROM meals
+            WHERE user_id = ? AND date >= ?
+            GROUP BY date
+        """, (user_id, since))
+        by_date = {str(row['date']): row for row in cursor.fetchall()}
+        conn.close()
+        
+        series = []
+        for offset in range(days):
+            day = since + timedelta(days=offset)
+            row = by_date.get(day.isoformat())
+            series.append({
+                'date': day,
+                'calories': int(row['calories'] or 0) if row else 0,
+                'proteins': round(row['proteins'] or 0, 1) if row else 0,
+                'fats': round(row['fats'] or 0, 1) if row else 0,
+                'carbs': round(row['carbs'] or 0, 1) if row else 0
+            })
+        return series
+    
     def get_daily_limit(self, user_id: int) -> Optional[int]:
         """Получение дневной нормы калорий"""
         conn = self.get_connection()
@@ -1210,12 +1657,14 @@ class CalorieCounter:
             logger.debug(f"Ошибка при веб-поиске для штрих-кода {barcode}: {e}")
             return None
     
-    async def search_product_by_barcode(self, barcode: str, status_callback=None) -> Optional[Dict]:
+    async def search_product_by_barcode(self, barcode: str, status_callback=None,
+                                        user_id: Optional[int] = None) -> Optional[Dict]:
         """Поиск продукта по штрих-коду через несколько источников
         
         Args:
             barcode: Штрих-код продукта
             status_callback: Функция для отправки статуса поиска (принимает строку с сообщением)
+            user_id: Пользователь, за которого поиск через Groq учитывается в дневном бюджете
         """
         def is_valid_result(result: Optional[Dict]) -> bool:
             """Проверка валидности результата поиска"""
@@ -1277,47 +1726,56 @@ class CalorieCounter:
             return result
         
         # Если ничего не нашли, пробуем использовать Groq как последний вариант
-        # (только если все остальные источники не сработали)
-        if self.groq_client:
+        # (только если все остальные источники не сработали и бюджет пользователя не исчерпан)
+        if self.llm_client and self.llm_client.admits([user_id]):
             if status_callback:
                 await status_callback("🔍 Ищу через AI...")
             logger.info(f"Все источники не сработали, пробуем Groq для штрих-кода {barcode}")
-            try:
-                # Пробуем найти информацию о продукте через Groq
-                groq_prompt = f"Найди информацию о продукте со штрих-кодом {barcode}. Верни только название продукта на русском языке. Если не можешь найти - верни пустую строку."
-                response = self.groq_client.chat.completions.create(
-                    model="llama-3.3-70b-versatile",
-                    messages=[
-                        {"role": "system", "content": "Ты помощник для поиска информации о продуктах. Отвечай только названием продукта на русском языке или пустой строкой, если не можешь найти."},
-                        {"role": "user", "content": groq_prompt}
-                    ],
-                    temperature=0.1,
-                    max_tokens=50
-                )
-                product_name = response.choices[0].message.content.strip()
-                
-                if product_name and is_valid_product_name(product_name) and len(product_name) > 3:
-                    logger.info(f"Groq нашел название продукта: {product_name}")
-                    return {
-                        'success': True,
-                        'name': product_name,
-                        'calories_per_100g': None,
-                        'proteins_per_100g': None,
-                        'fats_per_100g': None,
-                        'carbs_per_100g': None,
-                        'weight': None,
-                        'barcode': barcode,
-                        'brand': '',
-                        'image_url': None,
-                        'source': 'Groq AI (по штрих-коду)'
-                    }
-            except Exception as e:
-                logger.debug(f"Ошибка при использовании Groq для штрих-кода: {e}")
+            key = f"barcode:{barcode}"
+            users = self.single_flight.members(key)
+            result = await self.single_flight.do(key, lambda: self._request_barcode(barcode, users), member=user_id)
+            if result:
+                return result
         
         # Если ничего не нашли, возвращаем None
         logger.warning(f"Продукт с штрих-кодом {barcode} не найден ни в одном источнике")
         return None
     
+    async def _request_barcode(self, barcode: str, users: Sequence[Optional[int]] = ()) -> Optional[Dict]:
+        """Название продукта по штрих-коду через Groq (последний вариант поиска)"""
+        try:
+            # Пробуем найти информацию о продукте через Groq
+            prompt = get_prompt('barcode')
+            response = await self.llm_client.complete_first(
+                prompt.render(barcode),
+                request_class='barcode',
+                temperature=0.1,
+                max_tokens=prompt.max_tokens,
+                timeout=15,
+                prompt_version=prompt.version,
+                users=users
+            )
+            product_name = response['text']
+            
+            if product_name and is_valid_product_name(product_name) and len(product_name) > 3:
+                logger.info(f"Groq нашел название продукта: {product_name}")
+                return {
+                    'success': True,
+                    'name': product_name,
+                    'calories_per_100g': None,
+                    'proteins_per_100g': None,
+                    'fats_per_100g': None,
+                    'carbs_per_100g': None,
+                    'weight': None,
+                    'barcode': barcode,
+                    'brand': '',
+                    'image_url': None,
+                    'source': 'Groq AI (по штрих-коду)'
+                }
+        except Exception as e:
+            logger.debug(f"Ошибка при использовании Groq для штрих-кода: {e}")
+        return None
+    
     async def search_product_by_barcode_web_alternative(self, barcode: str) -> Optional[Dict]:
         """Альтернативный веб-поиск через другие сайты"""
         try:
@@ -1742,14 +2200,17 @@ class CalorieCounter:
         return None
     
     
-    async def get_product_info_by_barcode(self, barcode: str, status_callback=None) -> Dict:
+    async def get_product_info_by_barcode(self, barcode: str, status_callback=None,
+                                          user_id: Optional[int] = None) -> Dict:
         """Получение информации о продукте по штрих-коду (без добавления в дневник)
         
         Args:
             barcode: Штрих-код продукта
             status_callback: Функция для отправки статуса поиска (принимает строку с сообщением)
+            user_id: Пользователь (для дневного бюджета LLM)
         """
-        product_info = await self.search_product_by_barcode(barcode, status_callback=status_callback)
+        product_info = await self.search_product_by_barcode(barcode, status_callback=status_callback,
+                                                            user_id=user_id)
         
         if not product_info or not product_info.get('success'):
             return {
@@ -1761,7 +2222,7 @@ class CalorieCounter:
     
     async def add_meal_from_barcode(self, user_id: int, barcode: str, status_callback=None) -> Dict:
         """Добавление приема пищи по штрих-коду"""
-        product_info = await self.search_product_by_barcode(barcode)
+        product_info = await self.search_product_by_barcode(barcode, user_id=user_id)
         
         if not product_info or not product_info.get('success'):
             return {
@@ -1778,6 +2239,12 @@ class CalorieCounter:
         product_name = product_info.get('name', '')
         source = product_info.get('source', 'Штрих-код')
         
+        # Запоминаем КБЖУ на 100г в базе продуктов, чтобы потом считать этот продукт и по тексту
+        if product_info.get('calories_per_100g') is not None and product_name:
+            self.product_kb.learn(product_name, '100g', calories_per_100g, proteins_per_100g,
+                                  fats_per_100g, carbs_per_100g, source)
+            self.fuzzy_index.add_name(product_name)
+        
         # Если вес не был найден в базе, пробуем извлечь из названия продукта
         if weight is None and product_name:
             name_weight_match = re.search(r'(\d+)\s*(г|g|кг|kg)\b', product_name, re.IGNORECASE)
@@ -1832,19 +2299,18 @@ class CalorieCounter:
             if carbs_per_100g is not None:
                 carbs = round(carbs_per_100g, 1)
         
-        # Сохраняем в базу данных
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        today = date.today()
-        cursor.execute("""
-            INSERT INTO meals (user_id, meal_name, calories, date, source, proteins, fats, carbs)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """, (user_id, meal_name, calories, today, source, proteins, fats, carbs))
-        
-        meal_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Сохраняем в базу данных (прием пищи + продукт со ссылкой на штрих-код)
+        item = {
+            'name': product_name,
+            'amount': weight or 100,
+            'unit': 'г',
+            'calories': calories,
+            'proteins': proteins,
+            'fats': fats,
+            'carbs': carbs
+        }
+        meal_id = self.save_meal(user_id, meal_name, calories, source, proteins, fats, carbs,
+                                 [item], barcode=barcode)
         
         # Получаем общее количество калорий за сегодня
         total_today = self.get_today_stats(user_id)['calories']
@@ -0,0 +1,175 @@
+import asyncio
+import hashlib
+import io
+import json
+import logging
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Пул процессов для отрисовки: matplotlib работает синхронно и не должен блокировать диспетчер
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> ProcessPoolExecutor:
+    """Ленивая инициализация пула процессов для отрисовки графиков"""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=1)
+    return _executor
+
+
+def shutdown_executor():
+    """Остановка пула процессов (при завершении бота)"""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def data_version(payload: Dict) -> str:
+    """Версия данных графика: если данные не менялись, картинку можно не перерисовывать"""
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+
+def _new_figure(rows: int):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    fig, axes = plt.subplots(rows, 1, figsize=(8, 3.2 * rows), dpi=110, squeeze=False)
+    return plt, fig, [ax[0] for ax in axes]
+
+
+def _to_png(plt, fig) -> bytes:
+    buffer = io.BytesIO()
+    fig.tight_layout()
+    fig.savefig(buffer, format='png')
+    plt.close(fig)
+    return buffer.getvalue()
+
+
+def render_nutrition_chart(payload: Dict) -> bytes:
+    """График калорий и КБЖУ по дням. Выполняется в отдельном процессе"""
+    days = payload['days']
+    labels = [day['label'] for day in days]
+    x = list(range(len(days)))
+
+    plt, fig, (ax_cal, ax_macro) = _new_figure(2)
+
+    ax_cal.bar(x, [day['calories'] for day in days], color='#f28c28')
+    if payload.get('limit'):
+        ax_cal.axhline(payload['limit'], color='#d62728', linestyle='--', linewidth=1, label=f"Норма {payload['limit']} ккал")
+        ax_cal.legend(loc='upper left', fontsize=8)
+    ax_cal.set_title(payload['title'])
+    ax_cal.set_ylabel('ккал')
+
+    width = 0.27
+    ax_macro.bar([i - width for i in x], [day['proteins'] for day in days], width, label='Белки', color='#1f77b4')
+    ax_macro.bar(x, [day['fats'] for day in days], width, label='Жиры', color='#ffbf00')
+    ax_macro.bar([i + width for i in x], [day['carbs'] for day in days], width, label='Углеводы', color='#2ca02c')
+    ax_macro.set_ylabel('г')
+    ax_macro.legend(loc='upper left', fontsize=8)
+
+    for ax in (ax_cal, ax_macro):
+        ax.set_xticks(x)
+        ax.set_xticklabels(labels, rotation=45 if len(days) > 10 else 0, fontsize=8)
+        ax.grid(axis='y', alpha=0.3)
+
+    return _to_png(plt, fig)
+
+
+def render_workout_chart(payload: Dict) -> bytes:
+    """График отжиманий и пресса группы по дням. Выполняется в отдельном процессе"""
+    days = payload['days']
+    labels = [day['label'] for day in days]
+    x = list(range(len(days)))
+
+    plt, fig, (ax,) = _new_figure(1)
+
+    width = 0.4
+    ax.bar([i - width / 2 for i in x], [day['pushups'] for day in days], width, label='Отжимания', color='#1f77b4')
+    ax.bar([i + width / 2 for i in x], [day['abs'] for day in days], width, label='Пресс', color='#ff7f0e')
+    ax.set_title(payload['title'])
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels, rotation=45 if len(days) > 10 else 0, fontsize=8)
+    ax.legend(loc='upper left', fontsize=8)
+    ax.grid(axis='y', alpha=0.3)
+
+    return _to_png(plt, fig)
+
+
+async def render_chart(renderer, payload: Dict) -> bytes:
+    """Отрисовка графика в пуле процессов, не блокируя цикл событий"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), renderer, payload)
+
+
+class ChartCache:
+    """Кэш отправленных графиков: (чат/пользователь, период, версия данных) -> Telegram file_id"""
+
+    def __init__(self, db_path: str = "fitness_bot.db"):
+        self.db_path = db_path
+        self.init_database()
+
+    def get_connection(self):
+        """Получение соединения с базой данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """Инициализация таблицы кэша графиков"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS chart_cache (
+                scope TEXT NOT NULL,
+                range_name TEXT NOT NULL,
+                data_version TEXT NOT NULL,
+                file_id TEXT NOT NULL,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (scope, range_name)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def get_file_id(self, scope: str, range_name: str, version: str) -> Optional[str]:
+        """file_id графика, если он строился по тем же данным"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT file_id FROM chart_cache
+            WHERE scope = ? AND range_name = ? AND data_version = ?
+        """, (scope, range_name, version))
+        row = cursor.fetchone()
+        conn.close()
+        return row['file_id'] if row else None
+
+    def save_file_id(self, scope: str, range_name: str, version: str, file_id: str):
+        """Сохранение file_id (для каждого чата и периода храним только последнюю версию)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO chart_cache (scope, range_name, data_version, file_id, created_at)
+            VALUES (?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (scope, range_name, version, file_id))
+        conn.commit()
+        conn.close()
+
+    def invalidate(self, scope: str, range_name: str):
+        """Удаление записи (например, если Telegram больше не принимает file_id)"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM chart_cache WHERE scope = ? AND range_name = ?", (scope, range_name))
+        conn.commit()
+        conn.close()
+
+
+def build_day_labels(days: List[Dict]) -> List[Dict]:
+    """Добавляет подписи дат (дд.мм) к дневным данным"""
+    return [dict(day, label=day['date'].strftime('%d.%m'), date=day['date'].isoformat()) for day in days]
@@ -45,6 +45,16 @@ class Database:
             )
         """)
         
+        # norm - сколько за день добавлено утренней нормой (count - остаток с ее учетом)
+        for table in ('pushups', 'abs'):
+            try:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN norm INTEGER NOT NULL DEFAULT 0")
+                # Старые записи: ненулевой остаток бывает только после нормы (запись с нулем -
+                # регистрация или выполненная норма, их не различить - такие дни не считаем)
+                cursor.execute(f"UPDATE {table} SET norm = 80 WHERE count != 0")
+            except sqlite3.OperationalError:
+                pass  # Колонка уже существует
+        
         # Индексы для быстрого поиска
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_pushups_user_date ON pushups(user_id, chat_id, date)")
         cursor.execute("CREATE INDEX IF NOT EXISTS idx_abs_user_date ON abs(user_id, chat_id, date)")
@@ -54,8 +64,11 @@ class Database:
         conn.commit()
         conn.close()
     
-    def add_pushups(self, user_id: int, username: str, count: int, chat_id: int):
-        """Добавление отжиманий (обновляет запись за сегодня, если есть, иначе создаёт новую)"""
+    def add_pushups(self, user_id: int, username: str, count: int, chat_id: int, norm: int = 0):
+        """Добавление отжиманий (обновляет запись за сегодня, если есть, иначе создаёт новую).
+
+        norm - часть count, которая является утренней нормой (а не выполненными повторениями)
+        """
         import logging
         logger = logging.getLogger(__name__)
         
@@ -75,23 +88,26 @@ class Database:
             # Обновляем существующую запись: count = count + новое значение
             new_count = existing['count'] + count
             cursor.execute("""
-                UPDATE pushups SET count = ?, username = ?
+                UPDATE pushups SET count = ?, username = ?, norm = norm + ?
                 WHERE id = ?
-            """, (new_count, username, existing['id']))
+            """, (new_count, username, norm, existing['id']))
             logger.info(f"Обновлена запись отжиманий: user_id={user_id}, chat_id={chat_id}, old_count={existing['count']}, new_count={new_count}")
         else:
             # Создаём новую запись (даже если count=0, чтобы пользователь попал в список)
             cursor.execute("""
-                INSERT INTO pushups (user_id, username, chat_id, count, date)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, username, chat_id, count, today))
+                INSERT INTO pushups (user_id, username, chat_id, count, date, norm)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (user_id, username, chat_id, count, today, norm))
             logger.info(f"Создана новая запись отжиманий: user_id={user_id}, chat_id={chat_id}, count={count}, date={today}")
         
         conn.commit()
         conn.close()
     
-    def add_abs(self, user_id: int, username: str, count: int, chat_id: int):
-        """Добавление упражнений на пресс (обновляет запись за сегодня, если есть, иначе создаёт новую)"""
+    def add_abs(self, user_id: int, username: str, count: int, chat_id: int, norm: int = 0):
+        """Добавление упражнений на пресс (обновляет запись за сегодня, если есть, иначе создаёт новую).
+
+        norm - часть count, которая является утренней нормой (а не выполненными повторениями)
+        """
         import logging
         logger = logging.getLogger(__name__)
         
@@ -111,16 +127,16 @@ class Database:
             # Обновляем существующую запись: count = count + новое значение
             new_count = existing['count'] + count
             cursor.execute("""
-                UPDATE abs SET count = ?, username = ?
+                UPDATE abs SET count = ?, username = ?, norm = norm + ?
                 WHERE id = ?
-            """, (new_count, username, existing['id']))
+            """, (new_count, username, norm, existing['id']))
             logger.info(f"Обновлена запись пресса: user_id={user_id}, chat_id={chat_id}, old_count={existing['count']}, new_count={new_count}")
         else:
             # Создаём новую запись (даже если count=0, чтобы пользователь попал в список)
             cursor.execute("""
-                INSERT INTO abs (user_id, username, chat_id, count, date)
-                VALUES (?, ?, ?, ?, ?)
-            """, (user_id, username, chat_id, count, today))
+                INSERT INTO abs (user_id, username, chat_id, count, date, norm)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, (user_id, username, chat_id, count, today, norm))
             logger.info(f"Создана новая запись пресса: user_id={user_id}, chat_id={chat_id}, count={count}, date={today}")
         
         conn.commit()
@@ -456,3 +472,66 @@ class Database:
             d = row['first_date']
             return d if isinstance(d, date) else date.fromisoformat(str(d))
         return None
+
+    def get_chat_daily_totals(self, chat_id: int, days: int = 7) -> List[Dict]:
+        """Отжимания и пресс группы по дням за последние days дней (дни без записей - нули), от старых к новым.
+
+        В таблицах остаток нормы, поэтому сделано каждым за день = норма - остаток (не меньше нуля),
+        как в analytics.build_series; по группе - сумма по участникам.
+        """
+        from datetime import timedelta
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        since = date.today() - timedelta(days=days - 1)
+        cursor.execute("""
+            SELECT d, SUM(MAX(0, norm_pushups - pushups)) as pushups, SUM(MAX(0, norm_abs - abs_count)) as abs_count
+            FROM (
+                SELECT user_id, d, SUM(pushups) as pushups, SUM(abs_count) as abs_count,
+                       SUM(norm_pushups) as norm_pushups, SUM(norm_abs) as norm_abs FROM (
+                    SELECT user_id, date as d, count as pushups, 0 as abs_count, norm as norm_pushups, 0 as norm_abs
+                    FROM pushups WHERE chat_id = ? AND date >= ?
+                    UNION ALL
+                    SELECT user_id, date as d, 0 as pushups, count as abs_count, 0 as norm_pushups, norm as norm_abs
+                    FROM abs WHERE chat_id = ? AND date >= ?
+                ) GROUP BY user_id, d
+            ) GROUP BY d
+        """, (chat_id, since, chat_id, since))
+        by_date = {str(row['d']): row for row in cursor.fetchall()}
+        conn.close()
+        series = []
+        for offset in range(days):
+            day = since + timedelta(days=offset)
+            row = by_date.get(day.isoformat())
+            series.append({
+                'date': day,
+                'pushups': row['pushups'] or 0 if row else 0,
+                'abs': row['abs_count'] or 0 if row else 0
+            })
+        return series
+
+    def get_daily_balances(self, chat_id: int, user_id: Optional[int] = None) -> List[Dict]:
+        """Сумма записей отжиманий и пресса по (пользователь, день) - остаток нормы на конец дня.
+
+        norm_pushups/norm_abs - добавленная за день норма (0 - нормы не было, например день регистрации).
+        Дни без записей не возвращаются; user_id ограничивает выборку одним пользователем.
+        """
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        user_filter = " AND user_id = ?" if user_id is not None else ""
+        params = (chat_id,) + ((user_id,) if user_id is not None else ())
+        cursor.execute(f"""
+            SELECT user_id, d, SUM(pushups) as pushups, SUM(abs_count) as abs_count,
+                   SUM(norm_pushups) as norm_pushups, SUM(norm_abs) as norm_abs FROM (
+                SELECT user_id, date as d, count as pushups, 0 as abs_count, norm as norm_pushups, 0 as norm_abs
+                FROM pushups WHERE chat_id = ?{user_filter}
+                UNION ALL
+                SELECT user_id, date as d, 0 as pushups, count as abs_count, 0 as norm_pushups, norm as norm_abs
+                FROM abs WHERE chat_id = ?{user_filter}
+            ) GROUP BY user_id, d
+            ORDER BY user_id, d
+        """, params + params)
+        rows = cursor.fetchall()
+        conn.close()
+        return [{'user_id': row['user_id'], 'date': str(row['d']),
+                 'pushups': row['pushups'] or 0, 'abs': row['abs_count'] or 0,
+                 'norm_pushups': row['norm_pushups'] or 0, 'norm_abs': row['norm_abs'] or 0} for row in rows]
@@ -0,0 +1,240 @@
+"""
+Потоковая выгрузка данных бота (приемы пищи и тренировки) в CSV, JSONL или Parquet.
+
+Строки читаются из SQLite пачками через fetchmany и сразу пишутся в файл,
+поэтому память не зависит от размера таблиц.
+
+Использование из командной строки (для администратора):
+    python exporter.py --table meals --format csv --out exports/
+    python exporter.py --table pushups --format parquet --user 123456 --out exports/
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import os
+import sqlite3
+from typing import Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Таблицы, доступные для выгрузки, и их колонки
+EXPORT_TABLES = {
+    'meals': ['id', 'user_id', 'date', 'meal_name', 'calories', 'proteins', 'fats', 'carbs', 'source', 'created_at'],
+    'meal_items': ['id', 'meal_id', 'user_id', 'date', 'name', 'amount', 'unit',
+                   'calories', 'proteins', 'fats', 'carbs', 'barcode', 'created_at'],
+    'pushups': ['id', 'user_id', 'username', 'chat_id', 'date', 'count', 'norm', 'created_at'],
+    'abs': ['id', 'user_id', 'username', 'chat_id', 'date', 'count', 'norm', 'created_at'],
+}
+
+# Типы колонок как в схеме SQLite (calories везде REAL: в meals пишутся и дробные суммы).
+# По ним строится схема Parquet, а не по первой пачке строк: колонка, пустая во всей
+# первой пачке, иначе получила бы тип null, и следующая пачка не записалась бы
+EXPORT_COLUMN_TYPES = {
+    'id': 'INTEGER', 'user_id': 'INTEGER', 'meal_id': 'INTEGER', 'chat_id': 'INTEGER',
+    'count': 'INTEGER', 'norm': 'INTEGER',
+    'calories': 'REAL', 'proteins': 'REAL', 'fats': 'REAL', 'carbs': 'REAL', 'amount': 'REAL',
+    'meal_name': 'TEXT', 'name': 'TEXT', 'unit': 'TEXT', 'barcode': 'TEXT', 'source': 'TEXT',
+    'username': 'TEXT', 'date': 'TEXT', 'created_at': 'TEXT',
+}
+
+EXPORT_FORMATS = ('csv', 'jsonl', 'parquet')
+
+# Telegram не принимает от бота документы больше 50 МБ
+DEFAULT_CHUNK_BYTES = 45 * 1024 * 1024
+DEFAULT_BATCH_SIZE = 1000
+
+
+def iter_rows(db_path: str, table: str, user_id: Optional[int] = None,
+              batch_size: int = DEFAULT_BATCH_SIZE) -> Iterator[tuple]:
+    """Генератор строк таблицы (кортежи в порядке EXPORT_TABLES[table]), читает пачками"""
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Неизвестная таблица для выгрузки: {table}")
+
+    columns = ', '.join(EXPORT_TABLES[table])
+    query = f"SELECT {columns} FROM {table}"
+    params = ()
+    if user_id is not None:
+        query += " WHERE user_id = ?"
+        params = (user_id,)
+    query += " ORDER BY id"
+
+    conn = sqlite3.connect(db_path)
+    try:
+        cursor = conn.execute(query, params)
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield from batch
+    finally:
+        conn.close()
+
+
+class ChunkedGzipWriter:
+    """Текстовый поток, который сжимается на лету и делится на части.
+
+    Размер части ограничивается по несжатым данным: сжатый файл заведомо не больше,
+    а буферы gzip не мешают точно посчитать, когда пора начинать новую часть.
+    """
+
+    def __init__(self, base_path: str, chunk_bytes: int = DEFAULT_CHUNK_BYTES, header: Optional[str] = None):
+        self.base_path = base_path
+        self.chunk_bytes = chunk_bytes
+        self.header = header
+        self.paths: List[str] = []
+        self._raw = None
+        self._gzip = None
+        self._written = 0
+        self._lines = 0
+        self._open_next()
+
+    def _open_next(self):
+        self.close()
+        part = len(self.paths) + 1
+        path = f"{self.base_path}.gz" if part == 1 else f"{self.base_path}.part{part}.gz"
+        self._raw = open(path, 'wb')
+        self._gzip = gzip.GzipFile(fileobj=self._raw, mode='wb')
+        self.paths.append(path)
+        self._written = 0
+        self._lines = 0
+        if self.header:
+            self._write(self.header)
+
+    def _write(self, text: str):
+        data = text.encode('utf-8')
+        self._gzip.write(data)
+        self._written += len(data)
+
+    def write_line(self, line: str):
+        if self._lines and self._written + len(line.encode('utf-8')) > self.chunk_bytes:
+            self._open_next()
+        self._write(line)
+        self._lines += 1
+
+    def close(self):
+        if self._gzip is not None:
+            self._gzip.close()
+            self._raw.close()
+            self._gzip = None
+            self._raw = None
+
+
+def _csv_line(values) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def export_csv(rows: Iterator[tuple], columns: List[str], base_path: str,
+               chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> List[str]:
+    """Запись строк в CSV (gzip, с разбиением на части). Каждая часть начинается с заголовка"""
+    writer = ChunkedGzipWriter(f"{base_path}.csv", chunk_bytes, header=_csv_line(columns))
+    try:
+        for row in rows:
+            writer.write_line(_csv_line(row))
+    finally:
+        writer.close()
+    return writer.paths
+
+
+def export_jsonl(rows: Iterator[tuple], columns: List[str], base_path: str,
+                 chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> List[str]:
+    """Запись строк в JSON Lines (gzip, с разбиением на части)"""
+    writer = ChunkedGzipWriter(f"{base_path}.jsonl", chunk_bytes)
+    try:
+        for row in rows:
+            writer.write_line(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n')
+    finally:
+        writer.close()
+    return writer.paths
+
+
+def export_parquet(rows: Iterator[tuple], columns: List[str], base_path: str,
+                   batch_size: int = DEFAULT_BATCH_SIZE) -> List[str]:
+    """Запись строк в Parquet пачками (нужен pyarrow). Parquet сжимается сам, поэтому файл один"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Для выгрузки в Parquet нужен пакет pyarrow: pip install pyarrow")
+
+    arrow_types = {'INTEGER': pa.int64(), 'REAL': pa.float64(), 'TEXT': pa.string()}
+    schema = pa.schema([(column, arrow_types[EXPORT_COLUMN_TYPES[column]]) for column in columns])
+    path = f"{base_path}.parquet"
+    writer = pq.ParquetWriter(path, schema, compression='zstd')
+    batch = []
+
+    def flush():
+        writer.write_table(pa.Table.from_pylist([dict(zip(columns, row)) for row in batch], schema=schema))
+        batch.clear()
+
+    try:
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                flush()
+        if batch:
+            flush()
+    finally:
+        # Для пустой таблицы остается файл только со схемой
+        writer.close()
+    return [path]
+
+
+def export_table(db_path: str, table: str, fmt: str, out_dir: str, user_id: Optional[int] = None,
+                 chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> List[str]:
+    """Выгрузка одной таблицы в out_dir. Возвращает список созданных файлов"""
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Неизвестный формат выгрузки: {fmt}")
+
+    os.makedirs(out_dir, exist_ok=True)
+    columns = EXPORT_TABLES[table]
+    suffix = f"_{user_id}" if user_id is not None else ""
+    base_path = os.path.join(out_dir, f"{table}{suffix}")
+    rows = iter_rows(db_path, table, user_id=user_id)
+
+    if fmt == 'csv':
+        paths = export_csv(rows, columns, base_path, chunk_bytes)
+    elif fmt == 'jsonl':
+        paths = export_jsonl(rows, columns, base_path, chunk_bytes)
+    else:
+        paths = export_parquet(rows, columns, base_path)
+
+    logger.info(f"Выгружена таблица {table} ({fmt}): {paths}")
+    return paths
+
+
+def export_user_data(db_path: str, user_id: int, fmt: str, out_dir: str,
+                     chunk_bytes: int = DEFAULT_CHUNK_BYTES) -> Dict[str, List[str]]:
+    """Выгрузка всех данных пользователя: приемы пищи, продукты, отжимания, пресс"""
+    return {
+        table: export_table(db_path, table, fmt, out_dir, user_id=user_id, chunk_bytes=chunk_bytes)
+        for table in EXPORT_TABLES
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Выгрузка данных фитнес-бота")
+    parser.add_argument('--db', default='fitness_bot.db', help="путь к базе данных")
+    parser.add_argument('--table', choices=list(EXPORT_TABLES) + ['all'], default='all')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv')
+    parser.add_argument('--user', type=int, default=None, help="выгрузить только этого пользователя")
+    parser.add_argument('--out', default='exports', help="папка для файлов")
+    parser.add_argument('--chunk-mb', type=int, default=DEFAULT_CHUNK_BYTES // (1024 * 1024),
+                        help="максимальный размер одной части (для CSV/JSONL)")
+    args = parser.parse_args()
+
+    tables = list(EXPORT_TABLES) if args.table == 'all' else [args.table]
+    for table in tables:
+        paths = export_table(args.db, table, args.format, args.out, user_id=args.user,
+                             chunk_bytes=args.chunk_mb * 1024 * 1024)
+        for path in paths:
+            print(f"{table}: {path} ({os.path.getsize(path)} байт)")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    main()
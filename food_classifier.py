@@ -0,0 +1,109 @@
+import re
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
+
+# Признаки сообщения о еде (поиск подстрокой, поэтому достаточно основы слова)
+FOOD_KEYWORDS = (
+    'г', 'кг', 'мл', 'л', 'шт', 'штук', 'штуки', 'калори', 'ккал', 'еда', 'съел', 'съела',
+    'завтрак', 'обед', 'ужин', 'поел', 'поела', 'конфет', 'конфетка', 'пельмен', 'вареник', 'блин',
+    'борщ', 'суп', 'салат', 'хлеб', 'мясо', 'рыба', 'куриц', 'яйц', 'молок', 'творог', 'сыр',
+    'йогурт', 'кефир', 'овсянк', 'гречк', 'рис', 'макарон', 'картошк', 'овощ', 'фрукт', 'яблок',
+    'банан', 'апельсин', 'мандарин', 'помидор', 'огурц', 'морков', 'капуст', 'лук', 'чеснок',
+    'перец', 'петрушк', 'укроп', 'сметан', 'майонез', 'масло', 'сахар', 'соль', 'специ', 'соус',
+    'кетчуп', 'горчиц', 'хрен', 'колбас', 'сосиск', 'ветчин', 'бекон', 'свинин', 'говядин', 'баран',
+    'индейк', 'лосос', 'тунец', 'селедк', 'икр', 'креветк', 'кальмар', 'миди', 'краб', 'сливк',
+    'маргарин', 'спред', 'брынз', 'фет', 'ряженк', 'простокваш', 'варенец', 'тан', 'айран', 'батон',
+    'булк', 'бутерброд', 'тост', 'сухар', 'гренк', 'круассан', 'печень', 'торт', 'пирожн', 'шоколад',
+    'вафел', 'кекс', 'маффин', 'морожен', 'желе', 'пудинг', 'мусс', 'крем', 'безе', 'зефир',
+    'мармелад', 'халв', 'орех', 'миндал', 'фундук', 'грецк', 'кешью', 'фисташк', 'арахис', 'семечк',
+    'кунжут', 'изюм', 'кураг', 'чернослив', 'финик', 'инжир', 'клюкв', 'брусник', 'облепих', 'чай',
+    'кофе', 'какао', 'сок', 'компот', 'морс', 'кисел', 'лимонад', 'газировк', 'пиво', 'вино', 'водк',
+    'коньяк', 'виски', 'ром', 'джин', 'ликер', 'шампанск', 'вод', 'минералк', 'энергетик', 'спортпит',
+    'протеин', 'гейнер', 'креатин', 'конфеты', 'батончик', 'печенье', 'молоко', 'яблоко', 'овсянка',
+    'каша', 'ростагроэкспорт', 'ростик', 'макдональдс', 'burger king', 'kfc', 'чизбургер', 'бургер',
+    'чикенбургер', 'чикен бургер',
+)
+
+# Явно не еда: бранные слова и оскорбления
+STOP_WORDS = (
+    'какаш', 'письк', 'говн', 'дерьм', 'хуй', 'пизд', 'ебан', 'бляд', 'сука',
+    'мудак', 'долбоеб', 'идиот', 'дурак', 'лох', 'лошар', 'кретин', 'дебил',
+)
+
+# Количество с единицей измерения: "250г", "250 гр", "2 штуки"
+UNITS = ('г', 'кг', 'мл', 'л', 'шт', 'штук', 'штуки', 'штука', 'грамм', 'граммов',
+         'килограмм', 'килограммов', 'миллилитр', 'литр')
+
+
+def _alternation(words) -> str:
+    """Выражение для списка слов в виде префиксного дерева (как автомат Ахо-Корасик, но средствами re).
+
+    Обычное "a|b|c" на каждой позиции текста перебирает все слова; дерево проверяет
+    один символ и сразу отсекает слова с другой первой буквой. Из вариантов с общим
+    началом выбирается самый длинный.
+    """
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: dict) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f'(?:{body})?' if '' in node else body
+
+    return build(trie)
+
+
+# Один проход по тексту находит все три вида признаков
+_FEATURES_RE = re.compile(
+    rf"(?P<stop>{_alternation(STOP_WORDS)})"
+    rf"|(?P<quantity>\d+\s*(?:{_alternation(UNITS)}))"
+    rf"|(?P<food>{_alternation(FOOD_KEYWORDS)})"
+)
+
+
+class TextFeatures(NamedTuple):
+    """Признаки сообщения: найденные ключевые слова еды, количество с единицей, стоп-слова"""
+    keywords: Tuple[str, ...]
+    has_quantity: bool
+    stop_words: Tuple[str, ...]
+
+    @property
+    def looks_like_food(self) -> bool:
+        """Есть ключевые слова еды или количество с единицей измерения"""
+        return bool(self.keywords) or self.has_quantity
+
+    @property
+    def is_food(self) -> Optional[bool]:
+        """True/False, если ответ очевиден без LLM, иначе None"""
+        if self.stop_words:
+            return False
+        return True if self.looks_like_food else None
+
+
+@lru_cache(maxsize=1024)
+def _classify(text_lower: str) -> TextFeatures:
+    keywords, stop_words = [], []
+    has_quantity = False
+    for match in _FEATURES_RE.finditer(text_lower):
+        if match.lastgroup == 'stop':
+            stop_words.append(match.group())
+        elif match.lastgroup == 'quantity':
+            has_quantity = True
+        else:
+            keywords.append(match.group())
+    return TextFeatures(tuple(dict.fromkeys(keywords)), has_quantity, tuple(dict.fromkeys(stop_words)))
+
+
+def classify_food_text(text: str) -> TextFeatures:
+    """Признаки еды в сообщении за один проход скомпилированного выражения.
+
+    Общий для handle_text и CalorieCounter.classify_locally; результат кэшируется, поэтому
+    повторная проверка того же сообщения в другом месте почти ничего не стоит.
+    """
+    return _classify(text.lower().strip())
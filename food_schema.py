@@ -0,0 +1,105 @@
+import math
+import logging
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Ответ модели на сообщение о еде: одна проверка "это еда?" и разбор продуктов в одном запросе
+FOOD_RESPONSE_SCHEMA = {
+    "type": "object",
+    "required": ["is_food", "items"],
+    "properties": {
+        "is_food": {"type": "boolean"},
+        "items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "required": ["name", "amount", "unit", "calories", "proteins", "fats", "carbs"],
+                "properties": {
+                    "name": {"type": "string"},
+                    "amount": {"type": "number"},
+                    "unit": {"type": "string"},
+                    "calories": {"type": "number"},
+                    "proteins": {"type": "number"},
+                    "fats": {"type": "number"},
+                    "carbs": {"type": "number"},
+                    "source": {"type": "string"},
+                },
+            },
+        },
+    },
+}
+
+# JSON-режим Groq: модель обязана вернуть валидный JSON-объект
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+_NUMBER_FIELDS = ('amount', 'calories', 'proteins', 'fats', 'carbs')
+
+
+def _number(value) -> Optional[float]:
+    """Число из ответа модели ("250" тоже число, 250.0 -> 250); bool и отрицательные не принимаются"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        try:
+            value = float(value.replace(',', '.'))
+        except ValueError:
+            return None
+    if not isinstance(value, (int, float)) or not math.isfinite(value) or value < 0:
+        return None
+    return int(value) if float(value).is_integer() else value
+
+
+def validate_item(item) -> Optional[Dict]:
+    """Продукт по схеме FOOD_RESPONSE_SCHEMA (числа приведены) или None, если продукт не подходит"""
+    if not isinstance(item, dict):
+        return None
+    name = item.get('name')
+    if not isinstance(name, str) or not name.strip():
+        return None
+    numbers = {field: _number(item.get(field)) for field in _NUMBER_FIELDS}
+    if any(value is None for value in numbers.values()):
+        return None
+    unit = item.get('unit')
+    source = item.get('source')
+    return {
+        'name': name.strip(),
+        'amount': numbers['amount'],
+        'unit': unit.strip() if isinstance(unit, str) and unit.strip() else 'г',
+        'calories': numbers['calories'],
+        'proteins': numbers['proteins'],
+        'fats': numbers['fats'],
+        'carbs': numbers['carbs'],
+        'source': source.strip() if isinstance(source, str) and source.strip() else 'Groq AI',
+    }
+
+
+def validate_food_response(data) -> Tuple[bool, List[Dict]]:
+    """(это еда, подходящие продукты) из ответа модели.
+
+    Ответ не по схеме - ValueError; отдельные продукты не по схеме отбрасываются.
+    Старый формат (просто массив продуктов) тоже принимается.
+    """
+    if isinstance(data, list):
+        data = {'is_food': bool(data), 'items': data}
+    if not isinstance(data, dict):
+        raise ValueError(f"ожидался JSON-объект, получено {type(data).__name__}")
+
+    items = data.get('items')
+    if items is None:
+        items = []
+    if not isinstance(items, list):
+        raise ValueError("поле items должно быть массивом")
+
+    is_food = data.get('is_food')
+    if not isinstance(is_food, bool):
+        is_food = bool(items)
+
+    valid = []
+    for item in items:
+        checked = validate_item(item)
+        if checked is None:
+            logger.warning(f"Продукт не соответствует схеме ответа: {item!r}")
+            continue
+        valid.append(checked)
+    return is_food, valid
@@ -0,0 +1,162 @@
+import re
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+
+from food_schema import validate_food_response, validate_item
+
+logger = logging.getLogger(__name__)
+
+
+def json_payload(text: str) -> str:
+    """JSON из ответа модели без JSON-режима: текст от первой { (или [) до последней } (или ])"""
+    text = text.strip()
+    if text.startswith(('{', '[')):
+        return text
+    start = min((i for i in (text.find('{'), text.find('[')) if i >= 0), default=-1)
+    end = max(text.rfind('}'), text.rfind(']'))
+    if start < 0 or end < start:
+        return text
+    return text[start:end + 1]
+
+
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+_LITERAL_RE = re.compile(r'\b(True|False|None)\b')
+_COMMENT_RE = re.compile(r'^\s*//.*$', re.MULTILINE)
+_LITERALS = {'True': 'true', 'False': 'false', 'None': 'null'}
+# Строка JSON (в том числе незакрытая в конце обрезанного ответа)
+_STRING_RE = re.compile(r'"(?:\\.|[^"\\])*(?:"|$)', re.DOTALL)
+
+
+def _repair_outside_strings(part: str) -> str:
+    part = _LITERAL_RE.sub(lambda match: _LITERALS[match.group(1)], part)
+    return _TRAILING_COMMA_RE.sub(r'\1', part)
+
+
+def repair_json(text: str) -> str:
+    """Частые ошибки модели в JSON: висячие запятые, True/False/None, кавычки “”, комментарии //.
+
+    Литералы и запятые правятся только вне строк: название "None fat yogurt" не меняется.
+    """
+    text = text.replace('“', '"').replace('”', '"')
+    text = _COMMENT_RE.sub('', text)
+    parts, position = [], 0
+    for match in _STRING_RE.finditer(text):
+        parts += [_repair_outside_strings(text[position:match.start()]), match.group()]
+        position = match.end()
+    parts.append(_repair_outside_strings(text[position:]))
+    return ''.join(parts)
+
+
+def loads_lenient(text: str):
+    """json.loads, при ошибке - после repair_json (ошибка и там - ValueError)"""
+    try:
+        return json.loads(text)
+    except ValueError:
+        return json.loads(repair_json(text))
+
+
+_NOT_FOOD_RE = re.compile(r'"is_food"\s*:\s*false', re.IGNORECASE)
+
+
+def parse_food_response(text: str) -> Tuple[bool, List[Dict], bool]:
+    """(это еда, продукты, ответ разобран целиком) из ответа модели на разбор еды.
+
+    Если ответ не читается как JSON целиком (обрезан по max_tokens, текст вокруг JSON,
+    один испорченный продукт), из него достаются все законченные продукты - каждый
+    проверяется по схеме отдельно, и третий элемент - False. Ни одного продукта
+    и нет явного is_food: false - ValueError.
+    """
+    try:
+        is_food, items = validate_food_response(loads_lenient(json_payload(text)))
+        return is_food, items, True
+    except ValueError as e:
+        error = e
+
+    start = min((i for i in (text.find('{'), text.find('[')) if i >= 0), default=-1)
+    parser = ItemStreamParser()
+    if start >= 0:
+        parser.feed(text[start:])
+    if parser.items:
+        logger.warning(f"Ответ модели разобран частично ({error}), восстановлено продуктов: {len(parser.items)}")
+        return True, parser.items, False
+    if _NOT_FOOD_RE.search(text):
+        return False, [], True
+    raise ValueError(f"в ответе нет ни одного целого продукта: {error}")
+
+
+class ItemStreamParser:
+    """Разбор продуктов из ответа модели по мере его поступления (streaming).
+
+    feed() получает весь текст, пришедший к этому моменту, и досматривает только новую часть:
+    каждый законченный объект из массива items сразу проверяется по схеме. Если текст
+    начался заново (повтор запроса на другой модели), разбор тоже начинается сначала.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.text = ''
+        self.items: List[Dict] = []
+        self._stack: List[str] = []        # '{' или '[' открытых контейнеров
+        self._key: Optional[str] = None     # последний ключ на верхнем уровне объекта
+        self._items_depth: Optional[int] = None
+        self._item_start: Optional[int] = None
+        self._in_string = False
+        self._escape = False
+        self._string_start = 0
+
+    def feed(self, text: str) -> List[Dict]:
+        """Новые продукты, законченные в text (весь ответ к этому моменту)"""
+        if not text.startswith(self.text):
+            self.reset()
+        position = len(self.text)
+        self.text = text
+        new_items = []
+        for index in range(position, len(text)):
+            item = self._step(text[index], index)
+            if item is not None:
+                new_items.append(item)
+        self.items += new_items
+        return new_items
+
+    def _step(self, char: str, index: int) -> Optional[Dict]:
+        if self._in_string:
+            if self._escape:
+                self._escape = False
+            elif char == '\\':
+                self._escape = True
+            elif char == '"':
+                self._in_string = False
+                if len(self._stack) == 1 and self._stack[0] == '{':
+                    # Строка на верхнем уровне объекта: ключ или значение, нужен только ключ items
+                    self._key = self.text[self._string_start + 1:index]
+            return None
+
+        if char == '"':
+            self._in_string = True
+            self._string_start = index
+        elif char in '{[':
+            depth = len(self._stack)
+            if char == '[' and self._items_depth is None and (
+                depth == 0 or (depth == 1 and self._stack[0] == '{' and self._key == 'items')
+            ):
+                # Массив items (или весь ответ - массив, как в старом формате)
+                self._items_depth = depth + 1
+            elif char == '{' and self._items_depth is not None and depth == self._items_depth:
+                self._item_start = index
+            self._stack.append(char)
+        elif char in '}]' and self._stack:
+            self._stack.pop()
+            depth = len(self._stack)
+            if char == '}' and self._item_start is not None and depth == self._items_depth:
+                raw = self.text[self._item_start:index + 1]
+                self._item_start = None
+                try:
+                    return validate_item(loads_lenient(raw))
+                except ValueError:
+                    logger.debug(f"Не удалось разобрать продукт из потока: {raw[:200]}")
+            elif char == ']' and self._items_depth is not None and depth == self._items_depth - 1:
+                self._items_depth = -1  # массив закончился, дальше продуктов нет
+        return None
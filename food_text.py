@@ -0,0 +1,91 @@
+import re
+from typing import List, Optional, Tuple
+
+
+# Единицы измерения: вариант написания -> (каноническая единица, множитель)
+UNIT_ALIASES = {
+    'г': ('г', 1), 'гр': ('г', 1), 'грамм': ('г', 1), 'грамма': ('г', 1), 'граммов': ('г', 1),
+    'кг': ('г', 1000), 'килограмм': ('г', 1000), 'килограмма': ('г', 1000), 'килограммов': ('г', 1000),
+    'мл': ('мл', 1), 'миллилитр': ('мл', 1), 'миллилитра': ('мл', 1), 'миллилитров': ('мл', 1),
+    'л': ('мл', 1000), 'литр': ('мл', 1000), 'литра': ('мл', 1000), 'литров': ('мл', 1000),
+    'шт': ('шт', 1), 'штука': ('шт', 1), 'штуки': ('шт', 1), 'штук': ('шт', 1),
+    'порция': ('порция', 1), 'порции': ('порция', 1), 'порций': ('порция', 1), 'порц': ('порция', 1),
+}
+
+# Короткое написание единицы (без перевода кг в граммы - исходное число сохраняется)
+_SHORT_UNITS = {
+    ('г', 1): 'г', ('г', 1000): 'кг', ('мл', 1): 'мл', ('мл', 1000): 'л',
+    ('шт', 1): 'шт', ('порция', 1): 'порц',
+}
+
+_UNIT_PATTERN = '|'.join(sorted((re.escape(unit) for unit in UNIT_ALIASES), key=len, reverse=True))
+QUANTITY_RE = re.compile(r'(\d+(?:[.,]\d+)?)\s*(' + _UNIT_PATTERN + r')\.?(?![а-яёa-z])', re.IGNORECASE)
+
+# Число без единицы в начале или конце: "2 яйца", "банан 1". Большие числа без единицы
+# скорее граммы ("200 гречки"), поэтому штуками считаем только до MAX_BARE_COUNT
+BARE_COUNT_RE = re.compile(r'^(?:(\d+)\s+(\D.*)|(.*\D)\s+(\d+))$')
+MAX_BARE_COUNT = 20
+
+
+def normalize_product_name(name: str) -> str:
+    """Нормализованное название продукта (ключ для поиска и статистики)"""
+    if not name:
+        return ''
+    name_key = name.lower().replace('ё', 'е')
+    name_key = re.sub(r'[^\w\s]', ' ', name_key)
+    name_key = re.sub(r'\s+', ' ', name_key).strip()
+    return name_key
+
+
+def parse_quantity(text: str) -> Tuple[str, Optional[float], Optional[str]]:
+    """Разбор "борщ мамин 350г" -> ("борщ мамин", 350.0, "г").
+
+    Килограммы и литры переводятся в граммы и миллилитры, "шт"/"штук" -> "шт",
+    "порц"/"порции" -> "порция". Небольшое число без единицы ("2 яйца") считается штуками.
+    Если количество не указано, возвращается (название, None, None).
+    """
+    matches = list(QUANTITY_RE.finditer(text))
+    if not matches:
+        count = BARE_COUNT_RE.match(text.strip())
+        if count:
+            number = count.group(1) or count.group(4)
+            name = count.group(2) or count.group(3)
+            if 0 < int(number) <= MAX_BARE_COUNT:
+                return normalize_product_name(name), float(number), 'шт'
+        return normalize_product_name(text), None, None
+
+    # Берем последнее упоминание количества ("2 порции по 300г" -> 300г)
+    match = matches[-1]
+    amount = float(match.group(1).replace(',', '.'))
+    unit, multiplier = UNIT_ALIASES[match.group(2).lower()]
+    name = text[:match.start()] + ' ' + text[match.end():]
+    return normalize_product_name(name), amount * multiplier, unit
+
+
+def normalize_food_text(text: str) -> str:
+    """Нормализация всего сообщения о еде для кэша: "Овсянка  200 г, Банан 1 шт." -> "овсянка 200г, банан 1шт".
+
+    Регистр, ё, лишние пробелы, запятая в дробях и пробел между числом и единицей
+    не меняют смысла, поэтому такие варианты должны давать один ключ.
+    """
+    if not text:
+        return ''
+    normalized = text.lower().replace('ё', 'е')
+    normalized = re.sub(r'(\d),(\d)', r'\1.\2', normalized)
+    normalized = re.sub(r'(\d+)\.0+(?!\d)', r'\1', normalized)
+    normalized = QUANTITY_RE.sub(
+        lambda m: m.group(1) + _SHORT_UNITS[UNIT_ALIASES[m.group(2).lower()]], normalized
+    )
+    normalized = re.sub(r'\s*([,;+])\s*', r'\1 ', normalized)
+    normalized = re.sub(r'\s+', ' ', normalized).strip(' .!;,')
+    return normalized
+
+
+# Разделители продуктов в одном сообщении: "овсянка 200г, банан 1шт и кофе 200мл"
+_PARTS_SPLIT_RE = re.compile(r'[,;\n+]|\s+и\s+', re.IGNORECASE)
+
+
+def split_food_parts(text: str) -> List[str]:
+    """Разбиение сообщения на отдельные продукты (префикс вида "Завтрак:" отбрасывается)"""
+    text = re.sub(r'^[^:\d]{1,30}:', '', text.strip())
+    return [part.strip() for part in _PARTS_SPLIT_RE.split(text) if part and part.strip()]
@@ -0,0 +1,120 @@
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, Set
+
+from food_text import normalize_product_name
+from nutrition_table import table_key
+
+# Короткие слова ("суп", "сыр", "рис") слишком легко спутать, их не исправляем
+MIN_WORD_LENGTH = 4
+
+_WORD_RE = re.compile(r'[а-яёa-z]+', re.IGNORECASE)
+
+
+def trigrams(word: str) -> Set[str]:
+    """Триграммы слова с границами: "суп" -> {" су", "суп", "уп "}"""
+    padded = f" {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_distance(word: str) -> int:
+    """Допустимое число опечаток: одна в обычном слове, две в длинном"""
+    return 1 if len(word) < 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Расстояние Дамерау-Левенштейна (замена, вставка, удаление, перестановка соседних букв).
+
+    Если расстояние больше limit, возвращается limit + 1 без досчета всей матрицы.
+    """
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    before_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            value = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if before_previous and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                value = min(value, before_previous[j - 2] + 1)
+            current[j] = value
+        if min(current) > limit:
+            return limit + 1
+        before_previous, previous = previous, current
+    return min(previous[-1], limit + 1)
+
+
+class FuzzyIndex:
+    """Нечеткий поиск по словам из названий продуктов: исправление опечаток без обращения к LLM.
+
+    Кандидаты отбираются по общим триграммам, затем проверяются расстоянием Дамерау-Левенштейна.
+    Слово, совпадающее с известным по основе ("гречки" и "гречка"), считается написанным верно.
+    """
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.words: Dict[str, int] = {}  # слово -> в скольких названиях встречается
+        self.stems: Set[str] = set()
+        self._by_trigram: Dict[str, Set[str]] = defaultdict(set)
+        self.add_names(names)
+
+    def add_name(self, name: str):
+        """Добавление слов названия продукта в индекс"""
+        for word in normalize_product_name(name).split():
+            if len(word) < MIN_WORD_LENGTH or not word.isalpha():
+                continue
+            if word not in self.words:
+                for gram in trigrams(word):
+                    self._by_trigram[gram].add(word)
+                self.stems.add(table_key(word))
+            self.words[word] = self.words.get(word, 0) + 1
+
+    def add_names(self, names: Iterable[str]):
+        for name in names:
+            self.add_name(name)
+
+    def is_known(self, word: str) -> bool:
+        """Слово не нужно исправлять: короткое, известное или служебное ("съел", "из")"""
+        if len(word) < MIN_WORD_LENGTH or not word.isalpha() or word in self.words:
+            return True
+        stem = table_key(word)
+        return not stem or stem in self.stems
+
+    def correct_word(self, word: str) -> str:
+        """Ближайшее известное слово или само слово, если похожих нет"""
+        word = word.lower().replace('ё', 'е')
+        if self.is_known(word):
+            return word
+
+        grams = trigrams(word)
+        shared: Dict[str, int] = defaultdict(int)
+        for gram in grams:
+            for candidate in self._by_trigram.get(gram, ()):
+                shared[candidate] += 1
+
+        limit = max_distance(word)
+        # Одна правка меняет не больше четырех триграмм: остальных кандидатов не проверяем
+        min_shared = max(1, len(grams) - 4 * limit)
+        best, best_rank = word, None
+        for candidate, count in shared.items():
+            if count < min_shared:
+                continue
+            distance = edit_distance(word, candidate, limit)
+            if distance > limit:
+                continue
+            rank = (distance, -count, -self.words[candidate])
+            if best_rank is None or rank < best_rank:
+                best, best_rank = candidate, rank
+        return best
+
+    def correct_text(self, text: str) -> str:
+        """Текст с исправленными названиями; числа, единицы и пунктуация не меняются"""
+        def replace(match):
+            word = match.group(0)
+            corrected = self.correct_word(word)
+            return word if corrected == word.lower().replace('ё', 'е') else corrected
+        return _WORD_RE.sub(replace, text)
+
+    def all_known(self, text: str) -> bool:
+        """Все слова текста есть в индексе (опечаток в названиях нет)"""
+        return all(self.is_known(word.lower().replace('ё', 'е')) for word in _WORD_RE.findall(text))
@@ -0,0 +1,164 @@
+import os
+import sqlite3
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Sequence
+
+logger = logging.getLogger(__name__)
+
+SYSTEM_USER = 0  # запросы не от пользователя: рассылки, проверка при запуске
+
+# Лимиты на день по умолчанию (переопределяются в .env, 0 - без лимита)
+USER_DAILY_REQUESTS = 150
+USER_DAILY_TOKENS = 60000
+DAILY_REQUESTS = 10000
+DAILY_TOKENS = 1000000
+
+
+class BudgetExceeded(Exception):
+    """Дневной бюджет запросов к LLM исчерпан (у пользователя или у бота в целом)"""
+
+
+class LLMBudget:
+    """Дневной бюджет запросов к LLM: на каждого пользователя и общий на бота.
+
+    Каждый запрос к модели (включая повторы на другой модели) учитывается за пользователей,
+    для которых он сделан; запрос сразу за нескольких (пакетный разбор, одинаковые запросы,
+    объединенные SingleFlight) делится между ними поровну. Пользователь, исчерпавший бюджет,
+    получает только кэш и локальный разбор, а общий бюджет не дает одному пользователю
+    израсходовать квоту Groq за всех.
+    """
+
+    def __init__(self, db_path: str = "fitness_bot.db",
+                 user_requests: Optional[int] = None, user_tokens: Optional[int] = None,
+                 total_requests: Optional[int] = None, total_tokens: Optional[int] = None):
+        self.db_path = db_path
+        self.user_requests = user_requests if user_requests is not None else \
+            int(os.getenv("LLM_USER_DAILY_REQUESTS", USER_DAILY_REQUESTS))
+        self.user_tokens = user_tokens if user_tokens is not None else \
+            int(os.getenv("LLM_USER_DAILY_TOKENS", USER_DAILY_TOKENS))
+        self.total_requests = total_requests if total_requests is not None else \
+            int(os.getenv("LLM_DAILY_REQUESTS", DAILY_REQUESTS))
+        self.total_tokens = total_tokens if total_tokens is not None else \
+            int(os.getenv("LLM_DAILY_TOKENS", DAILY_TOKENS))
+        self.rejected = 0
+        self.init_database()
+
+    def get_connection(self):
+        """Получение соединения с базой данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """Инициализация таблицы расхода по пользователям"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_budget (
+                day DATE NOT NULL,
+                user_id INTEGER NOT NULL,
+                requests REAL NOT NULL DEFAULT 0,
+                tokens INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, user_id)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def _users(user_ids: Sequence[Optional[int]]) -> List[int]:
+        users = [user_id for user_id in user_ids if user_id]
+        return users or [SYSTEM_USER]
+
+    def record(self, user_ids: Sequence[Optional[int]] = (), tokens: int = 0):
+        """Учет одного запроса к модели за пользователей user_ids (пусто - запрос бота)"""
+        users = self._users(user_ids)
+        share = 1 / len(users)
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.executemany("""
+                INSERT INTO llm_budget (day, user_id, requests, tokens) VALUES (?, ?, ?, ?)
+                ON CONFLICT (day, user_id) DO UPDATE SET
+                    requests = requests + excluded.requests,
+                    tokens = tokens + excluded.tokens
+            """, [(date.today().isoformat(), user_id, share, round((tokens or 0) * share)) for user_id in users])
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            # Учет не должен ломать ответ пользователю
+            logger.error(f"Ошибка при учете бюджета LLM: {e}")
+
+    def allows(self, user_ids: Sequence[Optional[int]] = ()) -> bool:
+        """Можно ли сделать запрос за пользователей user_ids: никто из них и бот в целом не исчерпал бюджет"""
+        users = [user_id for user_id in self._users(user_ids) if user_id != SYSTEM_USER]
+        # Общий расход и наибольший расход среди users за день - одним запросом
+        in_users = f"user_id IN ({','.join('?' * len(users))})" if users else "0"
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute(f"""
+            SELECT COALESCE(SUM(requests), 0), COALESCE(SUM(tokens), 0),
+                   COALESCE(MAX(CASE WHEN {in_users} THEN requests END), 0),
+                   COALESCE(MAX(CASE WHEN {in_users} THEN tokens END), 0)
+            FROM llm_budget WHERE day = ?
+        """, (*users, *users, date.today().isoformat()))
+        total_requests, total_tokens, user_requests, user_tokens = cursor.fetchone()
+        conn.close()
+
+        if _over(total_requests, self.total_requests) or _over(total_tokens, self.total_tokens):
+            self.rejected += 1
+            logger.warning(f"Общий дневной бюджет LLM исчерпан: {total_requests:.0f} запросов, {total_tokens} токенов")
+            return False
+        if _over(user_requests, self.user_requests) or _over(user_tokens, self.user_tokens):
+            self.rejected += 1
+            logger.info(f"Дневной бюджет LLM исчерпан у пользователей {users}: "
+                        f"до {user_requests:.0f} запросов, {user_tokens} токенов")
+            return False
+        return True
+
+    def get_stats(self, days: int = 7, limit: int = 10) -> Dict:
+        """Расход за days дней: по дням (запросы, токены, пользователи) и пользователи с наибольшим расходом"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT day, SUM(requests) as requests, SUM(tokens) as tokens,
+                   SUM(CASE WHEN user_id != ? THEN 1 ELSE 0 END) as users
+            FROM llm_budget
+            WHERE day >= ?
+            GROUP BY day
+            ORDER BY day DESC
+        """, (SYSTEM_USER, since))
+        by_day = [dict(row) for row in cursor.fetchall()]
+        cursor.execute("""
+            SELECT user_id, SUM(requests) as requests, SUM(tokens) as tokens,
+                   SUM(CASE WHEN day = ? THEN requests ELSE 0 END) as today_requests,
+                   SUM(CASE WHEN day = ? THEN tokens ELSE 0 END) as today_tokens
+            FROM llm_budget
+            WHERE day >= ?
+            GROUP BY user_id
+            ORDER BY tokens DESC
+            LIMIT ?
+        """, (date.today().isoformat(), date.today().isoformat(), since, limit))
+        by_user = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return {'days': by_day, 'users': by_user}
+
+    def get_user_days(self, user_id: int, days: int = 7) -> List[Dict]:
+        """Расход пользователя по дням за days дней"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT day, requests, tokens FROM llm_budget
+            WHERE user_id = ? AND day >= ?
+            ORDER BY day DESC
+        """, (user_id, since))
+        rows = [dict(row) for row in cursor.fetchall()]
+        conn.close()
+        return rows
+
+
+def _over(used: float, limit: int) -> bool:
+    return bool(limit) and used >= limit
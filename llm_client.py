@@ -0,0 +1,256 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+from types import SimpleNamespace
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from model_router import ModelRouter
+from llm_budget import BudgetExceeded
+from llm_limiter import LLMLimiter, lane_for
+from llm_providers import GROQ, LLMProvider, groq_limiter, load_providers, load_routes
+
+logger = logging.getLogger(__name__)
+
+# Модели Groq по убыванию качества: следующая используется, если предыдущая недоступна
+DEFAULT_MODELS = [
+    "llama-3.3-70b-versatile",  # Самая мощная бесплатная модель Groq
+    "llama-3.1-70b-versatile",  # Альтернатива
+    "llama-3.1-8b-instant"       # Fallback на быструю модель
+]
+FAST_MODEL = "llama-3.1-8b-instant"
+
+DEFAULT_TIMEOUT = 30.0
+MAX_CONNECTIONS = 20
+
+
+class LLMClient:
+    """Асинхронный доступ к LLM: общие пулы HTTP-соединений, таймауты и отмена запросов.
+
+    Все запросы к LLM в боте идут через этот класс, поэтому ожидание ответа
+    не блокирует цикл событий и остальные чаты, а ограничитель провайдера (LLMLimiter)
+    не дает превысить лимиты Groq и пропускает ответы пользователям вперед рассылок.
+    Дневной бюджет (LLMBudget) проверяется перед каждым запросом и учитывает расход по пользователям.
+
+    Провайдеры (llm_providers.py): Groq, свой OpenAI-совместимый сервер и заглушка. Класс запроса
+    направляется к своему провайдеру (LLM_ROUTE_<КЛАСС> в .env), при его недоступности -
+    к провайдеру по умолчанию (LLM_PROVIDER). client - готовый клиент вместо Groq (для тестов).
+    """
+
+    def __init__(self, api_key: Optional[str] = None, timeout: float = DEFAULT_TIMEOUT,
+                 max_connections: int = MAX_CONNECTIONS, client=None, usage=None, limiter=None,
+                 budget=None, providers: Optional[Dict[str, LLMProvider]] = None,
+                 routes: Optional[Dict[str, str]] = None, default_provider: Optional[str] = None):
+        self.api_key = api_key or os.getenv("GROQ_API_KEY")
+        self.timeout = timeout
+        self.router = ModelRouter()
+        self.usage = usage  # UsageLog: расход токенов по версиям промптов
+        self.budget = budget  # LLMBudget: дневной бюджет по пользователям
+
+        if providers is None:
+            if client is not None:
+                providers = {GROQ: LLMProvider(GROQ, client, limiter or groq_limiter())}
+            else:
+                providers = load_providers(self.api_key, timeout, max_connections, limiter)
+        self.providers = providers
+        default = (default_provider or os.getenv("LLM_PROVIDER", GROQ)).strip().lower()
+        if default not in providers and providers:
+            logger.warning(f"Провайдер LLM '{default}' недоступен, по умолчанию используется {next(iter(providers))}")
+            default = next(iter(providers))
+        self.default_provider = default
+        self.routes = routes if routes is not None else load_routes(default)
+        if not providers:
+            logger.warning("Ни один провайдер LLM не настроен, LLM недоступен")
+
+    @property
+    def provider(self) -> Optional[LLMProvider]:
+        """Провайдер по умолчанию"""
+        return self.providers.get(self.default_provider)
+
+    @property
+    def client(self):
+        return self.provider.client if self.provider else None
+
+    @property
+    def limiter(self) -> LLMLimiter:
+        """Ограничитель провайдера по умолчанию (его очереди показывает /llm_status)"""
+        return self.provider.limiter if self.provider else groq_limiter()
+
+    @property
+    def available(self) -> bool:
+        return bool(self.providers)
+
+    def attempts(self, request_class: Optional[str] = None,
+                 models: Optional[List[str]] = None) -> List[Tuple[LLMProvider, str]]:
+        """(провайдер, модель) в порядке попыток: провайдер класса запроса, затем провайдер по умолчанию.
+
+        Модели Groq выбирает роутер; у своего сервера и заглушки - свой список моделей.
+        """
+        names = [self.routes.get(request_class, self.default_provider), self.default_provider]
+        attempts = []
+        for name in dict.fromkeys(names):
+            provider = self.providers.get(name)
+            if provider is None:
+                continue
+            models_order = provider.models or self.router.route(request_class, models)
+            attempts += [(provider, model) for model in models_order]
+        return attempts
+
+    def admits(self, users: Sequence[Optional[int]] = ()) -> bool:
+        """Дневной бюджет пользователей users (и бота в целом) позволяет запрос к LLM"""
+        return self.budget is None or self.budget.allows(users)
+
+    async def _create(self, client, **params):
+        """Запрос к API; возвращает (ответ, заголовки) - заголовки нужны для учета лимитов Groq"""
+        completions = client.chat.completions
+        raw_api = getattr(completions, 'with_raw_response', None)
+        if raw_api is None:
+            return await completions.create(**params), None
+        raw = await raw_api.create(**params)
+        response = raw.parse()
+        if inspect.isawaitable(response):
+            response = await response
+        return response, raw.headers
+
+    async def _request(self, client, on_text, **params):
+        """Запрос целиком; потоковый ответ собирается в объект того же вида, что и обычный"""
+        response, headers = await self._create(client, **params)
+        if on_text is None:
+            return response, headers
+
+        text = ''
+        usage = None
+        async for chunk in response:
+            # Groq присылает расход токенов в последнем фрагменте (x_groq.usage)
+            usage = getattr(chunk, 'usage', None) or getattr(getattr(chunk, 'x_groq', None), 'usage', None) or usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta.content
+            if delta:
+                text += delta
+                await on_text(text)
+        message = SimpleNamespace(content=text)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=usage), headers
+
+    async def complete(self, messages: List[Dict], model: Optional[str] = None, temperature: float = 0.1,
+                       max_tokens: int = 300, timeout: Optional[float] = None,
+                       response_format: Optional[Dict] = None, prompt_version: Optional[str] = None,
+                       request_class: Optional[str] = None,
+                       on_text: Optional[Callable[[str], Awaitable[None]]] = None,
+                       users: Sequence[Optional[int]] = (),
+                       provider: Optional[LLMProvider] = None) -> Dict:
+        """Один запрос к модели. По таймауту запрос отменяется и выбрасывается asyncio.TimeoutError.
+
+        response_format={"type": "json_object"} включает JSON-режим: модель возвращает валидный JSON.
+        prompt_version - версия шаблона из prompts.py для учета расхода токенов.
+        request_class задает очередь ограничителя: фоновые запросы ждут, пока есть интерактивные.
+        Таймаут считается с момента отправки запроса, без ожидания в очереди.
+        on_text включает потоковый ответ: после каждого фрагмента вызывается с текстом,
+        полученным к этому моменту (таймаут - на весь ответ целиком).
+        users - пользователи, за которых запрос учитывается в дневном бюджете (пусто - запрос бота).
+        provider - куда отправить запрос (по умолчанию - провайдер по умолчанию); model по умолчанию -
+        первая модель провайдера или FAST_MODEL для Groq.
+        """
+        provider = provider or self.provider
+        if provider is None:
+            raise RuntimeError("LLM клиент недоступен")
+        model = model or (provider.models[0] if provider.models else FAST_MODEL)
+
+        params = {}
+        if response_format is not None:
+            params['response_format'] = response_format
+        if on_text is not None:
+            params['stream'] = True
+
+        waited = await provider.limiter.acquire(lane_for(request_class))
+        if waited > 1:
+            logger.info(f"Запрос к {model} ждал в очереди {waited:.1f} с")
+        headers = None
+        started = time.monotonic()
+        try:
+            response, headers = await asyncio.wait_for(
+                self._request(
+                    provider.client,
+                    on_text,
+                    model=model,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    **params
+                ),
+                timeout=timeout or self.timeout
+            )
+        except asyncio.CancelledError:
+            self.router.record_cancelled(model)
+            raise
+        except Exception as e:
+            # У ошибки 429 в заголовках retry-after - пауза для всех запросов
+            headers = getattr(getattr(e, 'response', None), 'headers', None)
+            self.router.record_failure(model)
+            if self.usage and prompt_version:
+                self.usage.record(prompt_version, model, failed=True)
+            if self.budget:
+                self.budget.record(users)
+            raise
+        finally:
+            provider.limiter.release(headers)
+        latency = time.monotonic() - started
+        self.router.record_success(model, latency)
+        usage = getattr(response, 'usage', None)
+        result = {
+            'text': (response.choices[0].message.content or '').strip(),
+            'model': model,
+            'provider': provider.name,
+            'prompt_tokens': getattr(usage, 'prompt_tokens', None),
+            'completion_tokens': getattr(usage, 'completion_tokens', None),
+            'latency': latency
+        }
+        if self.usage and prompt_version:
+            self.usage.record(prompt_version, model, result['prompt_tokens'], result['completion_tokens'], latency)
+        if self.budget:
+            self.budget.record(users, (result['prompt_tokens'] or 0) + (result['completion_tokens'] or 0))
+        return result
+
+    async def complete_first(self, messages: List[Dict], models: Optional[List[str]] = None,
+                             request_class: Optional[str] = None, **kwargs) -> Dict:
+        """Запрос к первой доступной модели (ошибка или таймаут - пробуем следующую).
+
+        Порядок моделей выбирает роутер по классу запроса ('parse', 'classify', 'barcode',
+        'motivation'); отключенные после серии ошибок модели пропускаются.
+        Если дневной бюджет исчерпан (см. admits), выбрасывается BudgetExceeded без запроса к модели.
+        """
+        if not self.admits(kwargs.get('users', ())):
+            raise BudgetExceeded("дневной бюджет запросов к LLM исчерпан")
+        last_error = None
+        for provider, model_name in self.attempts(request_class, models):
+            if not self.router.allow(model_name):
+                continue
+            try:
+                logger.info(f"Пробуем модель: {model_name} ({provider.name})")
+                result = await self.complete(messages, model=model_name, request_class=request_class,
+                                             provider=provider, **kwargs)
+                logger.info(f"Успешно использована модель: {model_name} ({result['latency']:.2f} с)")
+                return result
+            except asyncio.TimeoutError as e:
+                logger.warning(f"Модель {model_name} не ответила вовремя")
+                last_error = e
+            except Exception as e:
+                logger.warning(f"Модель {model_name} недоступна: {e}")
+                last_error = e
+        raise Exception(f"Все модели недоступны. Последняя ошибка: {last_error!r}")
+
+    async def check(self) -> bool:
+        """Проверочный запрос при запуске (выполняется в фоне и не задерживает старт бота)"""
+        try:
+            await self.complete([{"role": "user", "content": "test"}], max_tokens=5, timeout=15)
+            logger.info(f"✅ LLM клиент работает ({self.default_provider})")
+            return True
+        except Exception as e:
+            logger.warning(f"LLM клиент создан, но тестовый запрос не прошел: {e!r}")
+            return False
+
+    async def close(self):
+        """Закрытие пулов соединений всех провайдеров"""
+        for provider in self.providers.values():
+            await provider.close()
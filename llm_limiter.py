@@ -0,0 +1,209 @@
+import re
+import time
+import heapq
+import asyncio
+import logging
+from itertools import count
+from typing import Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Очереди по приоритету: ответ пользователю важнее фоновой рассылки мотивации
+INTERACTIVE = 0
+BACKGROUND = 1
+LANE_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+LANES = {
+    'parse': INTERACTIVE,
+    'classify': INTERACTIVE,
+    'barcode': INTERACTIVE,
+    'motivation': BACKGROUND,
+}
+
+MAX_CONCURRENT = 6         # одновременных запросов к Groq
+REQUESTS_PER_MINUTE = 30   # лимит бесплатного тарифа Groq
+INTERACTIVE_RESERVE = 1    # слотов, которые фоновые запросы не занимают
+TOKEN_RESERVE = 1500       # остаток токенов в минуту, который фоновые запросы не расходуют
+DEFAULT_RETRY_AFTER = 10.0
+
+
+def lane_for(request_class: Optional[str]) -> int:
+    """Очередь для класса запроса (неизвестный класс - интерактивный)"""
+    return LANES.get(request_class, INTERACTIVE)
+
+
+def parse_reset(value: Optional[str]) -> Optional[float]:
+    """Секунды из заголовков Groq: "7.66s", "2m59.56s", "1h2m", "120ms" или просто число"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = re.findall(r'(\d+(?:\.\d+)?)(ms|h|m|s)', value)
+    if not parts or ''.join(number + unit for number, unit in parts) != value:
+        return None
+    scale = {'h': 3600.0, 'm': 60.0, 's': 1.0, 'ms': 0.001}
+    return sum(float(number) * scale[unit] for number, unit in parts)
+
+
+def _header_int(headers, name: str) -> Optional[int]:
+    try:
+        return int(float(headers.get(name)))
+    except (TypeError, ValueError):
+        return None
+
+
+class LLMLimiter:
+    """Общий ограничитель запросов к Groq: семафор, token bucket и очереди по приоритету.
+
+    Запрос ждет, пока есть свободный слот и токен в bucket (requests_per_minute в минуту),
+    первыми обслуживаются интерактивные запросы. Заголовки x-ratelimit-* и retry-after
+    из ответов Groq ставят паузу до сброса лимита: при нехватке токенов останавливаются
+    только фоновые запросы, при исчерпании лимита или ответе 429 - все.
+    """
+
+    def __init__(self, max_concurrent: int = MAX_CONCURRENT,
+                 requests_per_minute: float = REQUESTS_PER_MINUTE,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_concurrent = max(1, max_concurrent)
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, float(requests_per_minute))
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self.active = 0
+        self.paused_until = 0.0             # для всех запросов
+        self.background_paused_until = 0.0  # только для фоновых
+        self._waiters: List = []            # (lane, порядок, future)
+        self._sequence = count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.rate_limited = 0
+        self.lane_stats = {lane: {'granted': 0, 'wait_total': 0.0, 'wait_max': 0.0, 'max_depth': 0}
+                           for lane in LANE_NAMES}
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _delay(self, lane: int, now: float) -> Optional[float]:
+        """Через сколько секунд можно отправить запрос из очереди; None - ждем освобождения слота"""
+        limit = self.max_concurrent if lane == INTERACTIVE else max(1, self.max_concurrent - INTERACTIVE_RESERVE)
+        if self.active >= limit:
+            return None
+        paused_until = self.paused_until
+        if lane == BACKGROUND:
+            paused_until = max(paused_until, self.background_paused_until)
+        delay = max(0.0, paused_until - now)
+        if self.tokens < 1:
+            delay = max(delay, (1 - self.tokens) / self.rate if self.rate > 0 else DEFAULT_RETRY_AFTER)
+        return delay
+
+    def _grant(self):
+        self.tokens -= 1
+        self.active += 1
+
+    def _dispatch(self):
+        """Выдача слотов ожидающим по приоритету; при паузе - повторная попытка по таймеру"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        now = self.clock()
+        self._refill(now)
+        while self._waiters:
+            lane, _, future = self._waiters[0]
+            if future.done():  # ожидание отменено
+                heapq.heappop(self._waiters)
+                continue
+            delay = self._delay(lane, now)
+            if delay is None:
+                return  # освободится слот - release() вызовет снова
+            if delay > 0:
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+            heapq.heappop(self._waiters)
+            self._grant()
+            future.set_result(None)
+
+    async def acquire(self, lane: int = INTERACTIVE) -> float:
+        """Ожидание слота для запроса; возвращает время ожидания в секундах"""
+        started = self.clock()
+        self._refill(started)
+        queued = any(not future.done() for waiting_lane, _, future in self._waiters if waiting_lane <= lane)
+        if not queued and self._delay(lane, started) == 0:
+            self._grant()
+        else:
+            future = asyncio.get_running_loop().create_future()
+            heapq.heappush(self._waiters, (lane, next(self._sequence), future))
+            stats = self.lane_stats[lane]
+            stats['max_depth'] = max(stats['max_depth'], self.queue_depth(lane))
+            self._dispatch()
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()  # слот выдан, но ждавший уже отменен
+                raise
+
+        waited = self.clock() - started
+        stats = self.lane_stats[lane]
+        stats['granted'] += 1
+        stats['wait_total'] += waited
+        stats['wait_max'] = max(stats['wait_max'], waited)
+        return waited
+
+    def release(self, headers=None):
+        """Освобождение слота; headers - заголовки ответа Groq для учета его лимитов"""
+        self.active = max(0, self.active - 1)
+        if headers is not None:
+            self.update_from_headers(headers)
+        if self._waiters:
+            self._dispatch()
+
+    def update_from_headers(self, headers):
+        """Пауза до сброса лимита по заголовкам retry-after и x-ratelimit-* ответа Groq"""
+        now = self.clock()
+        retry_after = parse_reset(headers.get('retry-after'))
+        if retry_after is not None:
+            self.rate_limited += 1
+            self.paused_until = max(self.paused_until, now + retry_after)
+            logger.warning(f"Groq: превышен лимит запросов, пауза {retry_after:.1f} с")
+
+        remaining_requests = _header_int(headers, 'x-ratelimit-remaining-requests')
+        if remaining_requests is not None and remaining_requests <= 0:
+            reset = parse_reset(headers.get('x-ratelimit-reset-requests')) or DEFAULT_RETRY_AFTER
+            self.paused_until = max(self.paused_until, now + reset)
+            logger.warning(f"Groq: дневной лимит запросов исчерпан, пауза {reset:.0f} с")
+
+        remaining_tokens = _header_int(headers, 'x-ratelimit-remaining-tokens')
+        if remaining_tokens is not None and remaining_tokens < TOKEN_RESERVE:
+            reset = parse_reset(headers.get('x-ratelimit-reset-tokens')) or DEFAULT_RETRY_AFTER
+            if remaining_tokens <= 0:
+                self.paused_until = max(self.paused_until, now + reset)
+            self.background_paused_until = max(self.background_paused_until, now + reset)
+
+    def queue_depth(self, lane: Optional[int] = None) -> int:
+        """Число ожидающих запросов (в очереди lane или во всех)"""
+        return sum(1 for waiting_lane, _, future in self._waiters
+                   if not future.done() and (lane is None or waiting_lane == lane))
+
+    def get_stats(self) -> Dict:
+        """Занятые слоты, пауза по лимитам и по каждой очереди: глубина и время ожидания"""
+        now = self.clock()
+        lanes = {}
+        for lane, name in LANE_NAMES.items():
+            stats = self.lane_stats[lane]
+            lanes[name] = {
+                'depth': self.queue_depth(lane),
+                'max_depth': stats['max_depth'],
+                'granted': stats['granted'],
+                'avg_wait': stats['wait_total'] / stats['granted'] if stats['granted'] else 0.0,
+                'max_wait': stats['wait_max'],
+            }
+        return {
+            'active': self.active,
+            'max_concurrent': self.max_concurrent,
+            'paused_for': max(0.0, self.paused_until - now),
+            'rate_limited': self.rate_limited,
+            'lanes': lanes,
+        }
@@ -0,0 +1,272 @@
+import os
+import re
+import json
+import asyncio
+import logging
+from itertools import count
+from types import SimpleNamespace
+from typing import Callable, Dict, List, Optional
+
+from food_classifier import classify_food_text
+from food_text import parse_quantity, split_food_parts
+from llm_limiter import LANES, LLMLimiter, MAX_CONCURRENT, REQUESTS_PER_MINUTE
+
+logger = logging.getLogger(__name__)
+
+GROQ = 'groq'
+LOCAL = 'local'  # любой OpenAI-совместимый сервер: llama.cpp, vLLM, Ollama
+STUB = 'stub'    # детерминированная заглушка в процессе - для тестов и замеров
+
+LOCAL_MAX_CONCURRENT = 2          # локальная модель обычно обслуживает немного запросов сразу
+LOCAL_REQUESTS_PER_MINUTE = 6000  # своя модель - лимита запросов в минуту по сути нет
+
+
+class LLMProvider:
+    """Источник моделей для LLMClient: клиент с интерфейсом chat.completions и свой ограничитель.
+
+    models - модели провайдера в порядке попыток; None - модели выбирает ModelRouter (Groq).
+    """
+
+    def __init__(self, name: str, client, limiter: Optional[LLMLimiter] = None,
+                 models: Optional[List[str]] = None):
+        self.name = name
+        self.client = client
+        self.limiter = limiter or LLMLimiter(LOCAL_MAX_CONCURRENT, LOCAL_REQUESTS_PER_MINUTE)
+        self.models = list(models) if models else None
+
+    async def close(self):
+        """Закрытие соединений клиента"""
+        if hasattr(self.client, 'close'):
+            await self.client.close()
+
+
+def groq_limiter() -> LLMLimiter:
+    """Ограничитель под лимиты Groq (LLM_MAX_CONCURRENT, LLM_REQUESTS_PER_MINUTE в .env)"""
+    return LLMLimiter(
+        max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", MAX_CONCURRENT)),
+        requests_per_minute=float(os.getenv("LLM_REQUESTS_PER_MINUTE", REQUESTS_PER_MINUTE))
+    )
+
+
+def groq_provider(api_key: str, timeout: float, max_connections: int,
+                  limiter: Optional[LLMLimiter] = None) -> Optional[LLMProvider]:
+    """Groq: общий пул HTTP-соединений, повторы делает LLMClient (перебором моделей)"""
+    try:
+        from groq import AsyncGroq, DefaultAsyncHttpxClient
+        import httpx
+        http_client = DefaultAsyncHttpxClient(
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+            timeout=httpx.Timeout(timeout, connect=10.0)
+        )
+        client = AsyncGroq(api_key=api_key, http_client=http_client, max_retries=0)
+    except Exception as e:
+        logger.error(f"Ошибка при инициализации Groq клиента: {e}", exc_info=True)
+        return None
+    logger.info("Асинхронный Groq клиент инициализирован")
+    return LLMProvider(GROQ, client, limiter or groq_limiter())
+
+
+class _Response(SimpleNamespace):
+    """JSON ответа API как объект SDK; отсутствующие поля - None (как у необязательных полей в SDK)"""
+
+    def __getattr__(self, name):
+        return None
+
+
+def _to_object(value):
+    if isinstance(value, dict):
+        return _Response(**{key: _to_object(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return [_to_object(item) for item in value]
+    return value
+
+
+class OpenAICompatibleClient:
+    """Клиент OpenAI-совместимого API (POST {base_url}/chat/completions) на httpx.
+
+    Повторяет нужную боту часть SDK: chat.completions.create, в том числе потоковый
+    ответ (server-sent events). Ошибка HTTP - исключение httpx.HTTPStatusError.
+    """
+
+    def __init__(self, base_url: str, api_key: Optional[str] = None, timeout: float = 30.0,
+                 max_connections: int = 10):
+        import httpx
+        self._http = httpx.AsyncClient(
+            base_url=base_url.rstrip('/') + '/',
+            headers={'Authorization': f'Bearer {api_key}'} if api_key else {},
+            timeout=httpx.Timeout(timeout, connect=5.0),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **params):
+        if params.get('stream'):
+            return self._stream(params)
+        response = await self._http.post('chat/completions', json=params)
+        response.raise_for_status()
+        return _to_object(response.json())
+
+    async def _stream(self, params: Dict):
+        async with self._http.stream('POST', 'chat/completions', json=params) as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                if not line.startswith('data:'):
+                    continue
+                data = line[len('data:'):].strip()
+                if data == '[DONE]':
+                    break
+                yield _to_object(json.loads(data))
+
+    async def close(self):
+        await self._http.aclose()
+
+
+def local_provider(base_url: str, models: List[str], api_key: Optional[str] = None,
+                   timeout: float = 30.0, max_concurrent: int = LOCAL_MAX_CONCURRENT) -> LLMProvider:
+    """Свой сервер с OpenAI-совместимым API (llama.cpp, vLLM) - например, для быстрой проверки на еду"""
+    client = OpenAICompatibleClient(base_url, api_key=api_key, timeout=timeout, max_connections=max_concurrent * 2)
+    logger.info(f"OpenAI-совместимый LLM: {base_url} ({', '.join(models)})")
+    return LLMProvider(LOCAL, client, LLMLimiter(max_concurrent, LOCAL_REQUESTS_PER_MINUTE), models=models)
+
+
+# --- Заглушка ---
+
+_STUB_NUMBER = count(1)
+
+
+def _stub_items(text: str) -> List[Dict]:
+    items = []
+    for part in split_food_parts(text):
+        name, amount, unit = parse_quantity(part)
+        if not name:
+            continue
+        amount = amount or (1 if unit is None else 100)
+        unit = unit if unit in ('г', 'мл', 'шт') else ('шт' if unit else 'г')
+        scale = amount / 100 if unit != 'шт' else 1.5  # 100 ккал на 100 г, штука - 150 г
+        items.append({
+            'name': name, 'amount': amount, 'unit': unit, 'calories': round(100 * scale, 1),
+            'proteins': round(5 * scale, 1), 'fats': round(3 * scale, 1), 'carbs': round(14 * scale, 1),
+            'source': 'Заглушка LLM',
+        })
+    return items
+
+
+def _stub_parse(text: str) -> Dict:
+    is_food = classify_food_text(text).is_food is True
+    return {'is_food': is_food, 'items': _stub_items(text) if is_food else []}
+
+
+def stub_answer(params: Dict) -> str:
+    """Ответ заглушки: зависит только от запроса (и номера запроса - для неповторяющейся мотивации).
+
+    Вид ответа определяется по промпту: разбор еды (одно сообщение или пакет), проверка
+    на еду, штрих-код, пары факт/совет; на остальное - короткий текст.
+    """
+    system = params['messages'][0]['content']
+    user = params['messages'][-1]['content']
+    if '"results"' in user:
+        lines = re.findall(r'^(\d+): (.+)$', user.split('\n\n')[0], re.MULTILINE)
+        return json.dumps({'results': [dict(_stub_parse(text), id=int(number)) for number, text in lines]},
+                          ensure_ascii=False)
+    if '"is_food"' in user or '"is_food"' in system:
+        message = re.search(r"(?:Сообщение|написал): '(.*?)'\n", user, re.DOTALL)
+        return json.dumps(_stub_parse(message.group(1) if message else user), ensure_ascii=False)
+    if "'yes'" in system:
+        message = re.search(r"написал: '(.*?)'\n", user)
+        return 'yes' if message and classify_food_text(message.group(1)).is_food else 'no'
+    if 'штрих-код' in user:
+        return f"Продукт {re.sub(r'[^0-9]', '', user)}"
+    if '"pairs"' in system:
+        pairs = re.search(r'Придумай (\d+)', user)
+        numbers = [next(_STUB_NUMBER) for _ in range(int(pairs.group(1)) if pairs else 1)]
+        return json.dumps({'pairs': [{'fact': f"Факт №{n}: тренировки полезны.", 'tip': f"Совет №{n}: пей воду."}
+                                     for n in numbers]}, ensure_ascii=False)
+    if '"messages"' in system:
+        groups = re.findall(r'^(\d+): ', user, re.MULTILINE)
+        return json.dumps({'messages': [
+            {'group': int(group), 'fact': f"Факт №{next(_STUB_NUMBER)} для группы {group}.",
+             'tip': f"Совет для группы {group}."} for group in groups
+        ]}, ensure_ascii=False)
+    return f"Ответ заглушки №{next(_STUB_NUMBER)}."
+
+
+class StubClient:
+    """Заглушка LLM в процессе с интерфейсом chat.completions: без сети и без случайности.
+
+    responder(params) -> текст ответа (по умолчанию stub_answer). latency - задержка до
+    начала ответа, tokens_per_second - скорость генерации (0 - мгновенно); потоковый ответ
+    приходит фрагментами по chars_per_token символов. calls - параметры всех запросов.
+    """
+
+    def __init__(self, responder: Optional[Callable[[Dict], str]] = None, latency: float = 0.0,
+                 tokens_per_second: float = 0.0, chars_per_token: int = 4):
+        self.responder = responder or stub_answer
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.chars_per_token = chars_per_token
+        self.calls: List[Dict] = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    async def _create(self, **params):
+        self.calls.append(params)
+        text = self.responder(params)
+        usage = SimpleNamespace(
+            prompt_tokens=sum(len(message['content']) for message in params['messages']) // self.chars_per_token,
+            completion_tokens=len(text) // self.chars_per_token
+        )
+        if params.get('stream'):
+            return self._chunks(text, usage)
+        generation = usage.completion_tokens / self.tokens_per_second if self.tokens_per_second else 0.0
+        await asyncio.sleep(self.latency + generation)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))], usage=usage)
+
+    async def _chunks(self, text: str, usage):
+        await asyncio.sleep(self.latency)
+        for start in range(0, len(text), self.chars_per_token):
+            if self.tokens_per_second:
+                await asyncio.sleep(1 / self.tokens_per_second)
+            delta = SimpleNamespace(content=text[start:start + self.chars_per_token])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)], usage=None)
+        yield SimpleNamespace(choices=[], usage=usage)
+
+
+def stub_provider(responder: Optional[Callable[[Dict], str]] = None, latency: float = 0.0,
+                  tokens_per_second: float = 0.0) -> LLMProvider:
+    """Провайдер-заглушка: модель 'stub', без ограничений Groq"""
+    return LLMProvider(STUB, StubClient(responder, latency, tokens_per_second),
+                       LLMLimiter(MAX_CONCURRENT, LOCAL_REQUESTS_PER_MINUTE), models=['stub'])
+
+
+# --- Настройка из .env ---
+
+def load_routes(default: str) -> Dict[str, str]:
+    """Провайдер для каждого класса запроса: LLM_ROUTE_<КЛАСС> в .env, иначе default"""
+    return {request_class: os.getenv(f"LLM_ROUTE_{request_class.upper()}", default).strip().lower()
+            for request_class in LANES}
+
+
+def load_providers(api_key: Optional[str], timeout: float, max_connections: int,
+                   limiter: Optional[LLMLimiter] = None) -> Dict[str, LLMProvider]:
+    """Провайдеры из .env: Groq (по GROQ_API_KEY), свой сервер (LLM_LOCAL_BASE_URL), заглушка - если выбрана"""
+    providers = {}
+    if api_key:
+        provider = groq_provider(api_key, timeout, max_connections, limiter)
+        if provider:
+            providers[GROQ] = provider
+    else:
+        logger.warning("GROQ_API_KEY не найден, Groq недоступен")
+
+    base_url = os.getenv("LLM_LOCAL_BASE_URL")
+    if base_url:
+        models = [model.strip() for model in os.getenv("LLM_LOCAL_MODEL", "local").split(',') if model.strip()]
+        providers[LOCAL] = local_provider(
+            base_url, models, api_key=os.getenv("LLM_LOCAL_API_KEY"), timeout=timeout,
+            max_concurrent=int(os.getenv("LLM_LOCAL_MAX_CONCURRENT", LOCAL_MAX_CONCURRENT))
+        )
+
+    selected = {os.getenv("LLM_PROVIDER", GROQ).strip().lower()}
+    selected.update(os.getenv(f"LLM_ROUTE_{request_class.upper()}", '').strip().lower() for request_class in LANES)
+    if STUB in selected:
+        providers[STUB] = stub_provider()
+        logger.warning("Используется заглушка LLM (LLM_PROVIDER/LLM_ROUTE_*=stub)")
+    return providers
@@ -0,0 +1,100 @@
+import sqlite3
+import logging
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class UsageLog:
+    """Расход LLM по дням: запросы, токены и задержка для каждой версии промпта и модели.
+
+    Нужен, чтобы сравнивать версии промптов (A/B) по стоимости и скорости.
+    """
+
+    def __init__(self, db_path: str = "fitness_bot.db"):
+        self.db_path = db_path
+        self.init_database()
+
+    def get_connection(self):
+        """Получение соединения с базой данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """Инициализация таблицы расхода"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS llm_usage (
+                day DATE NOT NULL,
+                prompt_version TEXT NOT NULL,
+                model TEXT NOT NULL,
+                requests INTEGER NOT NULL DEFAULT 0,
+                failures INTEGER NOT NULL DEFAULT 0,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                latency_total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (day, prompt_version, model)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def record(self, prompt_version: str, model: str, prompt_tokens: Optional[int] = None,
+               completion_tokens: Optional[int] = None, latency: float = 0.0, failed: bool = False):
+        """Учет одного запроса (ошибка учитывается без токенов и задержки)"""
+        try:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute("""
+                INSERT INTO llm_usage (day, prompt_version, model, requests, failures,
+                                       prompt_tokens, completion_tokens, latency_total)
+                VALUES (?, ?, ?, 1, ?, ?, ?, ?)
+                ON CONFLICT (day, prompt_version, model) DO UPDATE SET
+                    requests = requests + 1,
+                    failures = failures + excluded.failures,
+                    prompt_tokens = prompt_tokens + excluded.prompt_tokens,
+                    completion_tokens = completion_tokens + excluded.completion_tokens,
+                    latency_total = latency_total + excluded.latency_total
+            """, (date.today().isoformat(), prompt_version, model, int(failed),
+                  prompt_tokens or 0, completion_tokens or 0, 0.0 if failed else latency))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            # Статистика не должна ломать ответ пользователю
+            logger.error(f"Ошибка при учете расхода LLM: {e}")
+
+    def get_stats(self, days: int = 7) -> List[Dict]:
+        """Средние токены и задержка на успешный запрос по версиям промптов и моделям за days дней"""
+        since = (date.today() - timedelta(days=days - 1)).isoformat()
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT prompt_version, model, SUM(requests) as requests, SUM(failures) as failures,
+                   SUM(prompt_tokens) as prompt_tokens, SUM(completion_tokens) as completion_tokens,
+                   SUM(latency_total) as latency_total
+            FROM llm_usage
+            WHERE day >= ?
+            GROUP BY prompt_version, model
+            ORDER BY prompt_version, requests DESC
+        """, (since,))
+        rows = cursor.fetchall()
+        conn.close()
+
+        stats = []
+        for row in rows:
+            succeeded = row['requests'] - row['failures']
+            stats.append({
+                'prompt_version': row['prompt_version'],
+                'model': row['model'],
+                'requests': row['requests'],
+                'failures': row['failures'],
+                'prompt_tokens': row['prompt_tokens'],
+                'completion_tokens': row['completion_tokens'],
+                'avg_prompt_tokens': row['prompt_tokens'] / succeeded if succeeded else 0.0,
+                'avg_completion_tokens': row['completion_tokens'] / succeeded if succeeded else 0.0,
+                'avg_latency': row['latency_total'] / succeeded if succeeded else 0.0,
+            })
+        return stats
@@ -0,0 +1,179 @@
+import time
+import logging
+from collections import deque
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Класс запроса -> (основные модели, запасные). Внутри группы выбирается самая быстрая
+# исправная модель; запасные используются, только если основные недоступны
+ROUTES: Dict[str, Tuple[List[str], List[str]]] = {
+    'parse': (["llama-3.3-70b-versatile", "llama-3.1-70b-versatile"], ["llama-3.1-8b-instant"]),
+    'classify': (["llama-3.1-8b-instant"], ["llama-3.3-70b-versatile"]),
+    'barcode': (["llama-3.3-70b-versatile"], ["llama-3.1-70b-versatile"]),
+    'motivation': (["llama-3.1-8b-instant"], ["llama-3.3-70b-versatile"]),
+}
+DEFAULT_ROUTE = 'parse'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+FAILURE_THRESHOLD = 3      # подряд ошибок до размыкания
+ERROR_RATE_THRESHOLD = 0.5  # или доля ошибок в окне
+WINDOW = 20
+MIN_WINDOW = 10
+COOLDOWN = 60.0            # секунд до пробного запроса
+MAX_COOLDOWN = 15 * 60.0
+LATENCY_ALPHA = 0.3
+
+
+class ModelHealth:
+    """Состояние одной модели: автомат размыкания, доля ошибок и средняя задержка"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.outcomes = deque(maxlen=WINDOW)  # True - успех
+        self.latency: Optional[float] = None   # экспоненциальное среднее, секунды
+        self.opened_at = 0.0
+        self.cooldown = COOLDOWN
+        self.probe_in_flight = False
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def error_rate(self) -> float:
+        return self.outcomes.count(False) / len(self.outcomes) if self.outcomes else 0.0
+
+    def to_dict(self) -> Dict:
+        return {
+            'model': self.model,
+            'state': self.state,
+            'requests': self.requests,
+            'failures': self.failures,
+            'error_rate': self.error_rate * 100,
+            'latency': self.latency,
+            'consecutive_failures': self.consecutive_failures,
+        }
+
+
+class ModelRouter:
+    """Выбор модели для запроса по классу с учетом исправности моделей (circuit breaker).
+
+    После FAILURE_THRESHOLD ошибок подряд модель исключается на cooldown секунд, затем
+    пропускается один пробный запрос: успех возвращает модель, ошибка - снова исключает
+    ее на вдвое больший срок. Один экземпляр на LLMClient, поэтому статистика общая
+    для подсчета калорий и мотиватора.
+    """
+
+    def __init__(self, routes: Optional[Dict[str, Tuple[List[str], List[str]]]] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        self.routes = routes or ROUTES
+        self.clock = clock
+        self.health: Dict[str, ModelHealth] = {}
+
+    def _health(self, model: str) -> ModelHealth:
+        if model not in self.health:
+            self.health[model] = ModelHealth(model)
+        return self.health[model]
+
+    def _refresh(self, health: ModelHealth):
+        if health.state == OPEN and self.clock() - health.opened_at >= health.cooldown:
+            health.state = HALF_OPEN
+            health.probe_in_flight = False
+            logger.info(f"Модель {health.model}: пробный запрос после паузы")
+
+    def allow(self, model: str) -> bool:
+        """Можно ли отправить запрос модели сейчас (в полуоткрытом состоянии - один пробный)"""
+        health = self._health(model)
+        self._refresh(health)
+        if health.state == CLOSED:
+            return True
+        if health.state == HALF_OPEN and not health.probe_in_flight:
+            health.probe_in_flight = True
+            return True
+        return False
+
+    def route(self, request_class: Optional[str] = None, models: Optional[List[str]] = None) -> List[str]:
+        """Модели в порядке попыток: пробные, затем исправные по скорости; отключенные пропускаются.
+
+        Если отключены все, модель, пауза которой закончится раньше всех, сразу получает пробный
+        запрос - без LLM бот не работает, поэтому лучше попробовать, чем сразу отказать.
+        """
+        if models is not None:
+            groups = [models]
+        else:
+            route = self.routes.get(request_class or DEFAULT_ROUTE) or self.routes[DEFAULT_ROUTE]
+            groups = list(route)
+
+        ordered = []
+        for group in groups:
+            healthy, probing = [], []
+            for position, model in enumerate(group):
+                health = self._health(model)
+                self._refresh(health)
+                if health.state == CLOSED:
+                    # Модели без замеров пробуем первыми по порядку, чтобы узнать их скорость
+                    healthy.append((health.latency or 0.0, position, model))
+                elif health.state == HALF_OPEN and not health.probe_in_flight:
+                    probing.append(model)
+            # Пробный запрос идет первым: при ошибке этот же запрос уйдет исправной модели
+            ordered += probing + [model for _, _, model in sorted(healthy)]
+
+        if not ordered:
+            all_models = [model for group in groups for model in group]
+            health = min((self.health[m] for m in all_models if not self.health[m].probe_in_flight),
+                         key=lambda h: h.opened_at + h.cooldown, default=None)
+            if health is not None:
+                health.state = HALF_OPEN
+                ordered = [health.model]
+        return ordered
+
+    def record_success(self, model: str, latency: float):
+        health = self._health(model)
+        health.requests += 1
+        health.outcomes.append(True)
+        health.consecutive_failures = 0
+        health.latency = latency if health.latency is None else (
+            LATENCY_ALPHA * latency + (1 - LATENCY_ALPHA) * health.latency
+        )
+        if health.state != CLOSED:
+            logger.info(f"Модель {model} снова доступна")
+        health.state = CLOSED
+        health.cooldown = COOLDOWN
+        health.probe_in_flight = False
+
+    def record_failure(self, model: str):
+        health = self._health(model)
+        health.requests += 1
+        health.failures += 1
+        health.outcomes.append(False)
+        health.consecutive_failures += 1
+
+        if health.state == HALF_OPEN:
+            health.cooldown = min(health.cooldown * 2, MAX_COOLDOWN)
+            self._open(health)
+        elif health.state == CLOSED and (
+            health.consecutive_failures >= FAILURE_THRESHOLD
+            or (len(health.outcomes) >= MIN_WINDOW and health.error_rate >= ERROR_RATE_THRESHOLD)
+        ):
+            self._open(health)
+
+    def record_cancelled(self, model: str):
+        """Запрос отменен (не ошибка модели): пробный запрос можно повторить"""
+        self._health(model).probe_in_flight = False
+
+    def _open(self, health: ModelHealth):
+        health.state = OPEN
+        health.opened_at = self.clock()
+        health.probe_in_flight = False
+        logger.warning(f"Модель {health.model} отключена на {health.cooldown:.0f} с "
+                       f"(ошибок подряд: {health.consecutive_failures}, доля ошибок {health.error_rate:.0%})")
+
+    def get_stats(self) -> List[Dict]:
+        """Статистика по всем моделям, к которым были запросы"""
+        for health in self.health.values():
+            self._refresh(health)
+        return [health.to_dict() for health in self.health.values() if health.requests]
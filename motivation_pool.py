@@ -0,0 +1,116 @@
+import re
+import time
+import sqlite3
+import logging
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+RECENT_DAYS = 30  # столько дней факт или совет не повторяется
+POOL_SIZE = 10    # минимальный запас пар в пуле
+
+
+def content_key(text: str) -> str:
+    """Ключ для поиска повторов: без регистра, пунктуации и лишних пробелов"""
+    return ' '.join(re.sub(r'[^\w\s]', ' ', text.lower().replace('ё', 'е')).split())
+
+
+class MotivationPool:
+    """Запас заранее сгенерированных пар факт/совет для рассылки мотивации.
+
+    Пары генерируются в фоне, в момент рассылки берутся из пула без обращения к LLM.
+    Повторы (тот же факт или совет, что в пуле или в рассылке за RECENT_DAYS дней) не добавляются.
+    """
+
+    def __init__(self, db_path: str = "fitness_bot.db"):
+        self.db_path = db_path
+        self.init_database()
+
+    def get_connection(self):
+        """Получение соединения с базой данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """Инициализация таблицы пула"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS motivation_pool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                fact TEXT NOT NULL,
+                tip TEXT NOT NULL,
+                fact_key TEXT NOT NULL,
+                tip_key TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                used_at REAL
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_motivation_pool_used ON motivation_pool(used_at)")
+        conn.commit()
+        conn.close()
+
+    def add(self, fact: str, tip: str) -> bool:
+        """Добавление пары в пул; False - такой факт или совет недавно уже был"""
+        return self._insert(fact, tip, used_at=None)
+
+    def mark_sent(self, fact: str, tip: str) -> bool:
+        """Учет пары, отправленной мимо пула (персональная мотивация); False - это повтор, отправлять не нужно"""
+        return self._insert(fact, tip, used_at=time.time())
+
+    def _insert(self, fact: str, tip: str, used_at: Optional[float]) -> bool:
+        fact_key, tip_key = content_key(fact), content_key(tip)
+        if not fact_key or not tip_key:
+            return False
+        since = time.time() - RECENT_DAYS * 24 * 3600
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT 1 FROM motivation_pool
+            WHERE (fact_key = ? OR tip_key = ?) AND (used_at IS NULL OR used_at >= ?)
+            LIMIT 1
+        """, (fact_key, tip_key, since))
+        if cursor.fetchone():
+            conn.close()
+            logger.debug(f"Повтор мотивации отклонен: {fact[:60]}")
+            return False
+        cursor.execute("""
+            INSERT INTO motivation_pool (fact, tip, fact_key, tip_key, created_at, used_at)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (fact.strip(), tip.strip(), fact_key, tip_key, time.time(), used_at))
+        conn.commit()
+        conn.close()
+        return True
+
+    def take(self) -> Optional[Tuple[str, str]]:
+        """Самая старая неиспользованная пара (помечается использованной) или None, если пул пуст"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT id, fact, tip FROM motivation_pool WHERE used_at IS NULL ORDER BY id LIMIT 1")
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("UPDATE motivation_pool SET used_at = ? WHERE id = ?", (time.time(), row['id']))
+            conn.commit()
+        conn.close()
+        return (row['fact'], row['tip']) if row else None
+
+    def size(self) -> int:
+        """Число неиспользованных пар"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT COUNT(*) FROM motivation_pool WHERE used_at IS NULL")
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def cleanup(self) -> int:
+        """Удаление использованных пар старше RECENT_DAYS (они уже не нужны для поиска повторов)"""
+        since = time.time() - RECENT_DAYS * 24 * 3600
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM motivation_pool WHERE used_at IS NOT NULL AND used_at < ?", (since,))
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        return deleted
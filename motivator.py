@@ -1,28 +1,101 @@
 import os
+import json
+import math
+import random
+import asyncio
 import logging
-from typing import Optional
-from groq import Groq
+from typing import Dict, List, Optional, Tuple
+from food_schema import JSON_RESPONSE_FORMAT
+from llm_client import LLMClient
+from motivation_pool import MotivationPool, POOL_SIZE
+from prompts import TRAINING_CONTEXT, get_prompt
 
 logger = logging.getLogger(__name__)
 
+REFILL_PAUSE = 2.0  # секунд между запросами при пополнении пула, чтобы не занимать Groq подряд
+PAIRS_PER_REQUEST = 5  # пар факт/совет в одном запросе при пополнении пула
+TOKENS_PER_PAIR = 150
+BATCH_SIZE = 8         # групп в одном запросе персональной мотивации
+BATCH_TIMEOUT = 30.0
+PERSONAL_TIMEOUT = 8.0  # сколько рассылка ждет персональную мотивацию, дальше - пары из пула
+
+
+def _pair(data) -> Optional[Tuple[str, str]]:
+    """(факт, совет) из объекта {"fact", "tip"} или None, если поле пустое или не строка"""
+    if not isinstance(data, dict):
+        return None
+    fact, tip = data.get('fact'), data.get('tip')
+    if isinstance(fact, str) and isinstance(tip, str) and fact.strip() and tip.strip():
+        return fact.strip(), tip.strip()
+    return None
+
+
+def parse_motivation_pairs(text: str) -> List[Tuple[str, str]]:
+    """Пары (факт, совет) из JSON-ответа {"pairs": [{"fact", "tip"}]}; ответ не по схеме - ValueError.
+
+    Одна пара без обертки {"fact", "tip"} тоже принимается; пары с пустым полем отбрасываются.
+    """
+    data = json.loads(text)  # json.JSONDecodeError - тоже ValueError
+    if isinstance(data, dict) and 'pairs' not in data:
+        data = {'pairs': [data]}
+    if not isinstance(data, dict) or not isinstance(data.get('pairs'), list):
+        raise ValueError("ожидался JSON-объект с массивом pairs")
+    pairs = [pair for pair in map(_pair, data['pairs']) if pair]
+    if not pairs:
+        raise ValueError("в ответе нет ни одной пары факт/совет")
+    return pairs
+
+
+def parse_batch_messages(text: str, count: int) -> Dict[int, Tuple[str, str]]:
+    """Номер группы (1..count) -> (факт, совет) из ответа {"messages": [{"group", "fact", "tip"}]}.
+
+    Ответ не по схеме - ValueError; сообщения с чужим номером или пустым полем отбрасываются.
+    """
+    data = json.loads(text)
+    if not isinstance(data, dict) or not isinstance(data.get('messages'), list):
+        raise ValueError("ожидался JSON-объект с массивом messages")
+    messages = {}
+    for message in data['messages']:
+        pair = _pair(message)
+        group = message.get('group') if pair else None
+        if isinstance(group, str) and group.strip().isdigit():
+            group = int(group)
+        if isinstance(group, bool) or not isinstance(group, int) or not 1 <= group <= count:
+            continue
+        messages.setdefault(group, pair)
+    if not messages:
+        raise ValueError("в ответе нет ни одного сообщения для групп")
+    return messages
+
+
+def format_chat_summary(summary: Dict) -> str:
+    """Сводка группы (analytics.get_chat_summary) одной строкой для промпта, без имен участников"""
+    parts = [f"участников {summary['participants']}"]
+    if summary['participants']:
+        parts.append(f"вчера норму выполнили {summary['yesterday_done']} из {summary['participants']}")
+    if summary['best_streak'] > 1:
+        parts.append(f"лучшая текущая серия {summary['best_streak']} дн.")
+    if summary['week_change'] is not None:
+        parts.append(f"за неделю {summary['week_change']:+.0f}% к прошлой")
+    if summary['days']:
+        parts.append(f"занимаются {summary['days']} дн.")
+    return ', '.join(parts)
+
 
 class Motivator:
-    def __init__(self, api_key: Optional[str] = None):
-        self.api_key = api_key or os.getenv("GROQ_API_KEY")
-        if self.api_key:
-            try:
-                # Инициализируем Groq клиент (в версии 1.0.0 проблема с proxies решена)
-                self.client = Groq(api_key=self.api_key)
-                self.use_groq = True
-                logger.info("Groq API инициализирован")
-            except Exception as e:
-                logger.warning(f"Ошибка инициализации Groq: {e}. Используются статические сообщения.")
-                self.use_groq = False
-                self.client = None
+    def __init__(self, api_key: Optional[str] = None, llm_client: Optional[LLMClient] = None,
+                 db_path: str = "fitness_bot.db"):
+        # Общий с CalorieCounter клиент (один пул соединений); свой создаем только для обратной совместимости
+        self.client = llm_client or LLMClient(api_key=api_key or os.getenv("GROQ_API_KEY"))
+        self.use_groq = self.client.available
+        if self.use_groq:
+            logger.info(f"LLM для мотивации: {self.client.routes.get('motivation', self.client.default_provider)}")
         else:
-            self.use_groq = False
-            self.client = None
-            logger.warning("GROQ_API_KEY не найден, используются статические сообщения")
+            logger.warning("LLM недоступен, используются статические сообщения")
+        
+        # Заранее сгенерированные пары факт/совет: рассылка не ждет LLM
+        self.pool = MotivationPool(db_path)
+        self._refill_lock = asyncio.Lock()
         
         # Резервные статические сообщения на случай проблем с API
         self.fallback_facts = [
@@ -44,80 +117,146 @@ class Motivator:
     async def generate_motivational_content(self, context: Optional[dict] = None) -> tuple[str, str]:
         """Генерация мотивирующего факта и совета через Groq с учетом контекста группы"""
         if not self.use_groq or not self.client:
-            import random
             return random.choice(self.fallback_facts), random.choice(self.fallback_tips)
         
         try:
-            # Формируем контекст о программе тренировок
-            training_context = ""
-            if context:
-                training_context = (
-                    f"Группа тренируется каждый день: делают 80 отжиманий и 80 упражнений на пресс. "
-                    f"Это их ежедневная программа тренировок."
-                )
-            else:
-                training_context = (
-                    "Группа тренируется каждый день: делают 80 отжиманий и 80 упражнений на пресс. "
-                    "Это их ежедневная программа тренировок."
-                )
-            
-            # Генерируем факт с учетом их программы
-            fact_prompt = (
-                f"{training_context}\n\n"
-                "Придумай короткий (1-2 предложения) мотивирующий факт о пользе именно такой программы тренировок "
-                "(80 отжиманий и 80 упражнений на пресс ежедневно). "
-                "Факт должен быть научно обоснованным, вдохновляющим и релевантным для их конкретной программы. "
-                "Можешь упомянуть пользу отжиманий, упражнений на пресс, или ежедневных тренировок. "
-                "Ответ должен быть только фактом, без дополнительных комментариев."
-            )
-            
-            fact_response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
-                    {"role": "system", "content": "Ты помощник, который создает мотивирующие факты о фитнесе и здоровье, учитывая конкретную программу тренировок группы."},
-                    {"role": "user", "content": fact_prompt}
-                ],
-                temperature=0.8,
-                max_tokens=120
-            )
-            
-            fact = fact_response.choices[0].message.content.strip()
-            
-            # Генерируем совет с учетом их программы
-            tip_prompt = (
-                f"{training_context}\n\n"
-                "Придумай короткий (1 предложение) практический совет специально для этой группы. "
-                "Совет должен быть конкретным и полезным для людей, которые делают 80 отжиманий и 80 упражнений на пресс каждый день. "
-                "Можешь дать совет о технике выполнения, восстановлении, питании, прогрессии, или как избежать перетренированности при ежедневных тренировках. "
-                "Совет должен быть релевантным именно для их программы. "
-                "Ответ должен быть только советом, без дополнительных комментариев."
-            )
-            
-            tip_response = self.client.chat.completions.create(
-                model="llama-3.1-8b-instant",
-                messages=[
-                    {"role": "system", "content": "Ты помощник, который дает практические советы о фитнесе и здоровье, учитывая конкретную программу тренировок группы."},
-                    {"role": "user", "content": tip_prompt}
-                ],
-                temperature=0.8,
-                max_tokens=120
-            )
-            
-            tip = tip_response.choices[0].message.content.strip()
-            
-            return fact, tip
-            
+            return await self._generate_with_groq()
         except Exception as e:
             logger.error(f"Ошибка при генерации контента через Groq: {e}")
-            import random
             return random.choice(self.fallback_facts), random.choice(self.fallback_tips)
     
+    async def _generate_with_groq(self) -> tuple[str, str]:
+        """Факт и совет с учетом программы тренировок группы (ошибки Groq не перехватываются)"""
+        return (await self._generate_pairs(1))[0]
+    
+    async def _generate_pairs(self, count: int) -> List[Tuple[str, str]]:
+        """count пар факт/совет одним JSON-запросом; если ответ не по схеме - одна пара двумя запросами"""
+        prompt = get_prompt('motivation')
+        response = await self.client.complete_first(
+            prompt.render(TRAINING_CONTEXT, count=count),
+            request_class='motivation',
+            temperature=0.8,
+            max_tokens=min(prompt.max_tokens, 60 + TOKENS_PER_PAIR * count),
+            timeout=20 + 5 * count,
+            response_format=JSON_RESPONSE_FORMAT,
+            prompt_version=prompt.version
+        )
+        try:
+            return parse_motivation_pairs(response['text'])[:count]
+        except ValueError as e:
+            logger.warning(f"Ответ с мотивацией не соответствует схеме: {e}. Ответ: {response['text'][:300]}")
+            return [await self._generate_separately()]
+    
+    async def _generate_separately(self) -> tuple[str, str]:
+        """Факт и совет отдельными запросами (запасной вариант)"""
+        fact_prompt = get_prompt('fact')
+        fact_response = await self.client.complete_first(
+            fact_prompt.render(TRAINING_CONTEXT),
+            request_class='motivation',
+            temperature=0.8,
+            max_tokens=fact_prompt.max_tokens,
+            timeout=20,
+            prompt_version=fact_prompt.version
+        )
+        
+        tip_prompt = get_prompt('tip')
+        tip_response = await self.client.complete_first(
+            tip_prompt.render(TRAINING_CONTEXT),
+            request_class='motivation',
+            temperature=0.8,
+            max_tokens=tip_prompt.max_tokens,
+            timeout=20,
+            prompt_version=tip_prompt.version
+        )
+        
+        return fact_response['text'], tip_response['text']
+    
+    async def generate_for_chats(self, summaries: Dict[int, str], batch_size: int = BATCH_SIZE,
+                                 timeout: Optional[float] = None) -> Dict[int, Tuple[str, str]]:
+        """Персональные факт и совет для групп: chat_id -> (факт, совет), по batch_size групп за запрос.
+        
+        summaries - сводки групп (format_chat_summary). Группы, для которых ответа нет
+        (ошибка Groq, ответ не по схеме, не успели за timeout секунд), в результат не попадают -
+        им нужен get_motivational_content. Незавершенные к timeout запросы отменяются.
+        """
+        if not self.use_groq or not summaries:
+            return {}
+        chat_ids = list(summaries)
+        batches = [chat_ids[start:start + batch_size] for start in range(0, len(chat_ids), batch_size)]
+        tasks = [asyncio.create_task(self._generate_batch(batch, summaries)) for batch in batches]
+        done, pending = await asyncio.wait(tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        contents = {}
+        for task in done:
+            contents.update(task.result())
+        logger.info(f"Персональная мотивация: {len(contents)} из {len(chat_ids)} групп за {len(batches)} запросов"
+                    + (f", не дождались {len(pending)}" if pending else ""))
+        return contents
+    
+    async def _generate_batch(self, chat_ids: List[int], summaries: Dict[int, str]) -> Dict[int, Tuple[str, str]]:
+        """Один запрос с мотивацией для нескольких групп"""
+        prompt = get_prompt('motivation_batch')
+        groups = ''.join(f"{number}: {summaries[chat_id]}\n" for number, chat_id in enumerate(chat_ids, 1))
+        try:
+            response = await self.client.complete_first(
+                prompt.render(TRAINING_CONTEXT, count=len(chat_ids), groups=groups),
+                request_class='motivation',
+                temperature=0.8,
+                max_tokens=min(prompt.max_tokens, 60 + TOKENS_PER_PAIR * len(chat_ids)),
+                timeout=BATCH_TIMEOUT,
+                response_format=JSON_RESPONSE_FORMAT,
+                prompt_version=prompt.version
+            )
+            messages = parse_batch_messages(response['text'], len(chat_ids))
+        except Exception as e:
+            logger.warning(f"Не удалось получить персональную мотивацию для {len(chat_ids)} групп: {e}")
+            return {}
+        return {chat_ids[number - 1]: pair for number, pair in messages.items()}
+    
+    def get_motivational_content(self) -> tuple[str, str]:
+        """Факт и совет для рассылки: из пула, если он пуст - статические сообщения (без обращения к LLM)"""
+        pair = self.pool.take()
+        if pair:
+            return pair
+        logger.warning("Пул мотивации пуст, используются статические сообщения")
+        return random.choice(self.fallback_facts), random.choice(self.fallback_tips)
+    
+    async def refill_pool(self, target: int = POOL_SIZE, pause: float = REFILL_PAUSE) -> int:
+        """Пополнение пула до target пар в фоне; возвращает число добавленных.
+        
+        По PAIRS_PER_REQUEST пар за запрос, запросы идут с паузой и в фоновой очереди ограничителя LLM,
+        поэтому не мешают разбору еды. Повторы не добавляются; пока идет одно
+        пополнение, второе не запускается.
+        """
+        if not self.use_groq or self._refill_lock.locked():
+            return 0
+        
+        async with self._refill_lock:
+            self.pool.cleanup()
+            missing = target - self.pool.size()
+            added = 0
+            # Запас запросов на повторы, чтобы не генерировать бесконечно
+            requests = 2 * math.ceil(max(0, missing) / PAIRS_PER_REQUEST)
+            for attempt in range(requests):
+                if added >= missing:
+                    break
+                if attempt:
+                    await asyncio.sleep(pause)
+                try:
+                    pairs = await self._generate_pairs(min(PAIRS_PER_REQUEST, missing - added))
+                except Exception as e:
+                    logger.warning(f"Не удалось пополнить пул мотивации: {e}")
+                    break
+                added += sum(self.pool.add(fact, tip) for fact, tip in pairs)
+            if added:
+                logger.info(f"Пул мотивации пополнен на {added}, в запасе {self.pool.size()}")
+            return added
+    
     def get_random_fact(self) -> str:
         """Получение случайного факта (для обратной совместимости)"""
-        import random
         return random.choice(self.fallback_facts)
     
     def get_random_tip(self) -> str:
         """Получение случайного совета (для обратной совместимости)"""
-        import random
         return random.choice(self.fallback_tips)
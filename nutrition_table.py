@@ -0,0 +1,130 @@
+"""Встроенная таблица КБЖУ (data/nutrition_table.csv) для разбора еды без обращения к Groq.
+
+Около 270 частых продуктов и блюд (550 названий с синонимами), а не несколько тысяч: значения
+проверены вручную. Общие названия фастфуда ("чизбургер") ведут на самый распространенный вариант;
+домашние и ресторанные блюда ("борщ мамин", "курица терияки") по-прежнему разбирает LLM.
+"""
+import os
+import csv
+import logging
+from typing import Dict, List, Optional
+
+from food_text import normalize_product_name
+
+logger = logging.getLogger(__name__)
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'nutrition_table.csv')
+TABLE_SOURCE = 'Таблица КБЖУ'
+
+# Слова, которые не входят в название продукта
+STOP_WORDS = {
+    'из', 'на', 'я', 'съел', 'съела', 'поел', 'поела', 'скушал', 'скушала', 'выпил', 'выпила',
+    'завтрак', 'обед', 'ужин', 'перекус', 'немного', 'еще', 's',
+}
+
+# Падежные окончания: "гречки", "гречку" и "гречка" дают один ключ
+_ENDINGS = sorted([
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ом', 'ем', 'ам', 'ям', 'ах', 'ях', 'ов', 'ев',
+    'а', 'я', 'о', 'е', 'и', 'ы', 'у', 'ю', 'й', 'ь',
+], key=len, reverse=True)
+
+
+def _stem(token: str) -> str:
+    for ending in _ENDINGS:
+        if token.endswith(ending) and len(token) - len(ending) >= 3:
+            return token[:-len(ending)]
+    return token
+
+
+def table_key(name: str) -> str:
+    """Ключ таблицы: слова без стоп-слов и окончаний, по алфавиту ("сок яблочный" = "яблочный сок")"""
+    tokens = [_stem(token) for token in normalize_product_name(name).split() if token not in STOP_WORDS]
+    return ' '.join(sorted(tokens))
+
+
+class NutritionTable:
+    """Встроенная таблица КБЖУ: ключ -> (название, основа, ккал, белки, жиры, углеводы, вес штуки)"""
+
+    def __init__(self, path: str = TABLE_PATH):
+        self.path = path
+        self.index: Dict[str, tuple] = {}
+        self.names: List[str] = []  # названия и синонимы как в таблице (для поиска опечаток)
+        self.products = 0
+        self.load()
+
+    def load(self):
+        """Загрузка таблицы из CSV (название и синонимы индексируются одинаково)"""
+        with open(self.path, encoding='utf-8', newline='') as f:
+            for row in csv.DictReader(f, delimiter=';'):
+                entry = (
+                    row['name'],
+                    row['basis'],
+                    float(row['calories']),
+                    float(row['proteins']),
+                    float(row['fats']),
+                    float(row['carbs']),
+                    float(row['piece_weight']) if row['piece_weight'] else None,
+                )
+                for name in [row['name']] + [alias for alias in row['aliases'].split('|') if alias]:
+                    self.names.append(name)
+                    key = table_key(name)
+                    if key in self.index and self.index[key][0] != row['name']:
+                        logger.debug(f"Синоним '{name}' уже занят продуктом '{self.index[key][0]}'")
+                        continue
+                    self.index[key] = entry
+                self.products += 1
+        logger.info(f"Загружена таблица КБЖУ: {self.products} продуктов, {len(self.index)} названий")
+
+    def get(self, name: str) -> Optional[tuple]:
+        return self.index.get(table_key(name))
+
+    def lookup(self, name_key: str, amount: Optional[float], unit: Optional[str]) -> Optional[Dict]:
+        """Продукт в формате parse_with_groq, пересчитанный на количество, или None"""
+        entry = self.get(name_key)
+        if not entry:
+            return None
+        name, basis, calories, proteins, fats, carbs, piece_weight = entry
+
+        if amount is None:
+            # "съел яблоко" - одна штука, если известен вес штуки
+            if basis != 'шт' and not piece_weight:
+                return None
+            amount, unit = 1, 'шт'
+
+        if basis == 'шт':
+            # Готовые блюда: "1шт" = "1 порция"; граммы пересчитываем через вес порции
+            if unit in ('шт', 'порция'):
+                factor = amount
+            elif unit in ('г', 'мл') and piece_weight:
+                factor = amount / piece_weight
+            else:
+                return None
+        elif unit in ('г', 'мл'):
+            factor = amount / 100
+        elif unit == 'шт' and piece_weight:
+            factor = amount * piece_weight / 100
+        else:
+            return None
+
+        return {
+            'name': name,
+            'amount': round(amount, 1) if amount % 1 else int(amount),
+            'unit': unit,
+            'calories': round(calories * factor, 1),
+            'proteins': round(proteins * factor, 1),
+            'fats': round(fats * factor, 1),
+            'carbs': round(carbs * factor, 1),
+            'source': TABLE_SOURCE
+        }
+
+
+_table: Optional[NutritionTable] = None
+
+
+def get_nutrition_table() -> NutritionTable:
+    """Таблица загружается один раз на процесс"""
+    global _table
+    if _table is None:
+        _table = NutritionTable()
+    return _table
@@ -0,0 +1,93 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+BATCH_WINDOW = 0.15  # секунд ожидания попутных запросов
+MAX_BATCH = 8        # запросов в одном обращении к LLM
+
+# Пакет запросов -> результаты по номеру запроса в пакете (чего нет - повторяется по одному)
+BatchRequest = Callable[[List[Any]], Awaitable[Dict[int, Any]]]
+SingleRequest = Callable[[Any], Awaitable[Any]]
+
+
+class ParseBatcher:
+    """Объединение запросов разных пользователей в один запрос к LLM (micro-batching).
+
+    Первый запрос открывает окно window секунд; все запросы, пришедшие за это время
+    (но не больше max_batch), уходят одним вызовом request_batch с номерами запросов.
+    Каждый ждущий получает свой результат; запросы, для которых пакетный ответ не пришел
+    или не прошел проверку, и весь пакет при ошибке повторяются по одному через request_single.
+    """
+
+    def __init__(self, request_batch: BatchRequest, request_single: SingleRequest,
+                 window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH):
+        self.request_batch = request_batch
+        self.request_single = request_single
+        self.window = window
+        self.max_batch = max(1, max_batch)
+        self._pending: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self.batches = 0
+        self.batched = 0
+        self.fallbacks = 0
+
+    async def submit(self, request: Any) -> Any:
+        """Результат запроса: из общего пакета или отдельного повтора"""
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((request, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window, self._flush)
+        return await asyncio.shield(future)
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, []
+        if pending:
+            asyncio.ensure_future(self._run(pending))
+
+    async def _run(self, pending: List[Tuple[Any, asyncio.Future]]):
+        self.batches += 1
+        self.batched += len(pending)
+        results: Dict[int, Any] = {}
+        if len(pending) > 1:
+            try:
+                results = await self.request_batch([request for request, _ in pending])
+            except Exception as e:
+                logger.error(f"Ошибка пакетного запроса ({len(pending)} шт.), повторяю по одному: {e}")
+
+        retries = []
+        for index, (request, future) in enumerate(pending):
+            if index in results:
+                if not future.done():
+                    future.set_result(results[index])
+            else:
+                retries.append((request, future))
+        if len(pending) > 1:
+            self.fallbacks += len(retries)
+        await asyncio.gather(*(self._run_single(request, future) for request, future in retries))
+
+    async def _run_single(self, request: Any, future: asyncio.Future):
+        try:
+            result = await self.request_single(request)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    def get_stats(self) -> Dict:
+        """Пакетов отправлено, запросов в них, средний размер пакета, повторов по одному"""
+        return {
+            'batches': self.batches,
+            'batched': self.batched,
+            'avg_size': self.batched / self.batches if self.batches else 0.0,
+            'fallbacks': self.fallbacks,
+            'pending': len(self._pending),
+        }
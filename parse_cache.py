@@ -0,0 +1,160 @@
+import copy
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from food_text import normalize_food_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 30 * 24 * 3600  # КБЖУ продуктов не меняются, месяц - безопасный срок
+DEFAULT_MEMORY_SIZE = 512
+
+
+def make_cache_key(text: str, version: str) -> str:
+    """Ключ кэша: нормализованный текст + версия промпта и моделей"""
+    raw = f"{version}\n{normalize_food_text(text)}"
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+
+class ParseCache:
+    """Кэш разбора текста о еде: LRU в памяти поверх таблицы SQLite с TTL"""
+
+    def __init__(self, db_path: str = "fitness_bot.db", ttl: int = DEFAULT_TTL,
+                 memory_size: int = DEFAULT_MEMORY_SIZE):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.memory_size = memory_size
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, result)
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.init_database()
+
+    def get_connection(self):
+        """Получение соединения с базой данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """Инициализация таблицы кэша"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS parse_cache (
+                cache_key TEXT PRIMARY KEY,
+                text_norm TEXT NOT NULL,
+                version TEXT NOT NULL,
+                result_json TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                hits INTEGER NOT NULL DEFAULT 0
+            )
+        """)
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_parse_cache_expires ON parse_cache(expires_at)")
+        conn.commit()
+        conn.close()
+
+    def _remember(self, key: str, expires_at: float, result: Dict):
+        self._memory[key] = (expires_at, result)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    def get(self, text: str, version: str) -> Optional[Dict]:
+        """Сохраненный результат разбора (копия) или None"""
+        key = make_cache_key(text, version)
+        now = time.time()
+
+        cached = self._memory.get(key)
+        if cached is not None:
+            expires_at, result = cached
+            if expires_at > now:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return copy.deepcopy(result)
+            del self._memory[key]
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT result_json, expires_at FROM parse_cache
+            WHERE cache_key = ? AND expires_at > ?
+        """, (key, now))
+        row = cursor.fetchone()
+        if row:
+            cursor.execute("UPDATE parse_cache SET hits = hits + 1 WHERE cache_key = ?", (key,))
+            conn.commit()
+        conn.close()
+
+        if not row:
+            self.misses += 1
+            return None
+
+        result = json.loads(row['result_json'])
+        self._remember(key, row['expires_at'], result)
+        self.db_hits += 1
+        return copy.deepcopy(result)
+
+    def set(self, text: str, version: str, result: Dict):
+        """Сохранение результата разбора"""
+        key = make_cache_key(text, version)
+        now = time.time()
+        expires_at = now + self.ttl
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            INSERT OR REPLACE INTO parse_cache (cache_key, text_norm, version, result_json, created_at, expires_at, hits)
+            VALUES (?, ?, ?, ?, ?, ?, 0)
+        """, (key, normalize_food_text(text), version, json.dumps(result, ensure_ascii=False), now, expires_at))
+        conn.commit()
+        conn.close()
+        self._remember(key, expires_at, copy.deepcopy(result))
+
+    def purge(self, expired_only: bool = True) -> int:
+        """Удаление просроченных (или всех) записей. Возвращает количество удаленных"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        if expired_only:
+            cursor.execute("DELETE FROM parse_cache WHERE expires_at <= ?", (time.time(),))
+            now = time.time()
+            for key in [key for key, (expires_at, _) in self._memory.items() if expires_at <= now]:
+                del self._memory[key]
+        else:
+            cursor.execute("DELETE FROM parse_cache")
+            self._memory.clear()
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+        logger.info(f"Очищен кэш разбора: удалено {deleted} записей")
+        return deleted
+
+    def get_stats(self) -> Dict:
+        """Статистика кэша: попадания, промахи, размер"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT COUNT(*) as entries, COALESCE(SUM(hits), 0) as total_hits,
+                   SUM(CASE WHEN expires_at <= ? THEN 1 ELSE 0 END) as expired
+            FROM parse_cache
+        """, (time.time(),))
+        row = cursor.fetchone()
+        conn.close()
+
+        hits = self.memory_hits + self.db_hits
+        lookups = hits + self.misses
+        return {
+            'entries': row['entries'],
+            'expired': row['expired'] or 0,
+            'total_hits': row['total_hits'],
+            'memory_entries': len(self._memory),
+            'memory_hits': self.memory_hits,
+            'db_hits': self.db_hits,
+            'misses': self.misses,
+            'hit_rate': hits / lookups * 100 if lookups else 0.0
+        }
@@ -0,0 +1,168 @@
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+from food_text import UNIT_ALIASES, normalize_product_name
+
+logger = logging.getLogger(__name__)
+
+# Основа, на которую хранится КБЖУ: граммы и миллилитры - на 100, штуки и порции - на одну
+BASIS_BY_UNIT = {'г': '100g', 'мл': '100g', 'шт': 'шт', 'порция': 'порция'}
+
+# Сколько последних значений усредняется: новые данные постепенно вытесняют старые
+MAX_SAMPLES = 10
+
+KB_SOURCE = 'База продуктов'
+
+
+def canonical_unit(amount, unit) -> Optional[tuple]:
+    """(количество, единица) в канонических единицах food_text или None, если единица неизвестна"""
+    if unit is None:
+        return None
+    alias = UNIT_ALIASES.get(str(unit).lower().strip().rstrip('.'))
+    if not alias:
+        return None
+    try:
+        amount = float(amount)
+    except (TypeError, ValueError):
+        return None
+    if amount <= 0:
+        return None
+    return amount * alias[1], alias[0]
+
+
+class ProductKB:
+    """База знаний о продуктах: КБЖУ на 100г/штуку/порцию, выученные из ответов Groq и штрих-кодов"""
+
+    def __init__(self, db_path: str = "fitness_bot.db"):
+        self.db_path = db_path
+        self.init_database()
+
+    def get_connection(self):
+        """Получение соединения с базой данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """Инициализация таблицы базы продуктов"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS product_kb (
+                name_key TEXT NOT NULL,
+                basis TEXT NOT NULL,
+                name TEXT NOT NULL,
+                calories REAL NOT NULL,
+                proteins REAL,
+                fats REAL,
+                carbs REAL,
+                source TEXT,
+                samples INTEGER NOT NULL DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (name_key, basis)
+            )
+        """)
+        conn.commit()
+        conn.close()
+
+    def learn(self, name: str, basis: str, calories: float, proteins: Optional[float], fats: Optional[float],
+              carbs: Optional[float], source: str, name_key: Optional[str] = None):
+        """Запоминание КБЖУ продукта на основу basis (среднее по последним MAX_SAMPLES значениям)"""
+        name_key = name_key or normalize_product_name(name)
+        if not name_key or calories is None or calories <= 0:
+            return
+
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM product_kb WHERE name_key = ? AND basis = ?", (name_key, basis))
+        existing = cursor.fetchone()
+
+        def average(key: str, value):
+            if existing is None or existing[key] is None:
+                return value
+            if value is None:
+                return existing[key]
+            samples = existing['samples']
+            return round((existing[key] * samples + value) / (samples + 1), 1)
+
+        samples = min((existing['samples'] if existing else 0) + 1, MAX_SAMPLES)
+        cursor.execute("""
+            INSERT OR REPLACE INTO product_kb (name_key, basis, name, calories, proteins, fats, carbs, source, samples, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, CURRENT_TIMESTAMP)
+        """, (name_key, basis, existing['name'] if existing else name.strip(),
+              average('calories', round(calories, 1)), average('proteins', proteins),
+              average('fats', fats), average('carbs', carbs), source, samples))
+        conn.commit()
+        conn.close()
+
+    def learn_item(self, item: Dict, name_key: Optional[str] = None) -> bool:
+        """Запоминание продукта в формате parse_with_groq (КБЖУ на указанное количество)"""
+        quantity = canonical_unit(item.get('amount'), item.get('unit'))
+        if not quantity or not item.get('calories'):
+            return False
+        amount, unit = quantity
+        basis = BASIS_BY_UNIT[unit]
+        divisor = amount / 100 if basis == '100g' else amount
+
+        def per_basis(key: str):
+            value = item.get(key)
+            return round(float(value) / divisor, 2) if value is not None else None
+
+        self.learn(item.get('name', ''), basis, per_basis('calories'), per_basis('proteins'),
+                   per_basis('fats'), per_basis('carbs'), item.get('source') or 'Groq AI', name_key=name_key)
+        return True
+
+    def learn_items(self, items: List[Dict]) -> int:
+        """Запоминание всех продуктов из результата разбора. Возвращает количество запомненных"""
+        learned = 0
+        for item in items:
+            try:
+                learned += self.learn_item(item)
+            except Exception as e:
+                logger.warning(f"Не удалось запомнить продукт {item.get('name')}: {e}")
+        return learned
+
+    def names(self) -> List[str]:
+        """Названия всех известных продуктов"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT DISTINCT name FROM product_kb")
+        names = [row['name'] for row in cursor.fetchall()]
+        conn.close()
+        return names
+
+    def get(self, name_key: str, basis: str) -> Optional[Dict]:
+        """Запись базы по названию и основе"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("SELECT * FROM product_kb WHERE name_key = ? AND basis = ?", (name_key, basis))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def lookup(self, name_key: str, amount: Optional[float], unit: Optional[str]) -> Optional[Dict]:
+        """Продукт в формате parse_with_groq, пересчитанный на количество, или None, если он неизвестен"""
+        if not name_key or not amount or unit not in BASIS_BY_UNIT:
+            return None
+        basis = BASIS_BY_UNIT[unit]
+        product = self.get(name_key, basis)
+        if not product:
+            return None
+
+        factor = amount / 100 if basis == '100g' else amount
+
+        def scaled(key: str):
+            value = product[key]
+            return round(value * factor, 1) if value is not None else None
+
+        return {
+            'name': product['name'],
+            'amount': round(amount, 1) if amount % 1 else int(amount),
+            'unit': unit,
+            'calories': scaled('calories') or 0,
+            'proteins': scaled('proteins'),
+            'fats': scaled('fats'),
+            'carbs': scaled('carbs'),
+            'source': KB_SOURCE
+        }
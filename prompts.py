@@ -0,0 +1,391 @@
+import os
+import re
+import json
+import zlib
+from string import Template
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from food_text import normalize_food_text, split_food_parts
+from nutrition_table import table_key
+
+
+class PromptTemplate:
+    """Версионированный шаблон промпта.
+
+    Подстановки в system/user: $text - сообщение пользователя, $examples - примеры, подобранные
+    под сообщение, и фрагменты typo (правила исправления опечаток), которые убираются, если
+    названия уже сверены с индексом опечаток. Версия входит в ключ кэша разбора и в статистику
+    расхода токенов, поэтому любое изменение текста - новая версия, а не правка старой.
+    """
+
+    def __init__(self, name: str, version: str, system: str, user: str, max_tokens: int,
+                 examples: Sequence[Tuple[str, str]] = (), example_count: int = 0,
+                 typo: Optional[Dict[str, str]] = None, tokens_per_item: int = 0):
+        self.name = name
+        self.version = version
+        self.system = Template(system)
+        self.user = Template(user)
+        self.max_tokens = max_tokens
+        self.examples = list(examples)
+        self.example_count = example_count
+        self.typo = typo or {}
+        self.tokens_per_item = tokens_per_item
+
+    def render(self, text: str, names_checked: bool = False, **values) -> List[Dict]:
+        """Сообщения для LLM"""
+        mapping = {key: '' if names_checked else value for key, value in self.typo.items()}
+        mapping.update(values)
+        mapping['text'] = text
+        if self.example_count:
+            mapping['examples'] = ''.join(
+                f'"{example}" -> {answer}\n'
+                for example, answer in select_examples(text, self.examples, self.example_count)
+            )
+        return [
+            {"role": "system", "content": self.system.substitute(mapping)},
+            {"role": "user", "content": self.user.substitute(mapping)},
+        ]
+
+    def max_tokens_for(self, text: str) -> int:
+        """Лимит ответа: по числу продуктов в сообщении, но не больше max_tokens"""
+        if not self.tokens_per_item:
+            return self.max_tokens
+        return min(self.max_tokens, 60 + self.tokens_per_item * max(len(split_food_parts(text)), 1))
+
+
+_PIECE_RE = re.compile(r'шт|порц', re.IGNORECASE)
+
+
+def select_examples(text: str, examples: Sequence[Tuple[str, str]], count: int) -> List[Tuple[str, str]]:
+    """count примеров, самых похожих на сообщение: общие слова (по основам), совпадение "шт/порция", порядок"""
+    words = set(table_key(text).split())
+    piece = bool(_PIECE_RE.search(text))
+    scored = []
+    for position, (example, answer) in enumerate(examples):
+        score = 2 * len(words & set(table_key(example).split()))
+        if piece and _PIECE_RE.search(example):
+            score += 1
+        scored.append((-score, position, example, answer))
+    return [(example, answer) for _, _, example, answer in sorted(scored)[:count]]
+
+
+def _answer(is_food: bool, *items) -> str:
+    """Пример ответа в формате FOOD_RESPONSE_SCHEMA"""
+    keys = ('name', 'amount', 'unit', 'calories', 'proteins', 'fats', 'carbs', 'source')
+    return json.dumps({'is_food': is_food, 'items': [dict(zip(keys, item)) for item in items]}, ensure_ascii=False)
+
+
+# --- Разбор еды: подробный промпт (с ним бот работал до появления реестра) ---
+
+_FULL_TYPO_RULES = (
+    "1. ИСПРАВЛЕНИЕ ОРФОГРАФИЧЕСКИХ ОШИБОК:\n"
+    "   - Если в тексте есть орфографические ошибки (например 'корнешон' вместо 'корнишон', 'пельмен' вместо 'пельмени'), "
+    "   исправь их и ищи данные для ПРАВИЛЬНО НАПИСАННОГО продукта\n"
+    "   - Используй правильное название продукта в поле 'name'\n"
+    "   - Примеры исправлений: 'корнешон' → 'корнишон', 'пельмен' → 'пельмени', 'вареник' → 'вареники'\n\n"
+)
+_FULL_TYPO_EXAMPLE = (
+    'Для "корнешон 5шт" (с ошибкой): [{"name": "корнишон", "amount": 5, "unit": "шт", "calories": 5, "proteins": 0.3, "fats": 0.1, "carbs": 1, "source": "USDA FoodData Central"}]\n'
+    '   (Обрати внимание: исправлена ошибка "корнешон" → "корнишон")\n'
+)
+_FULL_TYPO_REMINDER = "- Исправляй орфографические ошибки в названиях продуктов\n"
+_FULL_TYPO_SYSTEM = " Исправляй орфографические ошибки в названиях продуктов."
+PARSE_FULL_USER = (
+    "Пользователь написал: '$text'\n\n"
+    "Сначала определи, относится ли сообщение к РЕАЛЬНОЙ еде/продуктам питания "
+    "('пельмени 250г', 'съел яблоко' - еда; 'привет', 'как дела', нецензурные слова и шутки - нет). "
+    "Если это не еда, верни {\"is_food\": false, \"items\": []}.\n\n"
+    "ТЫ ДОЛЖЕН ИСПОЛЬЗОВАТЬ ТОЛЬКО РЕАЛЬНЫЕ ДАННЫЕ ИЗ ИНТЕРНЕТА. НЕ ПРИДУМЫВАЙ ЗНАЧЕНИЯ!\n\n"
+    "КРИТИЧЕСКИ ВАЖНО:\n"
+    "${typo_rules}"
+    "2. НЕ РАЗБИВАТЬ НА КОМПОНЕНТЫ И ПРАВИЛЬНОЕ КОЛИЧЕСТВО:\n"
+    "   - Если это ГОТОВОЕ БЛЮДО из ресторана/фастфуда (например 'чизбургер из KFC', 'чизбургер из Burger King', 'бургер из Макдональдс'), "
+    "   ищи КБЖУ для ГОТОВОГО БЛЮДА целиком, НЕ разбивай на компоненты!\n"
+    "   - Ищи данные на официальных сайтах ресторанов или в базах данных готовых блюд\n"
+    "   - КРИТИЧЕСКИ ВАЖНО: Если готовое блюдо указано как '1шт', '1 порция', '1 порц' (например 'чизбургер Burger King 1шт', 'ЧикенБургер 1 порция', 'чизбургер из Rostics 1 порция'), "
+    "   ищи КБЖУ для ОДНОЙ ПОРЦИИ готового блюда, НЕ используй данные на 100г!\n"
+    "   - Для готовых блюд из ресторанов '1шт', '1 порция', '1 порц' означают ОДНУ ПОРЦИЮ готового блюда, а не 100г!\n"
+    "   - Пример: чизбургер Burger King 1шт = ~312-330 ккал (одна порция), а НЕ 540 ккал (это было бы на 100г или двойной чизбургер)\n"
+    "   - Пример: ЧикенБургер McDonald's 1 порция = ~350 ккал (одна порция), а НЕ данные на 100г!\n"
+    "   - Пример: классический чизбургер Rostics/Ростик'с 1шт = ~240 ккал (одна порция 130-140г), а НЕ 400+ ккал!\n"
+    "   - Пример: ЧикенБургер Rostics/Ростик'с 1шт = ~375 ккал (одна порция 135-150г), а НЕ данные на 100г!\n"
+    "   - НЕ разбивай готовые блюда на компоненты (хлеб, сыр, мясо отдельно) - ищи данные для готового продукта!\n"
+    "   - НЕ разбивай сложные блюда на ингредиенты, если это готовое блюдо (пицца, роллы, сэндвичи, салаты из ресторанов)\n\n"
+    "3. ФИЛЬТРАЦИЯ СТРАННЫХ ПРОДУКТОВ:\n"
+    "   - НЕ добавляй продукты с нулевыми значениями КБЖУ (0 калорий, 0 белков, 0 жиров, 0 углеводов)\n"
+    "   - НЕ добавляй несуществующие или выдуманные продукты\n"
+    "   - Если не можешь найти реальные данные - верни пустой массив items\n\n"
+    "Распознай все продукты и их количество из этого текста. "
+    "Для каждого продукта найди ТОЧНЫЕ данные КБЖУ из проверенных источников (USDA FoodData Central, Open Food Facts, официальные сайты производителей/ресторанов, базы данных продуктов питания).\n\n"
+    "ВАЖНО: Если продукт указан без явного количества (например 'пельмени 250гр' или 'пельмени 250г'), "
+    "распознай количество из текста (250г) и найди КБЖУ для этого количества. "
+    "Если количество не указано, используй стандартную порцию (например, для пельменей - 100г или стандартная порция из базы данных).\n"
+    "Для готовых блюд из ресторанов (бургеры, пицца, роллы и т.д.):\n"
+    "- Если указано '1шт', '1 порция', '1 порц' - ищи КБЖУ для ОДНОЙ ПОРЦИИ готового блюда (НЕ на 100г!)\n"
+    "- '1 порция' = '1шт' = одна порция готового блюда, НЕ 100г!\n"
+    "- Если указано количество в граммах (например 'бургер 200г') - используй это количество\n"
+    "- НЕ используй данные на 100г для готовых блюд, если указано '1шт' или '1 порция'!\n"
+    "- Ищи данные для ГОТОВОГО БЛЮДА, не разбивай на компоненты!\n"
+    "- Для бургеров из McDonald's, Burger King, KFC, Rostics ищи данные для ОДНОЙ ПОРЦИИ на официальных сайтах!\n\n"
+    "Верни ответ ТОЛЬКО в формате JSON-объекта {\"is_food\": true/false, \"items\": [...]}, "
+    "где каждый элемент items это объект с полями:\n"
+    "- name: название продукта (на русском, точное название бренда и продукта если указано)\n"
+    "- amount: количество (число, точное значение из текста или стандартная порция)\n"
+    "- unit: единица измерения ('г', 'мл', 'шт', 'кг', 'л')\n"
+    "- calories: калории для этого количества (число, ТОЧНОЕ значение из интернета)\n"
+    "- proteins: белки в граммах для этого количества (число, ОБЯЗАТЕЛЬНО, точное значение)\n"
+    "- fats: жиры в граммах для этого количества (число, ОБЯЗАТЕЛЬНО, точное значение)\n"
+    "- carbs: углеводы в граммах для этого количества (число, ОБЯЗАТЕЛЬНО, точное значение)\n"
+    "- source: источник информации (строка, например 'USDA FoodData Central', 'Open Food Facts', 'Официальный сайт производителя')\n\n"
+    "КРИТИЧЕСКИ ВАЖНО:\n"
+    "- НЕ ПРИДУМЫВАЙ данные! Используй ТОЛЬКО реальные значения из интернета\n"
+    "- Если не можешь найти точные данные для продукта, верни пустой массив items\n"
+    "- Для каждого продукта ОБЯЗАТЕЛЬНО указывай ВСЕ три значения: proteins, fats, carbs\n"
+    "- Если продукт указан без количества (например 'конфету Raffaelo'), найди стандартный вес одной штуки в интернете\n"
+    "- Указывай точный источник данных (не просто 'Интернет', а конкретный источник)\n"
+    "- Значения должны быть реалистичными (например, конфета не может иметь 500 ккал на 1шт)\n"
+    "- Для готовых блюд из ресторанов проверяй реалистичность:\n"
+    "  * Стандартный чизбургер Burger King ~312-330 ккал на 1шт (НЕ 540 ккал!)\n"
+    "  * Классический чизбургер Rostics/Ростик'с ~240 ккал на 1шт (НЕ 400+ ккал!)\n"
+    "  * ЧикенБургер Rostics/Ростик'с ~375 ккал на 1шт (НЕ 500+ ккал!)\n"
+    "  * ЧикенБургер McDonald's ~350 ккал на 1шт (НЕ 500+ ккал!)\n"
+    "- Если находишь данные, которые кажутся слишком большими для '1шт' или '1 порция' готового блюда, проверь - возможно это данные на 100г или двойная порция!\n"
+    "- КРИТИЧЕСКИ ВАЖНО: Когда ищешь данные для готового блюда с указанием '1шт' или '1 порция', НЕ используй данные на 100г!\n"
+    "- Ищи на официальных сайтах ресторанов данные для ОДНОЙ ПОРЦИИ готового блюда!\n"
+    "- Для Rostics/Ростик'с: классический чизбургер = ~240 ккал, ЧикенБургер = ~375 ккал!\n"
+    "- Примеры правильных значений для ОДНОЙ ПОРЦИИ:\n"
+    "  * ЧикенБургер McDonald's 1шт = ~350 ккал (НЕ 500+ ккал!)\n"
+    "  * Чизбургер Burger King 1шт = ~312 ккал (НЕ 500+ ккал!)\n"
+    "  * Чизбургер Rostics/Ростик'с 1шт = ~240 ккал (НЕ 400+ ккал! Это классический чизбургер)\n"
+    "  * ЧикенБургер Rostics/Ростик'с 1шт = ~375 ккал (НЕ 500+ ккал!)\n"
+    "  * Чизбургер Де Люкс Rostics = ~350+ ккал (это другой бургер, не классический!)\n\n"
+    "Примеры правильных массивов items:\n"
+    'Для "овсянка 200г": [{"name": "овсянка", "amount": 200, "unit": "г", "calories": 778, "proteins": 26, "fats": 14, "carbs": 138, "source": "USDA FoodData Central"}]\n'
+    'Для "конфету Raffaelo": [{"name": "Raffaello", "amount": 1, "unit": "шт", "calories": 61, "proteins": 1.1, "fats": 4.5, "carbs": 4.8, "source": "Официальный сайт Ferrero"}]\n'
+    'Для "пельмени 250гр" или "пельмени 250г": [{"name": "пельмени", "amount": 250, "unit": "г", "calories": 625, "proteins": 25, "fats": 20, "carbs": 75, "source": "База данных продуктов питания / USDA FoodData Central"}]\n'
+    'Для "пельмени" (без количества): [{"name": "пельмени", "amount": 100, "unit": "г", "calories": 250, "proteins": 10, "fats": 8, "carbs": 30, "source": "База данных продуктов питания"}]\n'
+    'Для "корнишон 5шт" или "корнишон 5 шт": [{"name": "корнишон", "amount": 5, "unit": "шт", "calories": 5, "proteins": 0.3, "fats": 0.1, "carbs": 1, "source": "USDA FoodData Central"}]\n'
+    "${typo_example}"
+    'Для "чизбургер из KFC 1шт": [{"name": "чизбургер KFC", "amount": 1, "unit": "шт", "calories": 540, "proteins": 30, "fats": 30, "carbs": 40, "source": "Официальный сайт KFC"}]\n'
+    'Для "чизбургер Burger King 1шт": [{"name": "чизбургер Burger King", "amount": 1, "unit": "шт", "calories": 312, "proteins": 16, "fats": 12, "carbs": 27, "source": "Официальный сайт Burger King"}]\n'
+    'Для "ЧикенБургер 1 порция": [{"name": "ЧикенБургер McDonald\'s", "amount": 1, "unit": "шт", "calories": 350, "proteins": 25, "fats": 15, "carbs": 30, "source": "Официальный сайт McDonald\'s"}]\n'
+    'Для "чизбургер из Rostics 1 порция": [{"name": "чизбургер Rostics", "amount": 1, "unit": "шт", "calories": 240, "proteins": 12.5, "fats": 9, "carbs": 26, "source": "Официальный сайт Rostics"}]\n'
+    'Для "чизбургер из Ростик\'с 1 порция": [{"name": "чизбургер Ростик\'с", "amount": 1, "unit": "шт", "calories": 240, "proteins": 12.5, "fats": 9, "carbs": 26, "source": "Официальный сайт Ростик\'с"}]\n'
+    'Для "ЧикенБургер из Rostics 1 порция": [{"name": "ЧикенБургер Rostics", "amount": 1, "unit": "шт", "calories": 375, "proteins": 16.5, "fats": 14.5, "carbs": 39, "source": "Официальный сайт Rostics"}]\n'
+    'Для "ЧикенБургер из Ростик\'с 1 порция": [{"name": "ЧикенБургер Ростик\'с", "amount": 1, "unit": "шт", "calories": 375, "proteins": 16.5, "fats": 14.5, "carbs": 39, "source": "Официальный сайт Ростик\'с"}]\n'
+    '   (Обрати внимание: это данные для ОДНОЙ ПОРЦИИ готового блюда, НЕ на 100г! "1 порция" = "1шт" = одна порция!)\n'
+    'Для "чизбургер из Rostiks 1шт": [{"name": "чизбургер Rostiks", "amount": 1, "unit": "шт", "calories": 450, "proteins": 25, "fats": 22, "carbs": 38, "source": "База данных готовых блюд / Официальный сайт Rostiks"}]\n'
+    '   (Обрати внимание: НЕ разбивай на компоненты! Ищи данные для готового блюда целиком! Для "1шт" или "1 порция" - данные для ОДНОЙ ПОРЦИИ, а не на 100г!)\n\n'
+    "ВАЖНО:\n"
+    "${typo_reminder}"
+    "- Для готовых блюд из ресторанов НЕ разбивай на компоненты! Ищи данные для готового блюда целиком!\n"
+    "- НЕ добавляй продукты с нулевыми значениями КБЖУ\n\n"
+    "Если не можешь найти точные данные - верни пустой массив items. "
+    "Ответ должен быть ТОЛЬКО JSON-объектом, без дополнительного текста."
+)
+
+PARSE_FULL_SYSTEM = (
+    "Ты помощник для подсчета калорий. "
+    "Ты используешь ТОЛЬКО реальные данные из интернета (USDA, Open Food Facts, официальные сайты). "
+    "НЕ ПРИДУМЫВАЙ значения!${typo_system} "
+    "Для готовых блюд из ресторанов НЕ разбивай на компоненты - ищи данные для готового блюда целиком. "
+    "КРИТИЧЕСКИ ВАЖНО: Если готовое блюдо указано как '1шт', '1 порция' или '1 порц' - ищи КБЖУ для ОДНОЙ ПОРЦИИ готового блюда, НЕ используй данные на 100г! '1 порция' = '1шт' = одна порция готового блюда! "
+    "НЕ добавляй продукты с нулевыми значениями КБЖУ. "
+    "Проверяй реалистичность данных. "
+    "Если сообщение не о еде - is_food: false. "
+    "Если не можешь найти точные данные - пустой массив items. "
+    "Всегда отвечаешь только валидным JSON-объектом {\"is_food\": ..., \"items\": [...]} без дополнительного текста."
+)
+
+# --- Разбор еды: компактный промпт, примеры подбираются под сообщение ---
+
+PARSE_COMPACT_SYSTEM = (
+    "Ты считаешь КБЖУ еды по сообщениям пользователей. Используешь только реальные данные "
+    "(USDA FoodData Central, Open Food Facts, официальные сайты производителей и ресторанов) "
+    "и не придумываешь значения. Отвечаешь только JSON-объектом."
+)
+PARSE_COMPACT_USER = (
+    "Сообщение: '$text'\n\n"
+    'Верни JSON {"is_food": bool, "items": [{"name", "amount", "unit", "calories", "proteins", "fats", "carbs", "source"}]}.\n'
+    "Правила:\n"
+    "- Не еда (приветствие, вопрос, шутка, ругательство) - is_food: false и пустой items.\n"
+    "${typo_rules}"
+    "- КБЖУ - на количество из сообщения; без количества - на стандартную порцию или 1 шт.\n"
+    "- Готовые блюда ресторанов (бургеры, пицца, роллы) не разбивай на ингредиенты; "
+    "'1шт' и '1 порция' - одна порция, не 100г.\n"
+    "- unit: 'г', 'мл' или 'шт'. Не добавляй выдуманные продукты и продукты с нулевым КБЖУ; нет данных - пустой items.\n\n"
+    "Примеры:\n"
+    "$examples"
+)
+_COMPACT_TYPO_RULES = "- Исправляй опечатки ('корнешон' -> 'корнишон'), в name - правильное название.\n"
+
+PARSE_EXAMPLES = [
+    ("овсянка 200г", _answer(True, ("овсянка", 200, "г", 778, 26, 14, 138, "USDA FoodData Central"))),
+    ("пельмени 250г", _answer(True, ("пельмени", 250, "г", 625, 25, 20, 75, "USDA FoodData Central"))),
+    ("гречка 150г и котлета 1шт", _answer(
+        True, ("гречка вареная", 150, "г", 165, 6.3, 1.7, 32, "USDA FoodData Central"),
+        ("котлета", 1, "шт", 200, 12, 14, 7, "База данных продуктов питания"))),
+    ("конфету Raffaelo", _answer(True, ("Raffaello", 1, "шт", 61, 1.1, 4.5, 4.8, "Официальный сайт Ferrero"))),
+    ("корнишон 5шт", _answer(True, ("корнишон", 5, "шт", 5, 0.3, 0.1, 1, "USDA FoodData Central"))),
+    ("чизбургер Burger King 1шт", _answer(
+        True, ("чизбургер Burger King", 1, "шт", 312, 16, 12, 27, "Официальный сайт Burger King"))),
+    ("ЧикенБургер McDonald's 1 порция", _answer(
+        True, ("ЧикенБургер McDonald's", 1, "шт", 350, 25, 15, 30, "Официальный сайт McDonald's"))),
+    ("чизбургер из Rostics 1 порция", _answer(
+        True, ("чизбургер Rostics", 1, "шт", 240, 12.5, 9, 26, "Официальный сайт Rostics"))),
+    ("ЧикенБургер из Ростик'с 1 порция", _answer(
+        True, ("ЧикенБургер Ростик'с", 1, "шт", 375, 16.5, 14.5, 39, "Официальный сайт Ростик'с"))),
+    ("привет, как дела", _answer(False)),
+]
+
+# Разбор нескольких сообщений разных пользователей одним запросом: $text - строки "номер: сообщение"
+PARSE_BATCH_SYSTEM = PARSE_COMPACT_SYSTEM
+PARSE_BATCH_USER = (
+    "Сообщения ($count шт., номер: текст):\n$text\n\n"
+    'Разбери каждое сообщение отдельно и верни JSON {"results": [{"id": номер, "is_food": bool, '
+    '"items": [{"name", "amount", "unit", "calories", "proteins", "fats", "carbs", "source"}]}]} '
+    "- по одному элементу на каждый номер.\n"
+    "Правила:\n"
+    "- Не еда (приветствие, вопрос, шутка, ругательство) - is_food: false и пустой items.\n"
+    "${typo_rules}"
+    "- КБЖУ - на количество из сообщения; без количества - на стандартную порцию или 1 шт.\n"
+    "- Готовые блюда ресторанов (бургеры, пицца, роллы) не разбивай на ингредиенты; "
+    "'1шт' и '1 порция' - одна порция, не 100г.\n"
+    "- unit: 'г', 'мл' или 'шт'. Не добавляй выдуманные продукты и продукты с нулевым КБЖУ; нет данных - пустой items.\n"
+    "- Продукты одного сообщения не переносятся в другое.\n\n"
+    "Примеры разбора одного сообщения:\n"
+    "$examples"
+)
+
+# --- Проверка на еду, поиск по штрих-коду, мотивация ---
+
+CLASSIFY_SYSTEM = "Ты помощник для определения, относится ли сообщение к еде. Отвечай только 'yes' или 'no'."
+CLASSIFY_USER = (
+    "Пользователь написал: '$text'\n\n"
+    "Определи, относится ли это сообщение к РЕАЛЬНОЙ еде/продуктам питания. "
+    "Ответь ТОЛЬКО 'yes' если это про РЕАЛЬНУЮ еду, или 'no' если это не про еду.\n\n"
+    "Примеры про еду: 'пельмени 250г', 'съел яблоко', 'овсянка 200г', 'конфету Raffaelo', 'корнишон 5шт', 'чизбургер 1шт', 'йогурт протеиновый 290г'\n"
+    "Примеры НЕ про еду: 'привет', 'как дела', 'что делаешь', 'погода хорошая', 'сегодня понедельник'\n\n"
+    "ВАЖНО: Если это явно нецензурное слово или шутка - отвечай 'no'.\n"
+    "Ответь только 'yes' или 'no', без дополнительного текста."
+)
+
+BARCODE_SYSTEM = (
+    "Ты помощник для поиска информации о продуктах. Отвечай только названием продукта "
+    "на русском языке или пустой строкой, если не можешь найти."
+)
+BARCODE_USER = (
+    "Найди информацию о продукте со штрих-кодом $text. Верни только название продукта на русском языке. "
+    "Если не можешь найти - верни пустую строку."
+)
+
+# Программа тренировок группы - общий контекст для факта и совета
+TRAINING_CONTEXT = (
+    "Группа тренируется каждый день: делают 80 отжиманий и 80 упражнений на пресс. "
+    "Это их ежедневная программа тренировок."
+)
+FACT_SYSTEM = (
+    "Ты помощник, который создает мотивирующие факты о фитнесе и здоровье, "
+    "учитывая конкретную программу тренировок группы."
+)
+FACT_USER = (
+    "$text\n\n"
+    "Придумай короткий (1-2 предложения) мотивирующий факт о пользе именно такой программы тренировок "
+    "(80 отжиманий и 80 упражнений на пресс ежедневно). "
+    "Факт должен быть научно обоснованным, вдохновляющим и релевантным для их конкретной программы. "
+    "Можешь упомянуть пользу отжиманий, упражнений на пресс, или ежедневных тренировок. "
+    "Ответ должен быть только фактом, без дополнительных комментариев."
+)
+TIP_SYSTEM = (
+    "Ты помощник, который дает практические советы о фитнесе и здоровье, "
+    "учитывая конкретную программу тренировок группы."
+)
+TIP_USER = (
+    "$text\n\n"
+    "Придумай короткий (1 предложение) практический совет специально для этой группы. "
+    "Совет должен быть конкретным и полезным для людей, которые делают 80 отжиманий и 80 упражнений на пресс каждый день. "
+    "Можешь дать совет о технике выполнения, восстановлении, питании, прогрессии, или как избежать перетренированности при ежедневных тренировках. "
+    "Совет должен быть релевантным именно для их программы. "
+    "Ответ должен быть только советом, без дополнительных комментариев."
+)
+
+# Факт и совет одним JSON-ответом; $count пар за запрос - для пополнения пула мотивации
+MOTIVATION_SYSTEM = (
+    "Ты помощник, который создает мотивирующие факты и практические советы о фитнесе и здоровье, "
+    "учитывая конкретную программу тренировок группы. Всегда отвечаешь только валидным JSON-объектом "
+    '{"pairs": [{"fact": "...", "tip": "..."}]} без дополнительного текста.'
+)
+MOTIVATION_USER = (
+    "$text\n\n"
+    "Придумай $count разных пар: факт и совет.\n"
+    "fact - короткий (1-2 предложения) научно обоснованный, вдохновляющий факт о пользе именно такой программы "
+    "(отжимания, упражнения на пресс, ежедневные тренировки).\n"
+    "tip - короткий (1 предложение) конкретный совет для людей, которые делают 80 отжиманий и 80 упражнений "
+    "на пресс каждый день: техника, восстановление, питание, прогрессия или как избежать перетренированности.\n"
+    "Факты и советы не должны повторяться. Только текст факта и совета, без комментариев."
+)
+
+# Персональная мотивация сразу для нескольких групп: $groups - строки "номер: сводка группы"
+MOTIVATION_BATCH_SYSTEM = (
+    "Ты помощник, который пишет групповые мотивирующие сообщения о фитнесе с учетом того, "
+    "как группа тренируется. Всегда отвечаешь только валидным JSON-объектом "
+    '{"messages": [{"group": номер, "fact": "...", "tip": "..."}]} без дополнительного текста.'
+)
+MOTIVATION_BATCH_USER = (
+    "$text\n\n"
+    "Сводки $count групп:\n$groups\n"
+    "Для каждой группы напиши fact - короткий (1-2 предложения) научно обоснованный, вдохновляющий факт "
+    "о пользе их программы, и tip - короткий (1 предложение) практический совет. Учитывай сводку: "
+    "похвали серии и выполнение нормы, поддержи, если вчера норму выполнили немногие. "
+    "Сообщения для разных групп не должны повторяться. Только текст, без комментариев."
+)
+
+PROMPTS: Dict[str, PromptTemplate] = {template.version: template for template in [
+    PromptTemplate('parse', 'parse-full-2', PARSE_FULL_SYSTEM, PARSE_FULL_USER, max_tokens=800, typo={
+        'typo_rules': _FULL_TYPO_RULES, 'typo_example': _FULL_TYPO_EXAMPLE,
+        'typo_reminder': _FULL_TYPO_REMINDER, 'typo_system': _FULL_TYPO_SYSTEM,
+    }),
+    PromptTemplate('parse', 'parse-compact-1', PARSE_COMPACT_SYSTEM, PARSE_COMPACT_USER, max_tokens=800,
+                   examples=PARSE_EXAMPLES, example_count=3, typo={'typo_rules': _COMPACT_TYPO_RULES},
+                   tokens_per_item=90),
+    PromptTemplate('parse_batch', 'parse-batch-1', PARSE_BATCH_SYSTEM, PARSE_BATCH_USER, max_tokens=4000,
+                   examples=PARSE_EXAMPLES, example_count=3, typo={'typo_rules': _COMPACT_TYPO_RULES},
+                   tokens_per_item=90),
+    PromptTemplate('classify', 'classify-1', CLASSIFY_SYSTEM, CLASSIFY_USER, max_tokens=10),
+    PromptTemplate('barcode', 'barcode-1', BARCODE_SYSTEM, BARCODE_USER, max_tokens=50),
+    PromptTemplate('fact', 'fact-1', FACT_SYSTEM, FACT_USER, max_tokens=120),
+    PromptTemplate('tip', 'tip-1', TIP_SYSTEM, TIP_USER, max_tokens=120),
+    PromptTemplate('motivation', 'motivation-1', MOTIVATION_SYSTEM, MOTIVATION_USER, max_tokens=1500),
+    PromptTemplate('motivation_batch', 'motivation-batch-1', MOTIVATION_BATCH_SYSTEM, MOTIVATION_BATCH_USER,
+                   max_tokens=1500),
+]}
+
+# Активные версии по умолчанию; переопределяются переменными PROMPT_<ИМЯ> в .env.
+# Несколько версий через запятую - A/B: сообщение стабильно попадает в одну из них
+DEFAULT_VERSIONS = {
+    'parse': 'parse-compact-1',
+    'parse_batch': 'parse-batch-1',
+    'classify': 'classify-1',
+    'barcode': 'barcode-1',
+    'fact': 'fact-1',
+    'tip': 'tip-1',
+    'motivation': 'motivation-1',
+    'motivation_batch': 'motivation-batch-1',
+}
+
+
+def active_versions(name: str) -> List[str]:
+    """Активные версии шаблона (неизвестные версии из .env пропускаются)"""
+    configured = os.getenv(f"PROMPT_{name.upper()}", DEFAULT_VERSIONS[name])
+    versions = [version.strip() for version in configured.split(',') if version.strip() in PROMPTS]
+    return versions or [DEFAULT_VERSIONS[name]]
+
+
+def get_prompt(name: str, text: Optional[str] = None) -> PromptTemplate:
+    """Шаблон для запроса. При A/B версия выбирается по хэшу сообщения, так что повтор
+    того же сообщения попадает в ту же версию (и в тот же кэш)"""
+    versions = active_versions(name)
+    if len(versions) == 1 or text is None:
+        return PROMPTS[versions[0]]
+    bucket = zlib.crc32(normalize_food_text(text).encode('utf-8')) % len(versions)
+    return PROMPTS[versions[bucket]]
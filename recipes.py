@@ -0,0 +1,241 @@
+import sqlite3
+import logging
+from typing import Dict, List, Optional
+
+from food_text import normalize_product_name, parse_quantity
+
+logger = logging.getLogger(__name__)
+
+
+class RecipeBook:
+    """Пользовательские рецепты: КБЖУ считается один раз и дальше масштабируется локально"""
+
+    def __init__(self, db_path: str = "fitness_bot.db"):
+        self.db_path = db_path
+        self.init_database()
+
+    def get_connection(self):
+        """Получение соединения с базой данных"""
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def init_database(self):
+        """Инициализация таблиц рецептов"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS recipes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                user_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                total_weight REAL,
+                portions REAL NOT NULL DEFAULT 1,
+                portion_weight REAL,
+                calories_per_100g REAL,
+                proteins_per_100g REAL,
+                fats_per_100g REAL,
+                carbs_per_100g REAL,
+                calories_per_portion REAL NOT NULL,
+                proteins_per_portion REAL,
+                fats_per_portion REAL,
+                carbs_per_portion REAL,
+                source TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE(user_id, name_key)
+            )
+        """)
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS recipe_ingredients (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                recipe_id INTEGER NOT NULL REFERENCES recipes(id) ON DELETE CASCADE,
+                name TEXT NOT NULL,
+                amount REAL,
+                unit TEXT,
+                calories REAL NOT NULL,
+                proteins REAL,
+                fats REAL,
+                carbs REAL
+            )
+        """)
+
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_recipe_ingredients_recipe ON recipe_ingredients(recipe_id)")
+
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def _weight_in_grams(amount, unit) -> Optional[float]:
+        """Вес ингредиента в граммах (мл считаем как граммы), None для штук/порций"""
+        if amount is None or not unit:
+            return None
+        unit = unit.lower().strip('.')
+        if unit in ('г', 'гр', 'мл'):
+            return float(amount)
+        if unit in ('кг', 'л'):
+            return float(amount) * 1000
+        return None
+
+    def save_recipe(self, user_id: int, name: str, ingredients: List[Dict], portions: float = 1,
+                    source: str = 'Рецепт (Groq AI)') -> Dict:
+        """Сохранение рецепта из списка ингредиентов (формат элементов как у parse_with_groq).
+
+        Вес блюда считается по ингредиентам в г/мл; если у части ингредиентов вес неизвестен,
+        КБЖУ на 100г не сохраняется и блюдо можно добавлять только порциями.
+        """
+        portions = portions if portions and portions > 0 else 1
+        totals = {
+            key: sum(float(item.get(key) or 0) for item in ingredients)
+            for key in ('calories', 'proteins', 'fats', 'carbs')
+        }
+
+        weights = [self._weight_in_grams(item.get('amount'), item.get('unit')) for item in ingredients]
+        total_weight = sum(weights) if weights and all(w is not None for w in weights) else None
+
+        per_100g = {key: None for key in totals}
+        if total_weight:
+            per_100g = {key: round(value / total_weight * 100, 1) for key, value in totals.items()}
+        per_portion = {key: round(value / portions, 1) for key, value in totals.items()}
+
+        return self._store(user_id, name, total_weight, portions,
+                           (total_weight / portions) if total_weight else None,
+                           per_100g, per_portion, source, ingredients)
+
+    def save_manual_recipe(self, user_id: int, name: str, calories: float, proteins: Optional[float],
+                           fats: Optional[float], carbs: Optional[float],
+                           portion_weight: Optional[float] = None) -> Dict:
+        """Сохранение рецепта с КБЖУ на 100г, введенными вручную"""
+        per_100g = {'calories': calories, 'proteins': proteins, 'fats': fats, 'carbs': carbs}
+        weight = portion_weight or 100
+        per_portion = {
+            key: round(value * weight / 100, 1) if value is not None else None
+            for key, value in per_100g.items()
+        }
+        return self._store(user_id, name, None, 1, portion_weight, per_100g, per_portion, 'Рецепт (вручную)', [])
+
+    def _store(self, user_id: int, name: str, total_weight, portions, portion_weight,
+               per_100g: Dict, per_portion: Dict, source: str, ingredients: List[Dict]) -> Dict:
+        """Запись рецепта и ингредиентов одной транзакцией (рецепт с тем же названием заменяется)"""
+        name_key = normalize_product_name(name)
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute("""
+                SELECT id FROM recipes WHERE user_id = ? AND name_key = ?
+            """, (user_id, name_key))
+            existing = cursor.fetchone()
+            if existing:
+                cursor.execute("DELETE FROM recipe_ingredients WHERE recipe_id = ?", (existing['id'],))
+                cursor.execute("DELETE FROM recipes WHERE id = ?", (existing['id'],))
+
+            cursor.execute("""
+                INSERT INTO recipes (user_id, name, name_key, total_weight, portions, portion_weight,
+                                     calories_per_100g, proteins_per_100g, fats_per_100g, carbs_per_100g,
+                                     calories_per_portion, proteins_per_portion, fats_per_portion, carbs_per_portion,
+                                     source)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (user_id, name.strip(), name_key, total_weight, portions, portion_weight,
+                  per_100g['calories'], per_100g['proteins'], per_100g['fats'], per_100g['carbs'],
+                  per_portion['calories'], per_portion['proteins'], per_portion['fats'], per_portion['carbs'],
+                  source))
+            recipe_id = cursor.lastrowid
+
+            cursor.executemany("""
+                INSERT INTO recipe_ingredients (recipe_id, name, amount, unit, calories, proteins, fats, carbs)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            """, [
+                (recipe_id, item.get('name', ''), item.get('amount'), item.get('unit'),
+                 item.get('calories') or 0, item.get('proteins'), item.get('fats'), item.get('carbs'))
+                for item in ingredients
+            ])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        logger.info(f"Сохранен рецепт '{name}' для user_id={user_id}")
+        return self.get_recipe(user_id, name_key)
+
+    def get_recipe(self, user_id: int, name: str) -> Optional[Dict]:
+        """Рецепт пользователя по названию"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM recipes WHERE user_id = ? AND name_key = ?
+        """, (user_id, normalize_product_name(name)))
+        row = cursor.fetchone()
+        conn.close()
+        return dict(row) if row else None
+
+    def list_recipes(self, user_id: int) -> List[Dict]:
+        """Все рецепты пользователя"""
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("""
+            SELECT * FROM recipes WHERE user_id = ? ORDER BY name_key
+        """, (user_id,))
+        rows = cursor.fetchall()
+        conn.close()
+        return [dict(row) for row in rows]
+
+    def delete_recipe(self, user_id: int, name: str) -> bool:
+        """Удаление рецепта по названию"""
+        recipe = self.get_recipe(user_id, name)
+        if not recipe:
+            return False
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute("DELETE FROM recipe_ingredients WHERE recipe_id = ?", (recipe['id'],))
+        cursor.execute("DELETE FROM recipes WHERE id = ?", (recipe['id'],))
+        conn.commit()
+        conn.close()
+        return True
+
+    def match(self, user_id: int, text: str) -> Optional[Dict]:
+        """Сопоставление сообщения вида "борщ мамин 350г" с рецептом пользователя.
+
+        Возвращает продукт в формате parse_with_groq (КБЖУ уже пересчитаны на количество)
+        или None, если рецепта с таким названием нет.
+        """
+        name_key, amount, unit = parse_quantity(text)
+        if not name_key:
+            return None
+        recipe = self.get_recipe(user_id, name_key)
+        if not recipe:
+            return None
+
+        if unit in ('г', 'мл') and recipe['calories_per_100g'] is not None:
+            factor = amount / 100
+            base = 'per_100g'
+        elif unit in ('г', 'мл') and recipe['portion_weight']:
+            factor = amount / recipe['portion_weight']
+            base = 'per_portion'
+        elif unit in ('г', 'мл'):
+            # Вес блюда неизвестен - граммы пересчитать не во что
+            return None
+        else:
+            # "1 порция", "2шт" или без количества - считаем порциями
+            factor = amount if amount else 1
+            base = 'per_portion'
+            if not amount:
+                amount, unit = 1, 'порция'
+
+        def scaled(key: str):
+            value = recipe[f'{key}_{base}']
+            return round(value * factor, 1) if value is not None else None
+
+        return {
+            'name': recipe['name'],
+            'amount': round(amount, 1) if amount % 1 else int(amount),
+            'unit': unit,
+            'calories': scaled('calories') or 0,
+            'proteins': scaled('proteins'),
+            'fats': scaled('fats'),
+            'carbs': scaled('carbs'),
+            'source': 'Мой рецепт'
+        }
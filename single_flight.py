@@ -0,0 +1,99 @@
+import copy
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+Listener = Callable[[Any], Awaitable[None]]
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Объединение одинаковых одновременных запросов: один вызов на ключ, результат - всем.
+
+    Пока запрос с ключом выполняется, повторные запросы с тем же ключом не идут в LLM,
+    а ждут готовый результат (каждый получает свою копию). Запрос выполняется отдельной
+    задачей, поэтому отмена одного из ожидающих не отменяет его для остальных.
+    Промежуточные результаты (notifier) получают все ожидающие, передавшие listener;
+    members(key) - участники (member) всех объединенных запросов, например для учета расхода.
+    """
+
+    def __init__(self):
+        self._in_flight: Dict[str, asyncio.Task] = {}
+        self._listeners: Dict[str, List[Listener]] = {}
+        self._progress: Dict[str, Any] = {}
+        self._members: Dict[str, List[Any]] = {}
+        self.calls = 0   # выполненных запросов
+        self.shared = 0  # запросов, получивших чужой результат (сэкономлено вызовов)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]], listener: Optional[Listener] = None,
+                 member: Any = None) -> Any:
+        """Результат func() для ключа; если такой запрос уже выполняется - ждем его.
+
+        listener получает промежуточные результаты запроса (см. notifier), пока ждет ответ;
+        присоединившийся позже сразу получает последний из них. member добавляется в members(key).
+        """
+        if member is not None:
+            self.members(key).append(member)
+        if listener is not None:
+            self._listeners.setdefault(key, []).append(listener)
+        try:
+            task = self._in_flight.get(key)
+            if task is not None:
+                self.shared += 1
+                logger.debug(f"Запрос {key!r} уже выполняется, ждем его результат")
+                if listener is not None and key in self._progress:
+                    await self._call(listener, self._progress[key])
+                return copy.deepcopy(await asyncio.shield(task))
+
+            self.calls += 1
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+            return await asyncio.shield(task)
+        finally:
+            if listener is not None:
+                listeners = self._listeners.get(key, [])
+                if listener in listeners:
+                    listeners.remove(listener)
+                if not listeners:
+                    self._listeners.pop(key, None)
+                    self._progress.pop(key, None)
+
+    def members(self, key: str) -> List[Any]:
+        """Участники выполняющегося запроса; список пополняется, пока запрос не завершен"""
+        return self._members.setdefault(key, [])
+
+    def notifier(self, key: str) -> Listener:
+        """Callback для func: передает промежуточный результат всем ожидающим ключа"""
+        async def notify(value: Any):
+            if key not in self._listeners:
+                return
+            self._progress[key] = value
+            for listener in list(self._listeners.get(key, ())):
+                await self._call(listener, copy.deepcopy(value))
+        return notify
+
+    @staticmethod
+    async def _call(listener: Listener, value: Any):
+        try:
+            await listener(value)
+        except Exception as e:
+            # Ошибка одного ожидающего не должна мешать остальным и самому запросу
+            logger.warning(f"Ошибка при передаче промежуточного результата: {e}")
+
+    def _finish(self, key: str, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+            self._members.pop(key, None)
+        # Ошибку забираем, даже если все ожидающие отменены, чтобы asyncio не ругался
+        if not task.cancelled():
+            task.exception()
+
+    def get_stats(self) -> Dict:
+        """Счетчики: выполнено запросов, объединено с уже выполняющимися, выполняется сейчас"""
+        return {
+            'calls': self.calls,
+            'shared': self.shared,
+            'in_flight': len(self._in_flight),
+        }
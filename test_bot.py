@@ -40,6 +40,22 @@ def test_imports():
         from apscheduler.schedulers.asyncio import AsyncIOScheduler
         print("   [OK] apscheduler импортирован")
         
+        # Все обработчики, зарегистрированные в main(), должны быть определены в bot.py
+        import ast
+        import inspect
+        import bot
+        tree = ast.parse(inspect.getsource(bot.main))
+        handlers = [
+            node.args[0].id for node in ast.walk(tree)
+            if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+            and node.func.attr == 'register' and node.args and isinstance(node.args[0], ast.Name)
+        ]
+        missing = [name for name in handlers if not callable(getattr(bot, name, None))]
+        if not handlers or missing:
+            print(f"   [ERROR] Не определены обработчики: {missing or 'ничего не зарегистрировано'}")
+            return False
+        print(f"   [OK] bot импортирован, все {len(handlers)} обработчиков определены")
+        
         return True
     except Exception as e:
         print(f"   [ERROR] Ошибка импорта: {e}")
@@ -80,9 +96,1295 @@ def test_database():
         print(f"   [ERROR] Ошибка базы данных: {e}")
         return False
 
+def test_meal_items():
+    """Проверка сохранения продуктов приема пищи (meal_items)"""
+    print("\n4. Проверка продуктов приема пищи...")
+    try:
+        import tempfile
+        from calorie_counter import CalorieCounter
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"))
+            items = [
+                {'name': 'Овсянка', 'amount': 200, 'unit': 'г', 'calories': 700, 'proteins': 24, 'fats': 12, 'carbs': 120},
+                {'name': 'банан', 'amount': 1, 'unit': 'шт', 'calories': 100, 'proteins': 1, 'fats': 0.3, 'carbs': 23},
+            ]
+            meal_id = counter.save_meal(1, "овсянка 200г, банан 1шт", 800, "test", 25, 12.3, 143, items)
+            saved = counter.get_meal_items(1, meal_id)
+            if len(saved) != 2:
+                print(f"   [ERROR] Ожидалось 2 продукта, получено {len(saved)}")
+                return False
+            counter.delete_meal_item(1, saved[1]['id'])
+            if counter.get_today_stats(1)['calories'] != 700:
+                print("   [ERROR] Итоги приема пищи не пересчитаны после удаления продукта")
+                return False
+            if counter.get_top_products(1)[0]['name_key'] != 'овсянка':
+                print("   [ERROR] Неверная статистика по продуктам")
+                return False
+            # Продукт без количества и нулевые жиры после пересчета
+            items = [
+                {'name': 'гречка', 'amount': None, 'unit': None, 'calories': 110, 'proteins': 4, 'fats': 0, 'carbs': 21},
+                {'name': 'масло', 'amount': 5, 'unit': 'г', 'calories': 45, 'proteins': 0, 'fats': 5, 'carbs': 0},
+            ]
+            buckwheat_id = counter.save_meal(1, "гречка, масло 5г", 155, "test", 4, 5, 21, items)
+            counter.delete_meal_item(1, counter.get_meal_items(1, buckwheat_id)[1]['id'])
+            buckwheat = next(meal for meal in counter.get_today_meals_list(1) if meal['id'] == buckwheat_id)
+            if buckwheat['meal_name'] != 'гречка' or buckwheat['fats'] != 0:
+                print(f"   [ERROR] Неверный пересчет приема пищи: {buckwheat['meal_name']}, жиры {buckwheat['fats']}")
+                return False
+            counter.delete_meal(1, meal_id)
+            if counter.get_meal_items(1, meal_id):
+                print("   [ERROR] Продукты не удалены вместе с приемом пищи")
+                return False
+        print("   [OK] Продукты сохраняются, удаляются и пересчитываются")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка при проверке продуктов: {e}")
+        return False
+
+def test_meal_search():
+    """Проверка поиска по истории и повторного добавления"""
+    print("\n5. Проверка поиска по истории...")
+    try:
+        import tempfile
+        from calorie_counter import CalorieCounter
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"))
+            item = {'name': 'овсянка', 'amount': 200, 'unit': 'г', 'calories': 700, 'proteins': 24, 'fats': 12, 'carbs': 120}
+            counter.save_meal(1, "овсянка 200г", 700, "test", 24, 12, 120, [item])
+            counter.save_meal(1, "Овсянка 200г", 700, "test", 24, 12, 120, [item])
+            counter.save_meal(2, "овсянка 100г", 350, "test", 12, 6, 60, [item])
+            found = counter.search_meals(1, "овсян")
+            if len(found) != 1 or found[0]['times'] != 2:
+                print(f"   [ERROR] Неверный результат поиска: {found}")
+                return False
+            # Поиск без FTS5 тоже не зависит от регистра кириллицы
+            counter.fts_enabled, fts_enabled = False, counter.fts_enabled
+            found_like = counter.search_meals(1, "ОВСЯН")
+            counter.fts_enabled = fts_enabled
+            if len(found_like) != 1 or found_like[0]['times'] != 2:
+                print(f"   [ERROR] Неверный результат поиска без FTS5: {found_like}")
+                return False
+            result = counter.relog_meal(1, found[0]['id'])
+            if not result['success'] or counter.get_today_stats(1)['calories'] != 2100:
+                print("   [ERROR] Прием пищи не добавлен повторно")
+                return False
+        print(f"   [OK] Поиск работает (FTS5: {counter.fts_enabled})")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка при поиске по истории: {e}")
+        return False
+
+def test_recipes():
+    """Проверка рецептов пользователя"""
+    print("\n6. Проверка рецептов...")
+    try:
+        import asyncio
+        import tempfile
+        from calorie_counter import CalorieCounter
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"))
+            ingredients = [
+                {'name': 'свекла', 'amount': 500, 'unit': 'г', 'calories': 215, 'proteins': 8, 'fats': 1, 'carbs': 48},
+                {'name': 'говядина', 'amount': 500, 'unit': 'г', 'calories': 935, 'proteins': 93, 'fats': 60, 'carbs': 0},
+            ]
+            recipe = counter.recipes.save_recipe(1, "Борщ мамин", ingredients, portions=4)
+            if recipe['calories_per_100g'] != 115.0 or recipe['portion_weight'] != 250:
+                print(f"   [ERROR] Неверный расчет рецепта: {recipe}")
+                return False
+            result = asyncio.run(counter.add_meal_from_text(1, "борщ мамин 350г"))
+            if not result['success'] or result['calories'] != 402:
+                print(f"   [ERROR] Рецепт не распознан: {result}")
+                return False
+            item = counter.recipes.match(1, "борщ мамин 2 порции")
+            if item['calories'] != 575.0:
+                print(f"   [ERROR] Неверный пересчет порций: {item}")
+                return False
+        print("   [OK] Рецепты сохраняются и пересчитываются без AI")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка при проверке рецептов: {e}")
+        return False
+
+def test_charts():
+    """Проверка отрисовки графиков в пуле процессов"""
+    print("\n7. Проверка графиков...")
+    try:
+        import asyncio
+        from datetime import date, timedelta
+        from charts import build_day_labels, data_version, render_chart, render_nutrition_chart, shutdown_executor
+        days = [{'date': date.today() - timedelta(days=i), 'calories': 1800 + i * 50,
+                 'proteins': 90, 'fats': 60, 'carbs': 200} for i in range(7)]
+        payload = {'title': 'Калории за неделю', 'limit': 2000, 'days': build_day_labels(days)}
+        png = asyncio.run(render_chart(render_nutrition_chart, payload))
+        shutdown_executor()
+        if not png.startswith(b'\x89PNG'):
+            print("   [ERROR] График не является PNG")
+            return False
+        if data_version(payload) != data_version(dict(payload)):
+            print("   [ERROR] Версия данных нестабильна")
+            return False
+
+        # Группа за сегодня: первый сделал 50 отжиманий из нормы, второй ничего, третий только записался
+        import tempfile
+        from database import Database
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db = Database(os.path.join(tmp_dir, "test.db"))
+            for user_id in (1, 2):
+                db.add_pushups(user_id, f"user{user_id}", 80, -100, norm=80)
+                db.add_abs(user_id, f"user{user_id}", 80, -100, norm=80)
+            db.add_pushups(1, "user1", -50, -100)
+            db.add_pushups(3, "user3", 0, -100)
+            db.add_abs(3, "user3", 0, -100)
+            today_totals = db.get_chat_daily_totals(-100, days=3)[-1]
+        if (today_totals['pushups'], today_totals['abs']) != (50, 0):
+            print(f"   [ERROR] Неверные итоги группы за день: {today_totals}")
+            return False
+        print(f"   [OK] График отрисован ({len(png)} байт)")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка при отрисовке графика: {e}")
+        return False
+
+def test_export():
+    """Проверка потоковой выгрузки данных"""
+    print("\n8. Проверка выгрузки данных...")
+    try:
+        import csv
+        import gzip
+        import json
+        import tempfile
+        from calorie_counter import CalorieCounter
+        from database import Database
+        from exporter import export_table, export_user_data
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "test.db")
+            Database(db_path)
+            counter = CalorieCounter(db_path=db_path)
+            for i in range(300):
+                counter.save_meal(1, f"прием пищи номер {i}", 100 + i, "test", 1, 1, 1,
+                                  [{'name': f'продукт {i}', 'amount': 100, 'unit': 'г', 'calories': 100 + i}])
+            counter.save_meal(2, "чужой прием пищи", 500, "test", 1, 1, 1, [])
+
+            # Маленький размер части, чтобы проверить разбиение
+            paths = export_table(db_path, 'meals', 'csv', os.path.join(tmp_dir, "csv"), user_id=1, chunk_bytes=2048)
+            rows = []
+            for path in paths:
+                with gzip.open(path, 'rt', encoding='utf-8', newline='') as f:
+                    rows.extend(list(csv.DictReader(f)))
+            if len(paths) < 2 or len(rows) != 300:
+                print(f"   [ERROR] CSV: частей {len(paths)}, строк {len(rows)} (ожидалось 300)")
+                return False
+
+            files = export_user_data(db_path, 1, 'jsonl', os.path.join(tmp_dir, "jsonl"))
+            with gzip.open(files['meal_items'][0], 'rt', encoding='utf-8') as f:
+                items = [json.loads(line) for line in f]
+            if len(items) != 300 or items[0]['name'] != 'продукт 0':
+                print("   [ERROR] JSONL: неверное содержимое выгрузки продуктов")
+                return False
+
+            # Parquet: штрихкод пуст во всей первой пачке, схема не должна зависеть от нее
+            try:
+                import pyarrow.parquet as pq
+            except ImportError:
+                print("   [WARN] pyarrow не установлен, пропускаем проверку Parquet")
+            else:
+                from exporter import EXPORT_TABLES, export_parquet
+                columns = EXPORT_TABLES['meal_items']
+                rows = []
+                for i in range(5):
+                    row = dict.fromkeys(columns)
+                    row.update(id=i + 1, meal_id=1, user_id=1, name=f'продукт {i}', date='2026-01-01', calories=100.0,
+                               barcode='4600000000000' if i >= 2 else None)
+                    rows.append(tuple(row[column] for column in columns))
+                path = export_parquet(iter(rows), columns, os.path.join(tmp_dir, "items"), batch_size=2)[0]
+                table = pq.read_table(path)
+                if table.num_rows != 5 or str(table.schema.field('barcode').type) != 'string':
+                    print(f"   [ERROR] Parquet: строк {table.num_rows}, тип штрихкода {table.schema.field('barcode').type}")
+                    return False
+        print(f"   [OK] Выгрузка работает (CSV в {len(paths)} частях, JSONL)")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка при выгрузке: {e}")
+        return False
+
+def test_analytics():
+    """Проверка аналитики тренировок (серии, средние, выполнение нормы)"""
+    print("\n9. Проверка аналитики тренировок...")
+    try:
+        from datetime import date, timedelta
+        from analytics import build_series, compute_metrics, rolling_mean
+        today = date.today()
+        # Остатки нормы: 0 - норма выполнена, 80 - ничего не сделано, 30 - сделано 50;
+        # 5 дней назад - только регистрация (запись с нулем без утренней нормы)
+        balances = [(9, 0, 0, 80), (8, 80, 80, 80), (5, 0, 0, 0), (3, 0, 0, 80), (2, 30, 0, 80), (1, 0, 0, 80)]
+        rows = [{'user_id': 1, 'date': (today - timedelta(days=ago)).isoformat(), 'pushups': p, 'abs': a,
+                 'norm_pushups': norm, 'norm_abs': norm} for ago, p, a, norm in balances]
+        series = build_series(rows, today=today)[1]
+        metrics = compute_metrics(series)
+        if len(series) != 10 or metrics['current_streak'] != 3 or metrics['longest_streak'] != 3:
+            print(f"   [ERROR] Неверные серии: {metrics['current_streak']}/{metrics['longest_streak']}")
+            return False
+        if abs(metrics['completion_rate'] - 30) > 1e-9 or metrics['best_day'] != today - timedelta(days=9):
+            print("   [ERROR] Неверные выполнение нормы или лучший день")
+            return False
+        if list(rolling_mean(series.pushups[-3:], 2)) != [50.0, 65.0, 40.0]:
+            print("   [ERROR] Неверное скользящее среднее")
+            return False
+        print(f"   [OK] Серия {metrics['current_streak']}, норма выполнена в {metrics['completion_rate']:.0f}% дней")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в аналитике: {e}")
+        return False
+
+def test_llm_client():
+    """Проверка, что ожидание ответа LLM не блокирует цикл событий, а таймаут отменяет запрос"""
+    print("\n10. Проверка асинхронного LLM клиента...")
+    try:
+        import asyncio
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+
+        cancelled = []
+
+        async def slow_create(**kwargs):
+            # Медленная модель: отвечает через 0.5 с
+            try:
+                await asyncio.sleep(0.5)
+            except asyncio.CancelledError:
+                cancelled.append(kwargs['model'])
+                raise
+            message = SimpleNamespace(content=" yes ")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=slow_create)))
+        client = LLMClient(client=fake)
+
+        async def scenario():
+            ticks = 0
+
+            async def ticker():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            ticker_task = asyncio.create_task(ticker())
+            result = await client.complete([{"role": "user", "content": "test"}])
+            ticker_task.cancel()
+            try:
+                await client.complete([{"role": "user", "content": "test"}], model="slow", timeout=0.05)
+                timed_out = False
+            except asyncio.TimeoutError:
+                timed_out = True
+            return result, ticks, timed_out
+
+        result, ticks, timed_out = asyncio.run(scenario())
+        if result['text'] != 'yes' or ticks < 20:
+            print(f"   [ERROR] Цикл событий заблокирован во время запроса (тиков: {ticks})")
+            return False
+        if not timed_out or cancelled != ['slow']:
+            print("   [ERROR] Запрос не отменен по таймауту")
+            return False
+        print(f"   [OK] Во время запроса цикл событий работал ({ticks} тиков), таймаут отменяет запрос")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в LLM клиенте: {e}")
+        return False
+
+def test_parse_cache():
+    """Проверка кэша разбора еды: повторный запрос не уходит в LLM"""
+    print("\n11. Проверка кэша разбора еды...")
+    try:
+        import asyncio
+        import tempfile
+        from types import SimpleNamespace
+        from calorie_counter import CalorieCounter, PARSE_CACHE_VERSION
+        from llm_client import LLMClient
+        from parse_cache import ParseCache
+
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs['model'])
+            content = '[{"name": "овсянка", "amount": 200, "unit": "г", "calories": 700, "proteins": 24, "fats": 12, "carbs": 120}]'
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "test.db")
+            counter = CalorieCounter(db_path=db_path, llm_client=LLMClient(client=fake))
+            first = asyncio.run(counter.parse_with_groq("Овсянка 200 г"))
+            second = asyncio.run(counter.parse_with_groq("овсянка  200г"))
+            if len(calls) != 1 or first != second:
+                print(f"   [ERROR] Повторный запрос ушел в LLM (вызовов: {len(calls)})")
+                return False
+
+            # Новый экземпляр читает из SQLite; другая версия промпта - промах
+            cache = ParseCache(db_path)
+            if cache.get("овсянка 200 гр", PARSE_CACHE_VERSION) != first:
+                print("   [ERROR] Результат не сохранен в базе")
+                return False
+            stats = counter.parse_cache.get_stats()
+            if stats['memory_hits'] != 1 or stats['misses'] != 1 or stats['entries'] != 1:
+                print(f"   [ERROR] Неверная статистика кэша: {stats}")
+                return False
+            if cache.get("ОВСЯНКА 200г", "другая версия") is not None:
+                print("   [ERROR] Версия промпта не учитывается в ключе")
+                return False
+            if cache.purge(expired_only=False) != 1 or cache.get_stats()['entries'] != 0:
+                print("   [ERROR] Кэш не очищен")
+                return False
+        print(f"   [OK] Повтор взят из кэша (hit rate {stats['hit_rate']:.0f}%)")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в кэше разбора: {e}")
+        return False
+
+def test_product_kb():
+    """Проверка базы продуктов: известные продукты пересчитываются без Groq"""
+    print("\n12. Проверка базы продуктов...")
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from calorie_counter import CalorieCounter
+        from llm_client import LLMClient
+
+        products = {
+            'гречка по-купечески': {'name': 'гречка по-купечески', 'amount': 150, 'unit': 'г', 'calories': 165, 'proteins': 6, 'fats': 1.5, 'carbs': 30},
+            'курица терияки': {'name': 'курица терияки', 'amount': 200, 'unit': 'г', 'calories': 330, 'proteins': 62, 'fats': 7, 'carbs': 0},
+        }
+        requests = []
+
+        async def create(**kwargs):
+            user_text = kwargs['messages'][-1]['content'].split("'")[1]
+            requests.append(user_text)
+            items = [item for name, item in products.items() if name in user_text]
+            message = SimpleNamespace(content=json.dumps(items, ensure_ascii=False))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"), llm_client=LLMClient(client=fake))
+            asyncio.run(counter.add_meal_from_text(1, "гречка по-купечески 150г"))
+            scaled = asyncio.run(counter.add_meal_from_text(1, "гречка по-купечески 200г"))
+            if requests != ["гречка по-купечески 150г"] or scaled['calories'] != 220:
+                print(f"   [ERROR] Известный продукт не пересчитан локально: {requests}, {scaled.get('calories')}")
+                return False
+            mixed = asyncio.run(counter.add_meal_from_text(1, "гречка по-купечески 100г, курица терияки 200г"))
+            if requests[-1] != "курица терияки 200г" or mixed['calories'] != 110 + 330:
+                print(f"   [ERROR] В Groq ушли известные продукты: {requests[-1]}")
+                return False
+        print(f"   [OK] Запросов к Groq: {len(requests)} на 3 сообщения")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в базе продуктов: {e}")
+        return False
+
+def test_nutrition_table():
+    """Проверка встроенной таблицы КБЖУ: типичные продукты считаются без Groq"""
+    print("\n13. Проверка таблицы КБЖУ...")
+    try:
+        import asyncio
+        import tempfile
+        from calorie_counter import CalorieCounter
+        from food_text import parse_quantity
+        from nutrition_table import get_nutrition_table
+
+        table = get_nutrition_table()
+        checks = [
+            ("гречки 200г", 220),
+            ("чизбургер из Rostics 1 порция", 240),
+            ("чизбургер 1шт", 300),
+        ]
+        for text, expected in checks:
+            item = table.lookup(*parse_quantity(text))
+            if not item or item['calories'] != expected:
+                print(f"   [ERROR] '{text}': ожидалось {expected} ккал, получено {item and item['calories']}")
+                return False
+        eggs = table.lookup(*parse_quantity("2 яйца"))
+        if not eggs or eggs['unit'] != 'шт' or eggs['amount'] != 2:
+            print(f"   [ERROR] Штуки не пересчитаны через вес: {eggs}")
+            return False
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"))
+            result = asyncio.run(counter.add_meal_from_text(1, "овсянка 60г, банан, 2 яйца"))
+            if not result.get('success') or len(result.get('items', [])) != 3:
+                print(f"   [ERROR] Прием пищи не посчитан без Groq: {result}")
+                return False
+        print(f"   [OK] Продуктов в таблице: {table.products}, названий: {len(table.index)}")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в таблице КБЖУ: {e}")
+        return False
+
+def test_fuzzy_index():
+    """Проверка индекса опечаток: названия исправляются до запроса к Groq"""
+    print("\n14. Проверка исправления опечаток...")
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from calorie_counter import CalorieCounter
+        from fuzzy_index import FuzzyIndex, edit_distance
+        from llm_client import LLMClient
+
+        index = FuzzyIndex(["Корнишон", "куриная грудка"])
+        checks = [
+            ("корнешон 5шт", "корнишон 5шт"),
+            ("куриная грутка 150г", "куриная грудка 150г"),
+            ("куринаая грудка", "куриная грудка"),
+            ("корнишоны 3шт", "корнишоны 3шт"),
+        ]
+        for text, expected in checks:
+            if index.correct_text(text) != expected:
+                print(f"   [ERROR] '{text}' -> '{index.correct_text(text)}', ожидалось '{expected}'")
+                return False
+        if edit_distance("грудка", "грдука", 2) != 1 or edit_distance("сыр", "шоколад", 2) != 3:
+            print("   [ERROR] Неверное расстояние между словами")
+            return False
+
+        prompts = []
+
+        async def create(**kwargs):
+            prompts.append(kwargs['messages'][-1]['content'])
+            item = {'name': 'курица терияки', 'amount': 200, 'unit': 'г', 'calories': 330, 'proteins': 62, 'fats': 7, 'carbs': 0}
+            message = SimpleNamespace(content=json.dumps([item], ensure_ascii=False))
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"), llm_client=LLMClient(client=fake))
+            local = asyncio.run(counter.add_meal_from_text(1, "куриная грутка 150г"))
+            if prompts or not local.get('success'):
+                print(f"   [ERROR] Продукт с опечаткой не найден в таблице: {local}")
+                return False
+            counter.fuzzy_index.add_name("терияки")
+            asyncio.run(counter.add_meal_from_text(1, "курица терьяки 200г"))
+            if len(prompts) != 1 or "'курица терияки 200г'" not in prompts[0] or "корнешон" in prompts[0]:
+                print("   [ERROR] В Groq ушло неисправленное название или полный промпт")
+                return False
+        print(f"   [OK] Опечатки исправлены, слов в индексе: {len(counter.fuzzy_index.words)}")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в индексе опечаток: {e}")
+        return False
+
+def test_model_router():
+    """Проверка роутера моделей: сбойная модель отключается и проверяется пробным запросом"""
+    print("\n15. Проверка роутера моделей...")
+    try:
+        import asyncio
+        import tempfile
+        from types import SimpleNamespace
+        from calorie_counter import CalorieCounter
+        from llm_client import LLMClient
+        from model_router import ModelRouter, COOLDOWN
+        from motivator import Motivator
+
+        router = ModelRouter(routes={'test': (['slow', 'fast'], [])})
+        router.record_success('slow', 0.5)
+        router.record_success('fast', 0.1)
+        if router.route('test') != ['fast', 'slow']:
+            print(f"   [ERROR] Выбрана не самая быстрая модель: {router.route('test')}")
+            return False
+
+        calls = []
+        broken = {"llama-3.3-70b-versatile"}
+
+        async def create(**kwargs):
+            calls.append(kwargs['model'])
+            if kwargs['model'] in broken:
+                raise RuntimeError("model_decommissioned")
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=None)
+
+        now = [1000.0]
+        client = LLMClient(client=SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+        client.router.clock = lambda: now[0]
+        messages = [{"role": "user", "content": "test"}]
+
+        for _ in range(5):
+            asyncio.run(client.complete_first(messages, request_class='parse'))
+        if calls.count("llama-3.3-70b-versatile") != 3:
+            print(f"   [ERROR] Отключенная модель продолжает получать запросы: {calls}")
+            return False
+
+        # После паузы - один пробный запрос; модель починилась и снова в работе
+        now[0] += COOLDOWN
+        broken.clear()
+        calls.clear()
+        asyncio.run(client.complete_first(messages, request_class='parse'))
+        if calls != ["llama-3.3-70b-versatile"] or client.router.health[calls[0]].state != 'closed':
+            print(f"   [ERROR] Пробный запрос не вернул модель: {calls}")
+            return False
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            motivator = Motivator(llm_client=client, db_path=os.path.join(tmp_dir, "test.db"))
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"), llm_client=client)
+            if motivator.client.router is not counter.llm_client.router:
+                print("   [ERROR] Статистика моделей не общая")
+                return False
+        print(f"   [OK] Сбойная модель отключена после 3 ошибок, моделей в статистике: {len(client.router.get_stats())}")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в роутере моделей: {e}")
+        return False
+
+def test_structured_parse():
+    """Проверка разбора одним запросом: проверка на еду и продукты в одном JSON-ответе"""
+    print("\n16. Проверка разбора одним запросом...")
+    try:
+        import asyncio
+        import tempfile
+        from types import SimpleNamespace
+        from calorie_counter import CalorieCounter
+        from food_schema import validate_food_response
+        from llm_client import LLMClient
+
+        is_food, items = validate_food_response({
+            'is_food': True,
+            'items': [{'name': 'творог', 'amount': '200', 'unit': 'г', 'calories': 242.0, 'proteins': 34, 'fats': 10, 'carbs': 6},
+                      {'name': 'без калорий', 'amount': 1, 'unit': 'шт'}]
+        })
+        if not is_food or len(items) != 1 or items[0]['amount'] != 200 or items[0]['source'] != 'Groq AI':
+            print(f"   [ERROR] Неверная проверка схемы: {items}")
+            return False
+
+        calls = []
+        answers = {
+            'привет': '{"is_food": false, "items": []}',
+            'ням ням': '{"is_food": true, "items": "сломанный ответ"}',
+        }
+
+        async def create(**kwargs):
+            calls.append(kwargs.get('response_format'))
+            user_text = kwargs['messages'][-1]['content'].split("'")[1]
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=answers[user_text]))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(db_path=os.path.join(tmp_dir, "test.db"), llm_client=LLMClient(client=fake))
+            greeting = asyncio.run(counter.add_meal_from_text(1, "привет"))
+            if len(calls) != 1 or greeting['success'] or 'не похоже на описание еды' not in greeting['message']:
+                print(f"   [ERROR] Неочевидный текст стоил {len(calls)} запросов: {greeting}")
+                return False
+            if calls[0] != {"type": "json_object"}:
+                print("   [ERROR] Запрос отправлен не в JSON-режиме")
+                return False
+            broken = asyncio.run(counter.add_meal_from_text(1, "ням ням"))
+            if len(calls) != 2 or broken['success']:
+                print(f"   [ERROR] Ответ не по схеме повторялся или принят (запросов: {len(calls)})")
+                return False
+        print("   [OK] Проверка на еду и разбор - один запрос, ответ не по схеме не повторяется")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в разборе одним запросом: {e}")
+        return False
+
+def test_prompts():
+    """Проверка реестра промптов: компактная версия, подбор примеров, учет токенов по версиям"""
+    print("\n17. Проверка реестра промптов...")
+    try:
+        import asyncio
+        import tempfile
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from llm_usage import UsageLog
+        from prompts import PROMPTS, get_prompt
+
+        text = "чизбургер из Rostics 1 порция"
+        compact = get_prompt('parse', text)
+        messages = compact.render(text)
+        full_messages = PROMPTS['parse-full-2'].render(text)
+        size = sum(len(m['content']) for m in messages)
+        full_size = sum(len(m['content']) for m in full_messages)
+        if compact.version != 'parse-compact-1' or size * 4 > full_size:
+            print(f"   [ERROR] Компактный промпт не меньше подробного: {size} / {full_size} символов")
+            return False
+        if '"чизбургер из Rostics 1 порция" ->' not in messages[1]['content']:
+            print("   [ERROR] Не подобран пример под сообщение")
+            return False
+
+        old_env = os.environ.get('PROMPT_PARSE')
+        os.environ['PROMPT_PARSE'] = 'parse-compact-1,parse-full-2'
+        try:
+            chosen = {get_prompt('parse', f"продукт {i} 100г").version for i in range(20)}
+            stable = get_prompt('parse', "Овсянка 200 г").version == get_prompt('parse', "овсянка 200г").version
+        finally:
+            if old_env is None:
+                del os.environ['PROMPT_PARSE']
+            else:
+                os.environ['PROMPT_PARSE'] = old_env
+        if len(chosen) != 2 or not stable:
+            print(f"   [ERROR] A/B распределение версий не работает: {chosen}, стабильно: {stable}")
+            return False
+
+        async def create(**kwargs):
+            usage = SimpleNamespace(prompt_tokens=420, completion_tokens=35)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=usage)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            client = LLMClient(client=fake, usage=UsageLog(os.path.join(tmp_dir, "test.db")))
+            for _ in range(2):
+                asyncio.run(client.complete(messages, prompt_version=compact.version))
+            stats = client.usage.get_stats()
+        if len(stats) != 1 or stats[0]['requests'] != 2 or stats[0]['avg_prompt_tokens'] != 420:
+            print(f"   [ERROR] Неверный учет токенов: {stats}")
+            return False
+        print(f"   [OK] Компактный промпт: {size} символов против {full_size}, токены учтены по версии")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в реестре промптов: {e}")
+        return False
+
+def test_single_flight():
+    """Проверка объединения одинаковых одновременных запросов к LLM"""
+    print("\n18. Проверка объединения одинаковых запросов...")
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from calorie_counter import CalorieCounter
+
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs['messages'][-1]['content'])
+            await asyncio.sleep(0.05)
+            content = json.dumps({"is_food": True, "items": [
+                {"name": "плов с бараниной", "amount": 300, "unit": "г", "calories": 540,
+                 "proteins": 21, "fats": 27, "carbs": 54, "source": "USDA"}
+            ]})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+        async def run(counter):
+            texts = ["плов с бараниной 300г", "Плов с бараниной 300 г"] * 3
+            return await asyncio.gather(*(counter.parse_with_groq(text) for text in texts))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(os.path.join(tmp_dir, "test.db"), llm_client=LLMClient(client=fake))
+            results = asyncio.run(run(counter))
+            stats = counter.single_flight.get_stats()
+
+        if len(calls) != 1:
+            print(f"   [ERROR] Ожидался 1 запрос к LLM, отправлено {len(calls)}")
+            return False
+        if any(result != results[0] for result in results) or results[0]['calories'] != 540:
+            print(f"   [ERROR] Ожидающие получили разные результаты: {results}")
+            return False
+        results[1]['items'].clear()
+        if not results[0]['items']:
+            print("   [ERROR] Ожидающие получили общий объект вместо копии")
+            return False
+        if stats != {'calls': 1, 'shared': 5, 'in_flight': 0}:
+            print(f"   [ERROR] Неверные счетчики: {stats}")
+            return False
+
+        # Продукты по мере потокового ответа видит и тот, кто ждет чужой запрос
+        from llm_providers import STUB, stub_provider
+        seen = {1: [], 2: []}
+
+        async def stream(counter):
+            async def progress(user_id, items):
+                seen[user_id].append(len(items))
+
+            return await asyncio.gather(*(
+                counter.parse_with_groq("плов с бараниной 300г", user_id=user_id,
+                                        progress_callback=lambda items, user_id=user_id: progress(user_id, items))
+                for user_id in seen
+            ))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            client = LLMClient(providers={STUB: stub_provider(latency=0.05, tokens_per_second=2000)},
+                               default_provider=STUB)
+            counter = CalorieCounter(os.path.join(tmp_dir, "test.db"), llm_client=client)
+            asyncio.run(stream(counter))
+            stream_calls = len(client.provider.client.calls)
+        if stream_calls != 1 or any(not counts or counts[-1] != 1 for counts in seen.values()):
+            print(f"   [ERROR] Промежуточные продукты получил не каждый ожидающий: {seen}, запросов {stream_calls}")
+            return False
+        print(f"   [OK] 6 одинаковых запросов - 1 вызов LLM, сэкономлено {stats['shared']}")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка при объединении запросов: {e}")
+        return False
+
+def test_llm_limiter():
+    """Проверка ограничителя запросов к LLM: приоритет очередей, лимиты Groq, число одновременных"""
+    print("\n19. Проверка ограничителя запросов к LLM...")
+    try:
+        import asyncio
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from llm_limiter import LLMLimiter, INTERACTIVE, BACKGROUND, parse_reset
+
+        async def priorities():
+            limiter = LLMLimiter(max_concurrent=1, requests_per_minute=600)
+            order = []
+
+            async def request(name, lane):
+                await limiter.acquire(lane)
+                order.append(name)
+                await asyncio.sleep(0.01)
+                limiter.release()
+
+            await limiter.acquire(INTERACTIVE)
+            tasks = [asyncio.create_task(request(name, lane)) for name, lane in
+                     [("мотивация 1", BACKGROUND), ("мотивация 2", BACKGROUND),
+                      ("еда 1", INTERACTIVE), ("еда 2", INTERACTIVE)]]
+            await asyncio.sleep(0.01)
+            depth = limiter.queue_depth()
+            limiter.release()
+            await asyncio.gather(*tasks)
+            return order, depth, limiter.get_stats()
+
+        order, depth, stats = asyncio.run(priorities())
+        if order != ["еда 1", "еда 2", "мотивация 1", "мотивация 2"] or depth != 4:
+            print(f"   [ERROR] Неверный порядок очередей: {order}, глубина {depth}")
+            return False
+        if stats['lanes']['background']['max_wait'] <= stats['lanes']['interactive']['avg_wait']:
+            print(f"   [ERROR] Неверные метрики ожидания: {stats['lanes']}")
+            return False
+
+        limiter = LLMLimiter()
+        limiter.update_from_headers({'x-ratelimit-remaining-tokens': '200', 'x-ratelimit-reset-tokens': '7.66s'})
+        if limiter._delay(BACKGROUND, limiter.clock()) < 7 or limiter._delay(INTERACTIVE, limiter.clock()) != 0:
+            print("   [ERROR] Нехватка токенов должна останавливать только фоновые запросы")
+            return False
+        limiter.update_from_headers({'retry-after': '3'})
+        if limiter._delay(INTERACTIVE, limiter.clock()) < 2 or parse_reset("2m59.56s") != 179.56:
+            print("   [ERROR] Не учтены заголовки retry-after / x-ratelimit-reset")
+            return False
+
+        running = {'now': 0, 'max': 0}
+
+        async def create(**kwargs):
+            running['now'] += 1
+            running['max'] = max(running['max'], running['now'])
+            await asyncio.sleep(0.02)
+            running['now'] -= 1
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content="ok"))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        client = LLMClient(client=fake, limiter=LLMLimiter(max_concurrent=2, requests_per_minute=600))
+
+        async def burst():
+            messages = [{"role": "user", "content": "test"}]
+            await asyncio.gather(*(client.complete(messages, request_class=request_class)
+                                   for request_class in ['parse', 'motivation'] * 4))
+
+        asyncio.run(burst())
+        if running['max'] != 2 or client.limiter.active != 0:
+            print(f"   [ERROR] Одновременных запросов: {running['max']} (ожидалось 2)")
+            return False
+        print("   [OK] Интерактивные запросы идут первыми, лимиты Groq и число одновременных соблюдаются")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в ограничителе запросов: {e}")
+        return False
+
+def test_streaming_parse():
+    """Проверка потокового разбора: продукты видны до конца ответа, сохранение - после"""
+    print("\n20. Проверка потокового разбора еды...")
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from calorie_counter import CalorieCounter
+        from food_stream import ItemStreamParser
+
+        answer = json.dumps({"is_food": True, "items": [
+            {"name": "плов с бараниной", "amount": 300, "unit": "г", "calories": 540,
+             "proteins": 21, "fats": 27, "carbs": 54, "source": "USDA"},
+            {"name": "лепешка тандырная", "amount": 1, "unit": "шт", "calories": 260,
+             "proteins": 8, "fats": 3, "carbs": 50, "source": "USDA"},
+        ]}, ensure_ascii=False)
+        requests = []
+
+        async def chunks():
+            for start in range(0, len(answer), 16):
+                await asyncio.sleep(0)
+                delta = SimpleNamespace(content=answer[start:start + 16])
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=delta)])
+
+        async def create(**kwargs):
+            requests.append(kwargs)
+            return chunks()
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        progress = []
+
+        async def on_progress(items):
+            progress.append([item['name'] for item in items])
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(os.path.join(tmp_dir, "test.db"), llm_client=LLMClient(client=fake))
+            result = asyncio.run(counter.add_meal_from_text(1, "плов с бараниной и лепешка", progress_callback=on_progress))
+            meals = counter.get_today_meals_list(1)
+
+        if not requests or not requests[0].get('stream'):
+            print("   [ERROR] Запрос к LLM отправлен не потоком")
+            return False
+        if progress != [[], ["плов с бараниной"], ["плов с бараниной", "лепешка тандырная"]]:
+            print(f"   [ERROR] Неверный ход разбора: {progress}")
+            return False
+        if not result['success'] or result['calories'] != 800 or len(meals) != 1:
+            print(f"   [ERROR] Прием пищи не сохранен после конца потока: {result}")
+            return False
+
+        parser = ItemStreamParser()
+        parser.feed('{"items": [{"name": "x", "amount": 1, "unit": "г", "calories": 5, "proteins": 1, "fats": 0, "carbs": 0}')
+        parser.feed('{"it')  # повтор запроса на другой модели - разбор заново
+        if parser.items:
+            print("   [ERROR] Разбор не начался заново после повтора запроса")
+            return False
+        print("   [OK] Продукты показываются по мере ответа, прием пищи сохраняется в конце")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка потокового разбора: {e}")
+        return False
+
+def test_motivation_pool():
+    """Проверка пула мотивации: несколько пар за запрос, повторы, рассылка без обращения к LLM"""
+    print("\n21. Проверка пула мотивации...")
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from motivator import Motivator
+
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            if kwargs.get('response_format') and not broken:
+                # Ответ начинается с последней пары предыдущего - повтор в пул не попадает
+                first = 4 * (len(calls) - 1)
+                content = json.dumps({"pairs": [{"fact": f"Факт {n}.", "tip": f"Совет {n}."}
+                                                for n in range(first, first + 5)]}, ensure_ascii=False)
+            else:
+                content = "не JSON" if kwargs.get('response_format') else "Отдельный ответ."
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        broken = False
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            motivator = Motivator(llm_client=LLMClient(client=fake), db_path=os.path.join(tmp_dir, "test.db"))
+            added = asyncio.run(motivator.refill_pool(target=6, pause=0))
+            size = motivator.pool.size()
+            requests = len(calls)
+            pairs = [motivator.get_motivational_content() for _ in range(7)]
+            duplicate = motivator.pool.add(pairs[0][0], "Совсем другой совет")
+
+            broken = True
+            calls.clear()
+            fallback = asyncio.run(motivator.generate_motivational_content())
+
+        if added != 6 or size != 6 or requests != 3:
+            print(f"   [ERROR] Пул пополнен на {added} (в запасе {size}) за {requests} запросов, ожидалось 6 за 3")
+            return False
+        if len({fact for fact, _ in pairs[:6]}) != 6 or pairs[6][0] not in motivator.fallback_facts:
+            print(f"   [ERROR] Неверные пары из пула: {pairs}")
+            return False
+        if duplicate:
+            print("   [ERROR] Недавно отправленный факт добавлен в пул повторно")
+            return False
+        if fallback != ("Отдельный ответ.", "Отдельный ответ.") or len(calls) != 3:
+            print(f"   [ERROR] Ответ не по схеме не заменен отдельными запросами: {fallback}")
+            return False
+        print(f"   [OK] Пул пополнен на {added} пар за {requests} запроса, рассылка берет их без LLM")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в пуле мотивации: {e}")
+        return False
+
+def test_personal_motivation():
+    """Проверка персональной мотивации: сводки групп и несколько групп в одном запросе"""
+    print("\n22. Проверка персональной мотивации...")
+    try:
+        import asyncio
+        import json
+        import re
+        import tempfile
+        import time
+        from datetime import date, timedelta
+        from types import SimpleNamespace
+        from analytics import get_chat_summary
+        from llm_client import LLMClient
+        from motivator import Motivator, format_chat_summary
+
+        today = date.today()
+        rows = [{'user_id': user_id, 'date': (today - timedelta(days=ago)).isoformat(), 'pushups': p, 'abs': a,
+                 'norm_pushups': 80, 'norm_abs': 80} for user_id, ago, p, a in [(1, 3, 0, 0), (1, 2, 0, 0), (1, 1, 0, 0), (2, 1, 40, 80)]]
+        summary = get_chat_summary(SimpleNamespace(get_daily_balances=lambda chat_id: rows), -100, today=today)
+        if (summary['participants'], summary['yesterday_done'], summary['best_streak']) != (2, 1, 3):
+            print(f"   [ERROR] Неверная сводка группы: {summary}")
+            return False
+
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            groups = re.findall(r'^(\d+): (.+)$', kwargs['messages'][-1]['content'], re.MULTILINE)
+            # Для последней группы запроса модель ответа не дала
+            messages = [{"group": int(number), "fact": f"Факт: {text}", "tip": "Совет."} for number, text in groups[:-1]]
+            content = json.dumps({"messages": messages}, ensure_ascii=False)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        summaries = {-1000 - i: f"{format_chat_summary(summary)}, группа {i}" for i in range(20)}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            motivator = Motivator(llm_client=LLMClient(client=fake), db_path=os.path.join(tmp_dir, "test.db"))
+            contents = asyncio.run(motivator.generate_for_chats(summaries, batch_size=8))
+
+            # Рассылка не ждет медленную модель дольше timeout; отправленное не повторяется
+            async def slow_create(**kwargs):
+                await asyncio.sleep(5)
+
+            motivator.client = LLMClient(client=SimpleNamespace(chat=SimpleNamespace(
+                completions=SimpleNamespace(create=slow_create))))
+            started = time.perf_counter()
+            late = asyncio.run(motivator.generate_for_chats(summaries, batch_size=8, timeout=0.2))
+            waited = time.perf_counter() - started
+            fact, tip = contents[-1000]
+            repeats = (motivator.pool.mark_sent(fact, tip), motivator.pool.mark_sent(fact, "Другой совет."))
+
+        if late or waited > 1:
+            print(f"   [ERROR] Персональная мотивация ждала медленную модель {waited:.1f} с")
+            return False
+        if repeats != (True, False):
+            print(f"   [ERROR] Повтор отправленной мотивации не распознан: {repeats}")
+            return False
+        if len(calls) != 3 or len(contents) != 17:
+            print(f"   [ERROR] {len(calls)} запросов и {len(contents)} сообщений, ожидалось 3 и 17")
+            return False
+        if any(contents[chat_id][0] != f"Факт: {summaries[chat_id]}" for chat_id in contents):
+            print("   [ERROR] Сообщения перепутаны между группами")
+            return False
+        print(f"   [OK] 20 групп - {len(calls)} запроса, сводка: {format_chat_summary(summary)}")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в персональной мотивации: {e}")
+        return False
+
+def test_food_classifier():
+    """Проверка общего классификатора "это еда?" (ключевые слова, количество, стоп-слова)"""
+    print("\n23. Проверка классификатора сообщений о еде...")
+    try:
+        import tempfile
+        from calorie_counter import CalorieCounter
+        from food_classifier import classify_food_text
+
+        cases = {
+            "Пельмени 250гр": True,
+            "2 штуки чикен бургер": True,
+            "привет": None,
+            "ну ты и дурак": False,
+        }
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(os.path.join(tmp_dir, "test.db"))
+            for text, expected in cases.items():
+                if classify_food_text(text).is_food is not expected or counter.classify_locally(text) is not expected:
+                    print(f"   [ERROR] '{text}': {classify_food_text(text)}, ожидалось {expected}")
+                    return False
+
+        features = classify_food_text("Пельмени 250гр и чикенбургер")
+        if not features.has_quantity or not {'пельмен', 'чикенбургер'} <= set(features.keywords):
+            print(f"   [ERROR] Неверные признаки: {features}")
+            return False
+        print(f"   [OK] Признаки за один проход: {', '.join(features.keywords)}")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в классификаторе: {e}")
+        return False
+
+def test_parse_batching():
+    """Проверка пакетного разбора сообщений разных пользователей"""
+    print("\n24. Проверка пакетного разбора...")
+    try:
+        import re
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from calorie_counter import CalorieCounter
+
+        calls = []
+
+        def answer_for(text):
+            grams = int(re.search(r'(\d+)', text).group(1))
+            return {"is_food": True, "items": [{"name": text.split()[0], "amount": grams, "unit": "г",
+                                                "calories": grams, "proteins": 0, "fats": 0, "carbs": grams / 4}]}
+
+        async def create(**kwargs):
+            content = kwargs['messages'][-1]['content']
+            await asyncio.sleep(0.01)
+            if '"results"' in content:
+                calls.append('batch')
+                lines = re.findall(r'^(\d+): (.+)$', content.split('\n\n')[0], re.MULTILINE)
+                # Ответ на второе сообщение потерян, в ответе на третье нет валидных продуктов -
+                # оба должны повторить отдельно
+                answer = {"results": [dict(answer_for(text), id=int(number)) for number, text in lines if number != '2']}
+                answer["results"][1]["items"][0].update(proteins=0, fats=0, carbs=0)
+            else:
+                calls.append('single')
+                answer = answer_for(re.search(r"Сообщение: '(.+?)'", content).group(1))
+            content = json.dumps(answer, ensure_ascii=False)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        texts = ["гречка 150г", "творог 200г", "банан 120г", "рис 180г"]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(os.path.join(tmp_dir, "test.db"), llm_client=LLMClient(client=fake),
+                                     parse_batch_window=0.05)
+
+            async def run():
+                return await asyncio.gather(*(counter.parse_with_groq(text) for text in texts))
+
+            results = asyncio.run(run())
+            stats = counter.parse_batcher.get_stats()
+            cached = asyncio.run(counter.parse_with_groq("творог 200г"))
+
+        if sorted(calls) != ['batch', 'single', 'single']:
+            print(f"   [ERROR] Ожидался 1 пакетный и 2 отдельных запроса, отправлено: {calls}")
+            return False
+        if [result['calories'] for result in results] != [150, 200, 120, 180]:
+            print(f"   [ERROR] Результаты достались не тем запросам: {results}")
+            return False
+        if stats['batches'] != 1 or stats['batched'] != 4 or stats['fallbacks'] != 2:
+            print(f"   [ERROR] Неверные счетчики: {stats}")
+            return False
+        if len(calls) != 3 or not cached or cached['calories'] != 200:
+            print("   [ERROR] Повторный разбор не взят из кэша")
+            return False
+        print("   [OK] 4 сообщения - 1 пакетный запрос, потерянный и пустой ответы повторены отдельно")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в пакетном разборе: {e}")
+        return False
+
+def test_llm_budget():
+    """Проверка дневного бюджета LLM по пользователям"""
+    print("\n25. Проверка бюджета LLM...")
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from llm_budget import LLMBudget
+        from llm_client import LLMClient
+        from calorie_counter import CalorieCounter, OVER_BUDGET_MESSAGE
+
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs['messages'][-1]['content'])
+            content = json.dumps({"is_food": True, "items": [
+                {"name": "плов с бараниной", "amount": 300, "unit": "г", "calories": 540,
+                 "proteins": 21, "fats": 27, "carbs": 54, "source": "USDA"}
+            ]})
+            usage = SimpleNamespace(prompt_tokens=400, completion_tokens=100)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=usage)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "test.db")
+            budget = LLMBudget(db_path, user_requests=2, user_tokens=0, total_requests=3, total_tokens=0)
+            counter = CalorieCounter(db_path, llm_client=LLMClient(client=fake, budget=budget))
+
+            async def run():
+                first = await counter.parse_with_groq("плов с бараниной 300г", user_id=1)
+                await counter.parse_with_groq("плов с бараниной 200г", user_id=1)
+                over = await counter.add_meal_from_text(1, "тюря по-деревенски 250г")
+                cached = await counter.parse_with_groq("плов с бараниной 300г", user_id=1)
+                other = await counter.parse_with_groq("плов с бараниной 100г", user_id=2)
+                total_over = await counter.parse_with_groq("плов с бараниной 150г", user_id=3)
+                return first, over, cached, other, total_over
+
+            first, over, cached, other, total_over = asyncio.run(run())
+            stats = budget.get_stats(days=1)
+            user_days = budget.get_user_days(1)
+
+        if len(calls) != 3:
+            print(f"   [ERROR] Ожидалось 3 запроса к LLM, отправлено {len(calls)}")
+            return False
+        if over['success'] or over['message'] != OVER_BUDGET_MESSAGE:
+            print(f"   [ERROR] Пользователь сверх бюджета не получил сообщение о лимите: {over}")
+            return False
+        if not cached or cached != first:
+            print("   [ERROR] Сверх бюджета не работает кэш разбора")
+            return False
+        if not other.get('success') or not total_over.get('over_budget'):
+            print(f"   [ERROR] Неверно работает общий бюджет: {other}, {total_over}")
+            return False
+        if stats['days'][0]['requests'] != 3 or stats['days'][0]['tokens'] != 1500 or stats['days'][0]['users'] != 2:
+            print(f"   [ERROR] Неверный расход по дням: {stats['days']}")
+            return False
+        if user_days[0]['requests'] != 2 or user_days[0]['tokens'] != 1000 or stats['users'][0]['user_id'] != 1:
+            print(f"   [ERROR] Неверный расход пользователя: {user_days}, {stats['users']}")
+            return False
+
+        # Одинаковые одновременные запросы - один вызов LLM, расход делится между всеми ожидавшими
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            db_path = os.path.join(tmp_dir, "test.db")
+            shared_budget = LLMBudget(db_path)
+            counter = CalorieCounter(db_path, llm_client=LLMClient(client=fake, budget=shared_budget))
+
+            async def shared():
+                return await asyncio.gather(*(counter.parse_with_groq("плов с бараниной 300г", user_id=user_id)
+                                              for user_id in (4, 5)))
+
+            asyncio.run(shared())
+            shares = {row['user_id']: row['requests'] for row in shared_budget.get_stats(days=1)['users']}
+        if shares != {4: 0.5, 5: 0.5}:
+            print(f"   [ERROR] Объединенный запрос учтен не за всех ожидавших: {shares}")
+            return False
+        print(f"   [OK] Сверх бюджета - только кэш и локальный разбор, отказов: {budget.rejected}")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка в бюджете LLM: {e}")
+        return False
+
+def test_json_repair():
+    """Проверка восстановления продуктов из обрезанного или испорченного ответа LLM"""
+    print("\n26. Проверка восстановления испорченного JSON...")
+    try:
+        import asyncio
+        import tempfile
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from calorie_counter import CalorieCounter
+        from food_stream import parse_food_response
+
+        pilaf = ('{"name": "плов с бараниной", "amount": 300, "unit": "г", "calories": 540, '
+                 '"proteins": 21, "fats": 27, "carbs": 54, "source": "USDA"}')
+        bread = ('{"name": "лепешка тандырная", "amount": 1, "unit": "шт", "calories": 260, '
+                 '"proteins": 8, "fats": 3, "carbs": 50, "source": "USDA"}')
+        cases = [
+            ('{"is_food": true, "items": [' + pilaf + ', ' + bread + ']}', 2, True),
+            ('{"is_food": true, "items": [' + pilaf + ', ' + bread + ',]}', 2, True),
+            ('Вот ответ: {"is_food": True, "items": [' + pilaf + ']} - значения примерные', 1, True),
+            ('{"is_food": true, "items": [' + pilaf + ', {"name": "лепешка", "amount": 1, "uni', 1, False),
+            ('{"is_food": true, "items": [{"name": "хлеб", "calories": много}, ' + bread + ']}', 1, False),
+        ]
+        for text, count, complete in cases:
+            is_food, items, whole = parse_food_response(text)
+            if not is_food or len(items) != count or whole != complete:
+                print(f"   [ERROR] Неверно разобран ответ {text[:60]}...: {items}, целиком {whole}")
+                return False
+        if parse_food_response('{"is_food": false, "items": [')[:2] != (False, []):
+            print("   [ERROR] Обрезанный ответ 'не еда' не распознан")
+            return False
+        # Литералы Python правятся только вне строк
+        yogurt = ('{"is_food": True, "items": [{"name": "None fat yogurt", "amount": 150, "unit": "г", '
+                  '"calories": 90, "proteins": 15, "fats": 0, "carbs": 7, "source": None},]}')
+        is_food, items, _ = parse_food_response(yogurt)
+        if not is_food or len(items) != 1 or items[0]['name'] != "None fat yogurt":
+            print(f"   [ERROR] Исправление литералов испортило строку: {items}")
+            return False
+
+        truncated = '{"is_food": true, "items": [' + pilaf + ', ' + bread[:40]
+        calls = []
+
+        async def create(**kwargs):
+            calls.append(kwargs)
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=truncated))], usage=None)
+
+        fake = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(os.path.join(tmp_dir, "test.db"), llm_client=LLMClient(client=fake))
+            result = asyncio.run(counter.parse_with_groq("плов с бараниной и лепешка"))
+            asyncio.run(counter.parse_with_groq("плов с бараниной и лепешка"))
+
+        if not result or result['calories'] != 540 or len(calls) != 2:
+            print(f"   [ERROR] Частичный ответ не разобран или попал в кэш: {result}, запросов {len(calls)}")
+            return False
+        print("   [OK] Из обрезанных и испорченных ответов восстанавливаются все целые продукты")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка восстановления JSON: {e}")
+        return False
+
+def test_llm_providers():
+    """Проверка провайдеров LLM: маршрут по классу запроса, запасной провайдер, заглушка"""
+    print("\n27. Проверка провайдеров LLM...")
+    try:
+        import asyncio
+        import json
+        import tempfile
+        from types import SimpleNamespace
+        from llm_client import LLMClient
+        from llm_providers import GROQ, LOCAL, STUB, LLMProvider, StubClient, stub_provider
+        from calorie_counter import CalorieCounter
+
+        groq_calls = []
+
+        async def create(**kwargs):
+            groq_calls.append(kwargs['messages'][-1]['content'])
+            content = json.dumps({"is_food": True, "items": [
+                {"name": "плов с бараниной", "amount": 300, "unit": "г", "calories": 540,
+                 "proteins": 21, "fats": 27, "carbs": 54, "source": "USDA"}
+            ]})
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))], usage=None)
+
+        def broken(params):
+            raise ConnectionError("локальный сервер не отвечает")
+
+        groq = LLMProvider(GROQ, SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create))))
+        stub = stub_provider()
+        local = LLMProvider(LOCAL, StubClient(broken), models=['local'])
+        client = LLMClient(providers={GROQ: groq, STUB: stub, LOCAL: local}, default_provider=GROQ,
+                           routes={'classify': STUB, 'parse': STUB, 'barcode': LOCAL})
+        messages = [{"role": "user", "content": "Продукт со штрих-кодом 4600000000001"}]
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            counter = CalorieCounter(os.path.join(tmp_dir, "test.db"), llm_client=client)
+
+            async def run():
+                is_food = await counter.is_food_related("привет")
+                parsed = await counter.parse_with_groq("тюря по-деревенски 250г")
+                barcode = await client.complete_first(messages, request_class='barcode')
+                motivation = await client.complete_first(messages, request_class='motivation')
+                return is_food, parsed, barcode, motivation
+
+            is_food, parsed, barcode, motivation = asyncio.run(run())
+
+        if is_food or len(stub.client.calls) != 2:
+            print(f"   [ERROR] Проверка на еду и разбор не ушли в заглушку: {len(stub.client.calls)} запросов")
+            return False
+        if not parsed or parsed['calories'] != 250 or parsed['items'][0]['amount'] != 250:
+            print(f"   [ERROR] Неверный ответ заглушки на разбор: {parsed}")
+            return False
+        if barcode['provider'] != GROQ or len(local.client.calls) != 1:
+            print(f"   [ERROR] При ошибке своего сервера нет перехода на провайдера по умолчанию: {barcode}")
+            return False
+        if motivation['provider'] != GROQ or len(groq_calls) != 2:
+            print(f"   [ERROR] Класс без маршрута ушел не к провайдеру по умолчанию: {motivation}")
+            return False
+        print("   [OK] Запросы идут к провайдеру своего класса, при ошибке - к провайдеру по умолчанию")
+        return True
+    except Exception as e:
+        print(f"   [ERROR] Ошибка провайдеров LLM: {e}")
+        return False
+
 def test_bot_connection():
     """Проверка подключения к Telegram"""
-    print("\n4. Проверка подключения к Telegram...")
+    print("\n28. Проверка подключения к Telegram...")
     try:
         from aiogram import Bot
         token = os.getenv("BOT_TOKEN")
@@ -107,6 +1409,30 @@ def main():
     results.append(("Импорты", test_imports()))
     results.append(("Переменные окружения", test_env()))
     results.append(("База данных", test_database()))
+    results.append(("Продукты приема пищи", test_meal_items()))
+    results.append(("Поиск по истории", test_meal_search()))
+    results.append(("Рецепты", test_recipes()))
+    results.append(("Графики", test_charts()))
+    results.append(("Выгрузка данных", test_export()))
+    results.append(("Аналитика тренировок", test_analytics()))
+    results.append(("Асинхронный LLM клиент", test_llm_client()))
+    results.append(("Кэш разбора еды", test_parse_cache()))
+    results.append(("База продуктов", test_product_kb()))
+    results.append(("Таблица КБЖУ", test_nutrition_table()))
+    results.append(("Исправление опечаток", test_fuzzy_index()))
+    results.append(("Роутер моделей", test_model_router()))
+    results.append(("Разбор одним запросом", test_structured_parse()))
+    results.append(("Реестр промптов", test_prompts()))
+    results.append(("Объединение запросов", test_single_flight()))
+    results.append(("Ограничитель запросов", test_llm_limiter()))
+    results.append(("Потоковый разбор", test_streaming_parse()))
+    results.append(("Пул мотивации", test_motivation_pool()))
+    results.append(("Персональная мотивация", test_personal_motivation()))
+    results.append(("Классификатор сообщений", test_food_classifier()))
+    results.append(("Пакетный разбор", test_parse_batching()))
+    results.append(("Бюджет LLM", test_llm_budget()))
+    results.append(("Восстановление JSON", test_json_repair()))
+    results.append(("Провайдеры LLM", test_llm_providers()))
     results.append(("Подключение к Telegram", test_bot_connection()))
     
     print("\n" + "=" * 50)